@@ -1,5 +1,5 @@
 from langgraph.graph import StateGraph, START, END
-from app.nodes.query_processor import store_query
+from app.nodes.query_processor import prepare_query, store_query
 from app.nodes.context_retriever import retrieve_context
 from app.nodes.search_node import search_web
 from app.nodes.response_generator import generate_final_response
@@ -8,21 +8,34 @@ from typing_extensions import TypedDict, Annotated
 from langchain_core.messages import BaseMessage
 from app.models.state import State
 
+# Nodes run in parallel once the query is prepared
+CONTEXT_NODES = ["store_query", "retrieve_context", "search_web"]
+
+def add_context_nodes(graph):
+    """Add the nodes that prepare the query, then store it, retrieve context and search the web"""
+    graph.add_node("prepare_query", prepare_query)
+    graph.add_node("store_query", store_query)
+    graph.add_node("retrieve_context", retrieve_context)
+    graph.add_node("search_web", search_web)
+
+    # Storing, retrieval and web search are independent, so they run in parallel
+    # after the query is prepared
+    graph.add_edge(START, "prepare_query")
+    for node in CONTEXT_NODES:
+        graph.add_edge("prepare_query", node)
+
 # Create graph
 graph = StateGraph(State)
-
-# Add nodes
-graph.add_node("store_query", store_query)
-graph.add_node("retrieve_context", retrieve_context)
-graph.add_node("search_web", search_web)
+add_context_nodes(graph)
 graph.add_node("generate_response", generate_final_response)
-
-# Define edges
-graph.add_edge(START, "store_query")
-graph.add_edge("store_query", "retrieve_context")
-graph.add_edge("retrieve_context", "search_web")
-graph.add_edge("search_web", "generate_response")
+graph.add_edge(CONTEXT_NODES, "generate_response")
 graph.add_edge("generate_response", END)
 
 graph_app = graph.compile()
 
+# Same steps without generating the response, for callers that stream it themselves
+context_graph = StateGraph(State)
+add_context_nodes(context_graph)
+context_graph.add_edge(CONTEXT_NODES, END)
+
+context_graph_app = context_graph.compile()
@@ -7,6 +7,7 @@ class State(TypedDict):
     messages: List[BaseMessage]
     session_id: Optional[str]
     query_id: Optional[str]
+    query_embedding: Optional[List[float]]
     similar_contexts: Optional[List[Dict[str, Any]]]
     search_results: Optional[List[Dict[str, Any]]]
     timestamp: Optional[str]
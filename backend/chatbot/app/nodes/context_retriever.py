@@ -1,6 +1,6 @@
-from app.tools.vector_db import retrieve_similar_contexts
+from app.tools.vector_db import aretrieve_similar_contexts
 
-def retrieve_context(state):
+async def retrieve_context(state):
     """Retrieve similar contexts"""
     if not isinstance(state.get("messages"), list):
         if isinstance(state.get("messages"), str):
@@ -11,5 +11,5 @@ def retrieve_context(state):
         last_message = state["messages"][-1]
         query = last_message.content if hasattr(last_message, "content") else str(last_message)
 
-    similar_contexts = retrieve_similar_contexts(query)
-    return {**state, "similar_contexts": similar_contexts}
\ No newline at end of file
+    similar_contexts = await aretrieve_similar_contexts(query, embedding=state.get("query_embedding"))
+    return {"similar_contexts": similar_contexts}
\ No newline at end of file
@@ -1,25 +1,35 @@
 import uuid
 from langchain_core.messages import HumanMessage
-from app.tools.vector_db import store_query_in_vector_db
+from app.tools.vector_db import aembed_query, astore_query_in_vector_db
 
-def store_query(state):
-    """Store the query in vector DB"""
+async def prepare_query(state):
+    """Turn the query into messages and embed it once for the steps that follow"""
     if not isinstance(state.get("messages"), list):
         if isinstance(state.get("messages"), str):
             query = state["messages"]
-            state = {**state, "messages": [HumanMessage(content=query)]}
         else:
             query = ""
-            state = {**state, "messages": [HumanMessage(content=query)]}
+        messages = [HumanMessage(content=query)]
     else:
-        last_message = state["messages"][-1]
+        messages = state["messages"]
+        last_message = messages[-1]
         query = last_message.content if hasattr(last_message, "content") else str(last_message)
 
-    session_id = state.get("session_id", str(uuid.uuid4()))
+    session_id = state.get("session_id") or str(uuid.uuid4())
+    query_embedding = state.get("query_embedding") or await aembed_query(query)
+
+    return {"messages": messages, "session_id": session_id, "query_embedding": query_embedding}
+
+async def store_query(state):
+    """Store the query in vector DB"""
+    last_message = state["messages"][-1]
+    query = last_message.content if hasattr(last_message, "content") else str(last_message)
 
-    query_id = store_query_in_vector_db(
+    query_id = await astore_query_in_vector_db(
         query=query,
-        metadata={"session_id": session_id, "initial_query": True}
+        metadata={"session_id": state.get("session_id"), "initial_query": True},
+        embedding=state.get("query_embedding")
     )
 
-    return {**state, "session_id": session_id, "query_id": query_id}
\ No newline at end of file
+    # Runs alongside retrieval and search, so only update this node's own key
+    return {"query_id": query_id}
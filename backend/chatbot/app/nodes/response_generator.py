@@ -1,9 +1,26 @@
 import datetime
 from langchain_core.messages import AIMessage
 from app.tools.llm import generate_response
-from app.tools.vector_db import store_query_in_vector_db
+from app.tools.vector_db import astore_query_in_vector_db
 
-def generate_final_response(state):
+async def store_final_response(state, query, response):
+    """Store the final response to the query in vector DB"""
+    return await astore_query_in_vector_db(
+        query=query,
+        response=response,
+        metadata={
+            "session_id": state.get("session_id"),
+            "similar_contexts": [ctx.get("metadata", {}).get("uuid") for ctx in state.get("similar_contexts") or []],
+            "search_results": state.get("search_results", []),
+            "final_response": True,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "response_type": "final",
+            "query_vector_id": state.get("query_id")
+        },
+        embedding=state.get("query_embedding")
+    )
+
+async def generate_final_response(state):
     """Generate final response"""
     if isinstance(state.get("messages"), list) and len(state["messages"]) > 0:
         last_message = state["messages"][-1]
@@ -12,23 +29,10 @@ def generate_final_response(state):
         query = ""
 
     similar_contexts = state.get("similar_contexts", [])
-    search_results = state.get("search_results", [])
 
-    response = generate_response(query, contexts=similar_contexts)
+    response = await generate_response(query, contexts=similar_contexts)
 
-    store_query_in_vector_db(
-        query=query,
-        response=response,
-        metadata={
-            "session_id": state.get("session_id"),
-            "similar_contexts": [ctx.get("metadata", {}).get("uuid") for ctx in similar_contexts],
-            "search_results": search_results,
-            "final_response": True,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "response_type": "final",
-            "query_vector_id": state.get("query_id")
-        }
-    )
+    await store_final_response(state, query, response)
 
     new_message = AIMessage(content=response)
-    return {"messages": state["messages"] + [new_message]}
\ No newline at end of file
+    return {"messages": state["messages"] + [new_message]}
@@ -1,14 +1,27 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uvicorn
 import uuid
+import json
 import traceback
-from app.graph import graph_app
-from app.tools.vector_db import store_query_in_vector_db
+from contextlib import asynccontextmanager
+from app.graph import graph_app, context_graph_app
+from app.nodes.response_generator import store_final_response
+from app.tools.llm import LLMError, close_http_client, stream_response
+from app.tools.vector_db import aembed_query, astore_query_in_vector_db, warm_up
 
-app = FastAPI(title="LangGraph Query API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model and connect to the vector DB once, before serving queries
+    warm_up()
+    yield
+    await close_http_client()
+
+app = FastAPI(title="LangGraph Query API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -35,15 +48,19 @@ async def process_query(request: QueryRequest):
         # Generate session_id if not provided
         session_id = request.session_id or str(uuid.uuid4())
 
+        # Embed the query once for every store and search of this request
+        query_embedding = await aembed_query(request.query)
+
         # Store the initial query
         query_id = None
         try:
-            query_id = store_query_in_vector_db(
+            query_id = await astore_query_in_vector_db(
                 query=request.query,
                 metadata={
                     "session_id": session_id,
                     "initial_query": True
-                }
+                },
+                embedding=query_embedding
             )
             print(f"Stored initial query in vector DB with ID: {query_id}")
         except Exception as store_error:
@@ -54,11 +71,12 @@ async def process_query(request: QueryRequest):
         initial_state = {
             "messages": request.query,
             "session_id": session_id,
-            "query_id": query_id
+            "query_id": query_id,
+            "query_embedding": query_embedding
         }
 
         # Run the graph
-        result = graph_app.invoke(initial_state)
+        result = await graph_app.ainvoke(initial_state)
 
         # Extract response from the last message
         if result.get("messages") and len(result["messages"]) > 0:
@@ -68,7 +86,7 @@ async def process_query(request: QueryRequest):
 
         # Store the final response
         try:
-            response_id = store_query_in_vector_db(
+            response_id = await astore_query_in_vector_db(
                 query=request.query,
                 response=response_text,
                 metadata={
@@ -78,7 +96,8 @@ async def process_query(request: QueryRequest):
                     "final_response": True,
                     "response_type": "final",
                     "query_vector_id": query_id
-                }
+                },
+                embedding=query_embedding
             )
             print(f"Stored final response in vector DB with ID: {response_id}")
         except Exception as store_error:
@@ -96,6 +115,65 @@ async def process_query(request: QueryRequest):
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+def sse_event(data, event=None):
+    """Format data as a server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/api/query/stream")
+async def stream_query(request: QueryRequest):
+    """Stream the response as server-sent events: a "context" event, one "token" event per
+    piece of text as DeepSeek generates it, then "done", or "error" if generation fails.
+    Only a complete response is stored."""
+    session_id = request.session_id or str(uuid.uuid4())
+    try:
+        # Store the query, retrieve similar contexts and search the web before generating
+        state = await context_graph_app.ainvoke({"messages": request.query, "session_id": session_id})
+    except Exception as e:
+        print(f"Error processing query: {e}")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+
+    chunks = []
+    completed = False
+
+    async def events():
+        nonlocal completed
+        yield sse_event({
+            "session_id": session_id,
+            "similar_contexts": state.get("similar_contexts"),
+            "search_results": state.get("search_results")
+        }, event="context")
+        try:
+            async for chunk in stream_response(request.query, contexts=state.get("similar_contexts", [])):
+                chunks.append(chunk)
+                yield sse_event({"content": chunk}, event="token")
+        except LLMError as e:
+            print(e)
+            yield sse_event({"error": "I'm sorry, I couldn't generate a response at this time."}, event="error")
+            return
+        completed = True
+        yield sse_event({"session_id": session_id}, event="done")
+
+    async def store_response():
+        # Runs after the stream ends; a failed response, or one cut short by a disconnected
+        # client, isn't stored
+        if not completed:
+            return
+        try:
+            response_id = await store_final_response(state, request.query, "".join(chunks))
+            print(f"Stored final response in vector DB with ID: {response_id}")
+        except Exception as store_error:
+            print(f"Error storing final response: {store_error}")
+            print(traceback.format_exc())
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(store_response)
+    )
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
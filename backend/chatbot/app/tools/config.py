@@ -8,4 +8,8 @@ CONNECTION_POSTGRES = os.getenv("CONNECTION_POSTGRES")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL")
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
\ No newline at end of file
+DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+VECTOR_DB_POOL_SIZE = int(os.getenv("VECTOR_DB_POOL_SIZE", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
\ No newline at end of file
@@ -1,36 +1,47 @@
-import requests
+import json
+import httpx
+from functools import lru_cache
 from typing import List, Dict
-from app.tools.config import DEEPSEEK_API_URL, DEEPSEEK_API_KEY
+from app.tools.config import DEEPSEEK_API_URL, DEEPSEEK_API_KEY, LLM_TIMEOUT, LLM_MAX_CONNECTIONS
 
-def generate_response(query: str, contexts: List[Dict] = None):
+@lru_cache(maxsize=None)
+def get_http_client():
+    """Return the process-wide async HTTP client, which keeps connections to the API open between requests"""
+    return httpx.AsyncClient(
+        base_url=DEEPSEEK_API_URL or "",
+        headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}"},
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=5.0),
+        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+    )
+
+async def close_http_client():
+    """Close the shared HTTP client and its connections"""
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+        get_http_client.cache_clear()
+
+def build_payload(query: str, contexts: List[Dict] = None):
+    """Build the chat completion request for a query and its similar contexts"""
+    context_text = ""
+    if contexts and len(contexts) > 0:
+        context_text = "Based on previous similar queries:\n"
+        for i, ctx in enumerate(contexts):
+            context_text += f"{i+1}. Query: {ctx.get('metadata', {}).get('query', 'Unknown')}\n"
+            context_text += f"   Response: {ctx.get('metadata', {}).get('document', 'No response')}\n\n"
+
+    return {
+        "model": "deepseek-chat",
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": f"{context_text}\nUser query: {query}\nPlease provide a helpful response."}
+        ],
+        "temperature": 0.7
+    }
+
+async def generate_response(query: str, contexts: List[Dict] = None):
     """Generate response using DeepSeek API"""
     try:
-        context_text = ""
-        if contexts and len(contexts) > 0:
-            context_text = "Based on previous similar queries:\n"
-            for i, ctx in enumerate(contexts):
-                context_text += f"{i+1}. Query: {ctx.get('metadata', {}).get('query', 'Unknown')}\n"
-                context_text += f"   Response: {ctx.get('metadata', {}).get('document', 'No response')}\n\n"
-
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": f"{context_text}\nUser query: {query}\nPlease provide a helpful response."}
-            ],
-            "temperature": 0.7
-        }
-
-        response = requests.post(
-            f"{DEEPSEEK_API_URL}/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
+        response = await get_http_client().post("/v1/chat/completions", json=build_payload(query, contexts))
 
         if response.status_code == 200:
             result = response.json()
@@ -40,4 +51,33 @@ def generate_response(query: str, contexts: List[Dict] = None):
             return "I'm sorry, I couldn't generate a response at this time."
     except Exception as e:
         print(f"Error generating response: {e}")
-        return "I'm sorry, I encountered an error while generating a response."
\ No newline at end of file
+        return "I'm sorry, I encountered an error while generating a response."
+
+class LLMError(Exception):
+    """DeepSeek API failed to generate a complete response"""
+
+async def stream_response(query: str, contexts: List[Dict] = None):
+    """Stream the response from DeepSeek API, yielding each piece of text as it arrives
+
+    Raises LLMError if the API returns an error or the stream ends before "[DONE]", so
+    callers can tell a partial or failed response from a complete one.
+    """
+    try:
+        payload = {**build_payload(query, contexts), "stream": True}
+        async with get_http_client().stream("POST", "/v1/chat/completions", json=payload) as response:
+            if response.status_code != 200:
+                raise LLMError(f"Error from DeepSeek API: {(await response.aread()).decode(errors='replace')}")
+
+            # Server-sent events: "data: {chunk}" lines, ending with "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                content = json.loads(data)["choices"][0]["delta"].get("content")
+                if content:
+                    yield content
+        raise LLMError("DeepSeek API stream ended before [DONE]")
+    except (httpx.HTTPError, ValueError, KeyError, IndexError) as e:
+        raise LLMError(f"Error streaming response: {e}") from e
@@ -1,16 +1,61 @@
+import asyncio
 import datetime
 import uuid
+from functools import lru_cache
 from typing import Dict, Any, List
 
 # Use the older PGVector implementation
 from langchain.vectorstores.pgvector import PGVector
 from langchain_huggingface import HuggingFaceEmbeddings
-from .config import CONNECTION_POSTGRES, COLLECTION_NAME
+from .config import CONNECTION_POSTGRES, COLLECTION_NAME, EMBEDDING_MODEL, VECTOR_DB_POOL_SIZE
 
 
-def store_query_in_vector_db(query: str, response: str = None, metadata: Dict[str, Any] = None):
-    """Store user query and response in vector database with metadata"""
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+@lru_cache(maxsize=None)
+def get_embeddings():
+    """Return the process-wide embedding model, loading it on first use"""
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+
+@lru_cache(maxsize=None)
+def get_vector_store(collection_name: str = COLLECTION_NAME):
+    """Return the process-wide vector store of a collection, whose engine keeps a pool of database connections"""
+    # Use the older PGVector implementation
+    return PGVector(
+        connection_string=CONNECTION_POSTGRES,
+        collection_name=collection_name,
+        embedding_function=get_embeddings(),  # Use embedding_function for older version
+        engine_args={"pool_size": VECTOR_DB_POOL_SIZE, "pool_pre_ping": True}
+    )
+
+
+def warm_up():
+    """Load the embedding model and open the vector store before the first query"""
+    # Failures are logged rather than raised, so the service still starts and queries take
+    # the same path as when embedding fails later: embed_query returns None
+    try:
+        get_embeddings().embed_query("warm up")
+        print("Embedding model ready")
+    except Exception as e:
+        print(f"Error loading embedding model: {e}")
+    try:
+        get_vector_store()
+        print("Vector DB ready")
+    except Exception as e:
+        print(f"Error connecting to vector DB: {e}")
+
+
+def embed_query(query: str):
+    """Embed a query with the shared embedding model, or return None if that fails"""
+    try:
+        return get_embeddings().embed_query(query)
+    except Exception as e:
+        print(f"Error embedding query: {e}")
+        return None
+
+
+def store_query_in_vector_db(query: str, response: str = None, metadata: Dict[str, Any] = None,
+                             embedding: List[float] = None):
+    """Store user query and response in vector database with metadata, reusing the query's embedding if given"""
     item_id = str(uuid.uuid4())
 
     if metadata is None:
@@ -22,19 +67,22 @@ def store_query_in_vector_db(query: str, response: str = None, metadata: Dict[st
     text_to_embed = response if response and metadata.get("is_response") else query
 
     try:
-        # Use the older PGVector implementation
-        vector_store = PGVector(
-            connection_string=CONNECTION_POSTGRES,
-            collection_name=COLLECTION_NAME,
-            embedding_function=embeddings  # Use embedding_function for older version
-        )
+        vector_store = get_vector_store()
 
         # Add texts with metadata
-        vector_store.add_texts(
-            texts=[text_to_embed],
-            metadatas=[metadata],
-            ids=[item_id]
-        )
+        if embedding is not None and text_to_embed == query:
+            vector_store.add_embeddings(
+                texts=[text_to_embed],
+                embeddings=[embedding],
+                metadatas=[metadata],
+                ids=[item_id]
+            )
+        else:
+            vector_store.add_texts(
+                texts=[text_to_embed],
+                metadatas=[metadata],
+                ids=[item_id]
+            )
 
         print(f"Successfully stored in vector DB with ID: {item_id}")
         return item_id
@@ -42,19 +90,15 @@ def store_query_in_vector_db(query: str, response: str = None, metadata: Dict[st
         print(f"Error storing in vector DB: {e}")
         return None
 
-def retrieve_similar_contexts(query: str, top_k: int = 3):
-    """Retrieve similar contexts from vector database"""
+def retrieve_similar_contexts(query: str, top_k: int = 3, embedding: List[float] = None):
+    """Retrieve similar contexts from vector database, searching by the query's embedding if given"""
     try:
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        vector_store = get_vector_store()
 
-        # Use the older PGVector implementation
-        vector_store = PGVector(
-            connection_string=CONNECTION_POSTGRES,
-            collection_name=COLLECTION_NAME,
-            embedding_function=embeddings  # Use embedding_function for older version
-        )
-
-        results = vector_store.similarity_search_with_score(query, k=top_k)
+        if embedding is not None:
+            results = vector_store.similarity_search_with_score_by_vector(embedding, k=top_k)
+        else:
+            results = vector_store.similarity_search_with_score(query, k=top_k)
 
         contexts = []
         for doc, score in results:
@@ -67,4 +111,20 @@ def retrieve_similar_contexts(query: str, top_k: int = 3):
         return contexts
     except Exception as e:
         print(f"Error retrieving similar contexts: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+# The PGVector store and the embedding model are blocking, so the async service runs
+# them in worker threads instead of on the event loop
+async def aembed_query(query: str):
+    """embed_query in a worker thread"""
+    return await asyncio.to_thread(embed_query, query)
+
+async def astore_query_in_vector_db(query: str, response: str = None, metadata: Dict[str, Any] = None,
+                                    embedding: List[float] = None):
+    """store_query_in_vector_db in a worker thread"""
+    return await asyncio.to_thread(store_query_in_vector_db, query, response, metadata, embedding)
+
+async def aretrieve_similar_contexts(query: str, top_k: int = 3, embedding: List[float] = None):
+    """retrieve_similar_contexts in a worker thread"""
+    return await asyncio.to_thread(retrieve_similar_contexts, query, top_k, embedding)
@@ -0,0 +1,85 @@
+"""Time to first token and total latency of /api/query/stream against /api/query
+
+Usage: python benchmarks/stream_latency.py [--url http://localhost:8000] [--requests 10]
+
+Each request sends one of a few travel questions to both endpoints of a running chatbot
+service. For the stream, time to first token is when the first "token" event arrives;
+for /api/query it is when the whole response arrives, since nothing is shown before.
+"""
+import argparse
+import json
+import time
+
+import httpx
+import numpy as np
+
+QUERIES = [
+    "Cheapest flights from Bangkok to Tokyo in December",
+    "Do I need a visa to fly to Singapore?",
+    "Which airlines allow extra baggage on short trips?",
+    "Best time of year to visit Chiang Mai",
+    "Can I change my seat after booking?"
+]
+
+
+def time_stream(client, url, query):
+    """Return (seconds to first token, seconds to the "done" event) of one streamed query"""
+    start = time.perf_counter()
+    first_token = None
+    event = None
+    with client.stream("POST", f"{url}/api/query/stream", json={"query": query}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:") and event == "token" and first_token is None:
+                first_token = time.perf_counter() - start
+            elif line.startswith("data:") and event == "done":
+                break
+    return first_token, time.perf_counter() - start
+
+
+def time_query(client, url, query):
+    """Return seconds until /api/query returns the complete response"""
+    start = time.perf_counter()
+    response = client.post(f"{url}/api/query", json={"query": query})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def summarize(seconds):
+    values = np.array([value for value in seconds if value is not None]) * 1000
+    return f"{np.percentile(values, 50):>10.0f}{np.percentile(values, 99):>10.0f}" if len(values) else f"{'-':>10}{'-':>10}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--requests', type=int, default=10, help="queries to send to each endpoint")
+    parser.add_argument('--timeout', type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument('--json', action='store_true', help="print results as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    url = args.url.rstrip('/')
+    streamed, complete = [], []
+    with httpx.Client(timeout=args.timeout) as client:
+        for i in range(args.requests):
+            query = QUERIES[i % len(QUERIES)]
+            streamed.append(time_stream(client, url, query))
+            complete.append(time_query(client, url, query))
+
+    report = {
+        'stream': {'first_token_s': [first for first, _ in streamed], 'total_s': [total for _, total in streamed]},
+        'query': {'first_token_s': complete, 'total_s': complete}
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'endpoint':<18}{'TTFT p50':>10}{'TTFT p99':>10}{'total p50':>10}{'total p99':>10}  (ms)")
+    for name, path in [('stream', '/api/query/stream'), ('query', '/api/query')]:
+        print(f"{path:<18}{summarize(report[name]['first_token_s'])}{summarize(report[name]['total_s'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Per-query latency of the vector DB with per-call versus shared embedding model and store
+
+Usage: python benchmarks/vector_db_latency.py [--queries 50] [--collection chatbot_benchmark] [--drop]
+
+Each query is stored and then searched for, as /api/query does. "per_call" builds a new
+HuggingFaceEmbeddings and PGVector for every call, as the tools used to; "shared" reuses
+the process-wide ones from app.tools.vector_db. Rows go to a separate collection, never
+the service's COLLECTION_NAME, and the rows the benchmark added are deleted at the end;
+--drop deletes the whole collection instead. Needs CONNECTION_POSTGRES, read from .env
+like the service.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain.vectorstores.pgvector import PGVector
+from langchain_huggingface import HuggingFaceEmbeddings
+from app.tools.config import COLLECTION_NAME, CONNECTION_POSTGRES, EMBEDDING_MODEL
+from app.tools.vector_db import get_vector_store
+
+QUERIES = [
+    "Cheapest flights from Bangkok to Tokyo in December",
+    "Do I need a visa to fly to Singapore?",
+    "Which airlines allow extra baggage on short trips?",
+    "Best time of year to visit Chiang Mai",
+    "Can I change my seat after booking?"
+]
+
+
+def per_call_store(collection):
+    """Build the embedding model and vector store from scratch, as each call used to"""
+    return PGVector(
+        connection_string=CONNECTION_POSTGRES,
+        collection_name=collection,
+        embedding_function=HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    )
+
+
+def run(make_store, n_queries, ids):
+    """Store and search n_queries queries, returning per-query latencies in ms and adding the stored ids to ids"""
+    latencies = []
+    for i in range(n_queries):
+        query = QUERIES[i % len(QUERIES)]
+        start = time.perf_counter()
+        ids.extend(make_store().add_texts(texts=[query], metadatas=[{"benchmark": True}]))
+        make_store().similarity_search_with_score(query, k=3)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=50, help="queries to store and search per mode")
+    parser.add_argument('--collection', default='chatbot_benchmark', help="collection to write benchmark rows to")
+    parser.add_argument('--drop', action='store_true', help="delete the whole collection afterwards, not just the benchmark's rows")
+    args = parser.parse_args(argv)
+
+    if args.collection == COLLECTION_NAME:
+        parser.error(f"--collection must not be the service's collection {COLLECTION_NAME!r}, which holds stored chat history")
+
+    # Untimed first call, so the shared mode is measured warm as after service startup
+    start = time.perf_counter()
+    shared = get_vector_store(args.collection)
+    print(f"Shared embedding model and store ready in {time.perf_counter() - start:.2f} s")
+
+    ids = []
+    try:
+        results = {
+            'per_call': run(lambda: per_call_store(args.collection), args.queries, ids),
+            'shared': run(lambda: shared, args.queries, ids)
+        }
+    finally:
+        if args.drop:
+            shared.delete_collection()
+        elif ids:
+            shared.delete(ids=ids)
+
+    print(f"{'mode':<10}{'queries':>9}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode, latencies in results.items():
+        print(f"{mode:<10}{len(latencies):>9}{latencies.mean():>10.1f}"
+              f"{np.percentile(latencies, 50):>10.1f}{np.percentile(latencies, 99):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+import unittest
+import asyncio
+import sys
+import os
+import time
+import types
+import json
+from unittest import mock
+import httpx
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Seconds each stub tool sleeps for, standing in for the vector DB, Tavily and DeepSeek
+DELAYS = {'store': 0.2, 'retrieve': 0.3, 'search': 0.5, 'llm': 0.1}
+calls = []
+stored = []  # keyword arguments of each store call
+
+
+def stub(name, result):
+    """Return an async tool that records its call, sleeps for its delay and returns result"""
+    async def tool(*args, **kwargs):
+        calls.append(name)
+        if name == 'store':
+            stored.append(kwargs)
+        await asyncio.sleep(DELAYS[name])
+        return result
+    return tool
+
+
+async def embed_query(query):
+    return [0.1, 0.2, 0.3]
+
+
+stub_tools = {
+    'app.tools.vector_db': types.SimpleNamespace(
+        aembed_query=embed_query,
+        warm_up=lambda: None,
+        astore_query_in_vector_db=stub('store', 'stored-id'),
+        aretrieve_similar_contexts=stub('retrieve', [{'content': 'context', 'metadata': {'uuid': 'ctx'}}])
+    ),
+    'app.tools.search': types.SimpleNamespace(perform_Web_Search=stub('search', [{'url': 'https://example.com'}])),
+    'app.tools.llm': types.SimpleNamespace(generate_response=stub('llm', 'stub response'))
+}
+
+# Import the graph against the stub tools, so it runs without a database or API keys
+with mock.patch.dict(sys.modules, stub_tools):
+    from app.graph import graph_app, context_graph_app
+from app.tools import llm
+
+# The service streams through the real DeepSeek client, which tests give a mock transport
+with mock.patch.dict(sys.modules, {**stub_tools, 'app.tools.llm': llm}):
+    from app import service
+from fastapi.testclient import TestClient
+
+
+def deepseek_stream(*contents, done=True):
+    """Return a mock DeepSeek handler streaming the given contents as chat completion deltas"""
+    def handler(request):
+        lines = [f"data: {json.dumps({'choices': [{'delta': delta}]})}" for delta in
+                 [{'role': 'assistant'}] + [{'content': content} for content in contents]]
+        lines += [": keep-alive"] + (["data: [DONE]"] if done else [])
+        return httpx.Response(200, text="\n\n".join(lines) + "\n\n")
+    return handler
+
+
+def mock_deepseek(handler):
+    """Patch the shared DeepSeek client with one answered by handler"""
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://deepseek")
+    return mock.patch.object(llm, 'get_http_client', return_value=client)
+
+
+def run_query(query="Flights to Tokyo?"):
+    return asyncio.run(graph_app.ainvoke({"messages": query, "session_id": "session"}))
+
+
+class TestGraph(unittest.TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_result(self):
+        result = run_query()
+
+        self.assertEqual(result['messages'][-1].content, 'stub response')
+        self.assertEqual(result['query_id'], 'stored-id')
+        self.assertEqual(result['similar_contexts'][0]['content'], 'context')
+        self.assertEqual(result['search_results'], [{'url': 'https://example.com'}])
+        self.assertEqual(result['query_embedding'], [0.1, 0.2, 0.3])
+
+    def test_storage_retrieval_and_search_run_in_parallel(self):
+        start = time.perf_counter()
+        run_query()
+        elapsed = time.perf_counter() - start
+
+        # Store, retrieve and search overlap; the response and its storage follow them
+        parallel = max(DELAYS['store'], DELAYS['retrieve'], DELAYS['search']) + DELAYS['llm'] + DELAYS['store']
+        sequential = sum(DELAYS.values()) + DELAYS['store']
+        self.assertGreaterEqual(elapsed, parallel)
+        self.assertLess(elapsed, (parallel + sequential) / 2)
+        self.assertEqual(sorted(calls[:3]), ['retrieve', 'search', 'store'])
+        self.assertEqual(calls[3:], ['llm', 'store'])
+
+    def test_concurrent_queries_overlap(self):
+        async def run_queries(n):
+            return await asyncio.gather(*[
+                graph_app.ainvoke({"messages": f"Query {i}", "session_id": f"session-{i}"}) for i in range(n)
+            ])
+
+        start = time.perf_counter()
+        results = asyncio.run(run_queries(8))
+        elapsed = time.perf_counter() - start
+
+        # Waiting on I/O doesn't block the event loop, so 8 queries take about as long as one
+        single = max(DELAYS['store'], DELAYS['retrieve'], DELAYS['search']) + DELAYS['llm'] + DELAYS['store']
+        self.assertEqual(len(results), 8)
+        self.assertLess(elapsed, 2 * single)
+
+    def test_context_graph_stops_before_the_response(self):
+        result = asyncio.run(context_graph_app.ainvoke({"messages": "Flights to Tokyo?", "session_id": "session"}))
+
+        self.assertEqual(result['similar_contexts'][0]['content'], 'context')
+        self.assertEqual(len(result['messages']), 1)
+        self.assertNotIn('llm', calls)
+
+
+class TestStreamResponse(unittest.TestCase):
+
+    def stream(self, handler):
+        """Collect the pieces stream_response yields with DeepSeek replaced by handler"""
+        async def collect():
+            with mock_deepseek(handler):
+                return [chunk async for chunk in llm.stream_response("Flights to Tokyo?")]
+        return asyncio.run(collect())
+
+    def test_forwards_content_deltas(self):
+        requests = []
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            return deepseek_stream('Try ', 'Osaka')(request)
+
+        self.assertEqual(self.stream(handler), ['Try ', 'Osaka'])
+        self.assertTrue(requests[0]['stream'])
+
+    def test_api_error(self):
+        with self.assertRaises(llm.LLMError):
+            self.stream(lambda request: httpx.Response(500, text="unavailable"))
+
+    def test_stream_cut_short(self):
+        with self.assertRaises(llm.LLMError):
+            self.stream(deepseek_stream('Try ', done=False))
+
+
+class TestStreamEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        calls.clear()
+        stored.clear()
+
+    def post(self, handler):
+        """POST a query to /api/query/stream with DeepSeek replaced by handler, returning [(event, data), ...]"""
+        with mock_deepseek(handler):
+            response = TestClient(service.app).post("/api/query/stream", json={"query": "Flights to Tokyo?", "session_id": "session"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['content-type'].startswith('text/event-stream'))
+
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.split("\n"))
+            events.append((fields['event'], json.loads(fields['data'])))
+        return events
+
+    def final_responses(self):
+        return [kwargs for kwargs in stored if kwargs['metadata'].get('final_response')]
+
+    def test_forwards_tokens_and_stores_the_complete_response(self):
+        events = self.post(deepseek_stream('Try ', 'Osaka'))
+
+        self.assertEqual([event for event, _ in events], ['context', 'token', 'token', 'done'])
+        self.assertEqual(events[0][1]['similar_contexts'][0]['content'], 'context')
+        self.assertEqual([data['content'] for event, data in events if event == 'token'], ['Try ', 'Osaka'])
+        final = self.final_responses()
+        self.assertEqual(len(final), 1)
+        self.assertEqual(final[0]['response'], 'Try Osaka')
+        self.assertEqual(final[0]['metadata']['query_vector_id'], 'stored-id')
+
+    def test_api_error_is_not_stored(self):
+        events = self.post(lambda request: httpx.Response(500, text="unavailable"))
+
+        self.assertEqual([event for event, _ in events], ['context', 'error'])
+        self.assertEqual(self.final_responses(), [])
+        # The query itself is still stored
+        self.assertEqual(len(stored), 1)
+
+    def test_stream_cut_short_is_not_stored(self):
+        events = self.post(deepseek_stream('Try ', done=False))
+
+        self.assertEqual([event for event, _ in events], ['context', 'token', 'error'])
+        self.assertEqual(self.final_responses(), [])
+
+    def test_client_disconnect_is_not_stored(self):
+        async def disconnect():
+            with mock_deepseek(deepseek_stream('Try ', 'Osaka')):
+                response = await service.stream_query(service.QueryRequest(query="Flights to Tokyo?", session_id="session"))
+                await response.body_iterator.__anext__()  # context
+                await response.body_iterator.__anext__()  # first token
+                await response.body_iterator.aclose()
+                await response.background()
+
+        asyncio.run(disconnect())
+        self.assertEqual(self.final_responses(), [])
+
+
+class TestWarmUp(unittest.TestCase):
+    def setUp(self):
+        def fail(*args, **kwargs):
+            raise OSError("model unavailable")
+
+        # The real module against a LangChain whose embedding model and vector store can't load
+        langchain_stubs = {
+            'langchain': types.ModuleType('langchain'),
+            'langchain.vectorstores': types.ModuleType('langchain.vectorstores'),
+            'langchain.vectorstores.pgvector': types.SimpleNamespace(PGVector=fail),
+            'langchain_huggingface': types.SimpleNamespace(HuggingFaceEmbeddings=fail)
+        }
+        with mock.patch.dict(sys.modules, langchain_stubs):
+            sys.modules.pop('app.tools.vector_db', None)
+            from app.tools import vector_db
+            sys.modules.pop('app.tools.vector_db', None)
+        self.vector_db = vector_db
+
+    def test_embedding_model_failure_does_not_stop_startup(self):
+        self.vector_db.warm_up()
+        self.assertIsNone(self.vector_db.embed_query("Flights to Tokyo?"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+MANIFEST_FILENAME = "manifest.json"
+CURRENT_FILENAME = "CURRENT"
+
+
+class ArtifactStore:
+    """Versioned model artifacts: a directory per version holding a JSON manifest and .npy arrays
+
+    A CURRENT file in the root names the version to serve. New versions are written
+    to a temporary directory, renamed into place and only then published by atomically
+    replacing CURRENT, so a reader never sees a half-written artifact. Arrays are saved
+    without pickling and can be memory-mapped read-only, letting every worker process
+    share the same pages.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def current_version(self):
+        """Return the published version name, or None if nothing has been published"""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILENAME)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self):
+        """Return the version directories in the store, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isfile(os.path.join(self.root, name, MANIFEST_FILENAME))
+        )
+
+    def write(self, version, arrays, metadata, keep=2):
+        """Write a new version and publish it as CURRENT, keeping the `keep` most recent versions"""
+        os.makedirs(self.root, exist_ok=True)
+
+        name = version
+        suffix = 0
+        while os.path.exists(os.path.join(self.root, name)):
+            suffix += 1
+            name = f"{version}-{suffix}"
+
+        staging = os.path.join(self.root, f".{name}.tmp")
+        os.makedirs(staging)
+        manifest = {'version': version, 'metadata': metadata, 'arrays': {}}
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            filename = f"{key}.npy"
+            np.save(os.path.join(staging, filename), array, allow_pickle=False)
+            manifest['arrays'][key] = {'file': filename, 'dtype': str(array.dtype), 'shape': list(array.shape)}
+        with open(os.path.join(staging, MANIFEST_FILENAME), 'w') as f:
+            json.dump(manifest, f)
+        os.rename(staging, os.path.join(self.root, name))
+
+        pointer = os.path.join(self.root, f".{CURRENT_FILENAME}.tmp")
+        with open(pointer, 'w') as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(self.root, CURRENT_FILENAME))
+
+        # Processes still mapping a pruned version keep their pages until they unmap them
+        for old in self.versions()[:-keep] if keep else []:
+            if old != name:
+                shutil.rmtree(os.path.join(self.root, old), ignore_errors=True)
+        return os.path.join(self.root, name)
+
+    def read(self, version=None, mmap_mode='r'):
+        """Return (manifest, arrays) of a version, CURRENT by default, memory-mapping arrays"""
+        version = version or self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"No model artifact has been published in {self.root}")
+        return read_artifact(os.path.join(self.root, version), mmap_mode=mmap_mode)
+
+
+def read_artifact(path, mmap_mode='r'):
+    """Read (manifest, arrays) from a single version directory"""
+    with open(os.path.join(path, MANIFEST_FILENAME)) as f:
+        manifest = json.load(f)
+
+    arrays = {
+        # Empty arrays cannot be memory-mapped
+        key: np.load(os.path.join(path, spec['file']), mmap_mode=mmap_mode if all(spec['shape']) else None, allow_pickle=False)
+        for key, spec in manifest['arrays'].items()
+    }
+    return manifest, arrays
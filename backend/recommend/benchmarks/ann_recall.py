@@ -0,0 +1,107 @@
+"""Recall and latency of the approximate user index against exact cosine neighbors
+
+Usage: python benchmarks/ann_recall.py [--model recommendation_model] [--users 0] [--queries 1000]
+                                       [--lists 16,64] [--probes 1,2,4,8,16] [--neighbors 10]
+
+Neighbors are searched among the users of the model's user_item_matrix. With --users N,
+the matrix is first grown to N users by copying random real users and perturbing their
+ratings, to see how the index behaves on a population closer to real customer accounts.
+Recall@k counts the approximate neighbors at least as similar as the k-th exact one, so
+ties at the cut-off don't count as misses.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model import MODEL_DIRNAME, UserIndex, current_dir, load_model, normalize_rows, top_neighbors
+
+
+def synthesize_users(ratings, n_users, rng):
+    """Grow ratings to n_users rows: copies of random users with ratings dropped, added and jittered"""
+    extra = ratings[rng.integers(len(ratings), size=max(n_users - len(ratings), 0))].copy()
+    extra[rng.random(extra.shape) < 0.3] = 0
+    rated_values = ratings[ratings > 0]
+    added = rng.random(extra.shape) < 2 / ratings.shape[1]
+    extra[added] = rng.choice(rated_values, size=added.sum())
+    extra[extra > 0] *= rng.uniform(0.9, 1.1, size=(extra > 0).sum())
+    return np.vstack([ratings, extra])
+
+
+def exact_search(vectors, queries, n_neighbors, block_size=1024):
+    """Exact (positions, similarities) of the n_neighbors most similar users of each query position"""
+    results = []
+    for start in range(0, len(queries), block_size):
+        block = queries[start:start + block_size]
+        similarities = vectors[block] @ vectors.T
+        similarities[np.arange(len(block)), block] = -np.inf
+        results.append(top_neighbors(similarities, n_neighbors))
+    return np.vstack([positions for positions, _ in results]), np.vstack([similarities for _, similarities in results])
+
+
+def recall(similarities, exact_similarities):
+    """Fraction of approximate neighbors at least as similar as the k-th exact neighbor"""
+    return float(np.mean(similarities >= exact_similarities[:, -1:] - 1e-9))
+
+
+def per_query_ms(search, queries):
+    """Latency in milliseconds of searching one query at a time"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(np.array([query]))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.path.join(current_dir, MODEL_DIRNAME))
+    parser.add_argument('--users', type=int, default=0, help="grow the user population to this many users")
+    parser.add_argument('--queries', type=int, default=1000, help="number of users to search neighbors for")
+    parser.add_argument('--lists', default='16,64', help="comma-separated index sizes to try")
+    parser.add_argument('--probes', default='1,2,4,8,16', help="comma-separated numbers of lists to search per query")
+    parser.add_argument('--neighbors', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(42)
+    ratings = load_model(args.model).user_item_matrix.to_numpy()
+    if args.users > len(ratings):
+        ratings = synthesize_users(ratings, args.users, rng)
+    vectors = normalize_rows(ratings)
+    queries = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    latency_queries = queries[:200]
+
+    start = time.perf_counter()
+    _, exact_similarities = exact_search(vectors, queries, args.neighbors)
+    exact_batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    exact_latencies = per_query_ms(lambda query: exact_search(vectors, query, args.neighbors), latency_queries)
+
+    print(f"{len(vectors)} users x {vectors.shape[1]} destinations, {len(queries)} queries, k={args.neighbors}")
+    print(f"{'index':>12}{'probe':>7}{'build s':>9}{f'recall@{args.neighbors}':>11}{'batch ms/q':>12}{'p50 ms':>9}{'p99 ms':>9}")
+    print(f"{'exact':>12}{'-':>7}{'-':>9}{1.0:>11.4f}{exact_batch_ms:>12.4f}"
+          f"{np.percentile(exact_latencies, 50):>9.3f}{np.percentile(exact_latencies, 99):>9.3f}")
+
+    for n_lists in (int(value) for value in args.lists.split(',')):
+        start = time.perf_counter()
+        index = UserIndex(ratings, n_lists)
+        build_time = time.perf_counter() - start
+
+        for n_probe in (int(value) for value in args.probes.split(',')):
+            if n_probe > n_lists:
+                continue
+            start = time.perf_counter()
+            _, similarities = index.search(ratings[queries], args.neighbors, n_probe=n_probe, exclude=queries)
+            batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            latencies = per_query_ms(
+                lambda query: index.search(ratings[query], args.neighbors, n_probe=n_probe, exclude=query), latency_queries
+            )
+            print(f"{f'IVF{n_lists}':>12}{n_probe:>7}{build_time:>9.2f}{recall(similarities, exact_similarities):>11.4f}"
+                  f"{batch_ms:>12.4f}{np.percentile(latencies, 50):>9.3f}{np.percentile(latencies, 99):>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
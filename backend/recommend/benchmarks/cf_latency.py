@@ -0,0 +1,84 @@
+"""Per-user latency of collaborative_filtering_recommendations, before and after the NumPy fast path
+
+Usage: python benchmarks/cf_latency.py [--model recommendation_model] [--users 200]
+
+The "before" numbers come from a copy of the original pandas implementation below,
+run against the same loaded model so both paths see identical inputs.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model import MODEL_DIRNAME, current_dir, load_model
+
+
+def legacy_collaborative_filtering_recommendations(model, user_id, n_recommendations=10):
+    """The original per-neighbor pandas loop, kept here as the benchmark baseline"""
+    if user_id not in model.user_similarity.index:
+        return model.popularity_based_recommendations(n_recommendations)
+
+    similar_users = model.user_similarity[user_id].sort_values(ascending=False)[1:11]
+    user_destinations = set(model.user_item_matrix.columns[model.user_item_matrix.loc[user_id] > 0])
+
+    recommendations = {}
+    for similar_user, similarity in similar_users.items():
+        if similarity <= 0:
+            continue
+        similar_user_destinations = set(model.user_item_matrix.columns[model.user_item_matrix.loc[similar_user] > 3])
+        for destination in similar_user_destinations - user_destinations:
+            recommendations[destination] = (
+                recommendations.get(destination, 0) + similarity * model.user_item_matrix.loc[similar_user, destination]
+            )
+
+    if not recommendations:
+        return model.popularity_based_recommendations(n_recommendations)
+
+    recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
+    return [dest for dest, score in recommendations[:n_recommendations]]
+
+
+def time_per_user(recommend, user_ids):
+    """Return per-call latencies in milliseconds"""
+    latencies = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        recommend(user_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.path.join(current_dir, MODEL_DIRNAME))
+    parser.add_argument('--users', type=int, default=200, help="number of users to time")
+    args = parser.parse_args(argv)
+
+    model = load_model(args.model)
+    if model.user_similarity is None:
+        sys.exit("The legacy baseline needs a dense similarity model (trained without --neighbors)")
+
+    rng = np.random.default_rng(42)
+    user_ids = rng.choice(model.user_item_matrix.index.to_numpy(), size=min(args.users, len(model.user_item_matrix)), replace=False)
+
+    # Agreement check on the timed users
+    mismatches = sum(
+        model.collaborative_filtering_recommendations(user_id) != legacy_collaborative_filtering_recommendations(model, user_id)
+        for user_id in user_ids
+    )
+
+    before = time_per_user(lambda user_id: legacy_collaborative_filtering_recommendations(model, user_id), user_ids)
+    after = time_per_user(model.collaborative_filtering_recommendations, user_ids)
+
+    print(f"{len(model.user_item_matrix)} users x {len(model.user_item_matrix.columns)} destinations, {len(user_ids)} users timed")
+    print(f"{'':8}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, latencies in [('before', before), ('after', after)]:
+        print(f"{name:8}{latencies.mean():10.3f}{np.percentile(latencies, 50):10.3f}{np.percentile(latencies, 99):10.3f}")
+    print(f"speedup: {before.mean() / after.mean():.1f}x, result mismatches: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Latency percentiles and throughput of /recommend/new_user at several concurrency levels
+
+Usage: python benchmarks/load_test.py [--url http://localhost:5001] [--concurrency 1,8,32,64]
+                                      [--requests 2000] [--distinct 64] [--json]
+
+Each level runs `--requests` POSTs split across that many client threads, each with its
+own keep-alive session. Request bodies cycle through `--distinct` preference profiles,
+so a small value mostly measures the response cache and a large one the model itself.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model import PREFERENCE_FLAGS, SEASONS, TRIP_PURPOSES
+
+
+def make_payloads(n, seed=0):
+    """Return n distinct /recommend/new_user request bodies"""
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(n):
+        payloads.append({
+            'user_preferences': {
+                **{flag: rng.randint(0, 1) for flag in PREFERENCE_FLAGS},
+                'num_passengers': 1 + i % 4,
+                'length_of_stay': rng.randint(1, 30)
+            },
+            'season': rng.choice(SEASONS),
+            'trip_type': rng.choice(TRIP_PURPOSES),
+            'top_k': 10
+        })
+    return payloads
+
+
+def run_level(url, concurrency, n_requests, payloads, timeout):
+    """Send n_requests from `concurrency` threads, returning latencies in ms, error count and wall time"""
+    sessions = threading.local()
+    counter = itertools.count()
+
+    def send(_):
+        if not hasattr(sessions, 'session'):
+            sessions.session = requests.Session()
+        payload = payloads[next(counter) % len(payloads)]
+        start = time.perf_counter()
+        try:
+            response = sessions.session.post(url, json=payload, timeout=timeout)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, ok in results if ok])
+    errors = sum(not ok for _, ok in results)
+    return latencies, errors, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5001')
+    parser.add_argument('--concurrency', default='1,8,32,64', help="comma-separated client thread counts")
+    parser.add_argument('--requests', type=int, default=2000, help="requests per concurrency level")
+    parser.add_argument('--distinct', type=int, default=64, help="number of distinct request bodies")
+    parser.add_argument('--warmup', type=int, default=100, help="untimed requests sent before the first level")
+    parser.add_argument('--timeout', type=float, default=10.0, help="per-request timeout in seconds")
+    parser.add_argument('--json', action='store_true', help="print results as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    url = args.url.rstrip('/') + '/recommend/new_user'
+    payloads = make_payloads(args.distinct)
+    run_level(url, 4, args.warmup, payloads, args.timeout)
+
+    report = []
+    for concurrency in (int(level) for level in args.concurrency.split(',')):
+        latencies, errors, elapsed = run_level(url, concurrency, args.requests, payloads, args.timeout)
+        report.append({
+            'concurrency': concurrency,
+            'requests': args.requests,
+            'errors': errors,
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+            'p99_ms': round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None
+        })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'concurrency':>11} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for row in report:
+        print(f"{row['concurrency']:>11} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9} "
+              f"{row['p50_ms'] if row['p50_ms'] is not None else '-':>9} {row['p99_ms'] if row['p99_ms'] is not None else '-':>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""Memory and disk footprint of each component of a saved model, and how it grows with users
+
+Usage: python describe.py [MODEL_PATH] [--users 10000,100000,1000000] [--arrays] [--json]
+
+MODEL_PATH may be an artifact store (describing its CURRENT version), a single version
+directory; it defaults to recommendation_model/. For each component,
+memory is what the loaded model holds, of which "mapped" is memory-mapped from the
+artifact and shared between worker processes through the page cache; disk is the
+component's .npy files plus its share of manifest.json. Growth comes from each stored
+array's shape: arrays with a users axis grow linearly with users, the users x users
+similarity matrix quadratically, and the rest don't depend on the number of users.
+Projections scale the measured bytes accordingly, assuming users keep booking as many
+destinations as they do now.
+"""
+import argparse
+import json
+import mmap
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from artifacts import MANIFEST_FILENAME, ArtifactStore
+from model import MODEL_DIRNAME, current_dir, load_model
+
+# Model attributes reported as components, and the artifact key prefixes stored for each
+COMPONENTS = {
+    'user_item_matrix': ['user_item_matrix', 'user_ids', 'user_item_columns'],
+    'user_similarity': ['user_similarity'],
+    'user_neighbors': ['user_neighbors'],
+    'latent_factors': ['latent_factors'],
+    'destination_popularity': ['destination_popularity', 'destination_popularity_columns', 'destinations'],
+    'destination_info': [],
+    'destination_mapping': [],
+    'context_rankings': ['context_rankings'],
+    'preference_index': ['preference_index'],
+    'user_contexts': ['user_contexts'],
+    'booking_statistics': ['booking_statistics'],
+    'recommendation_cache': []
+}
+# Arrays growing linearly with the number of users without having a users axis:
+# neighbor lists (CSR, n_neighbors per user) and one entry per distinct user rating
+USER_SCALED_PREFIXES = ('user_neighbors.', 'booking_statistics.pair_')
+GROWTH_LABELS = {0: 'O(1)', 1: 'O(users)', 2: 'O(users^2)'}
+
+
+def is_mapped(array):
+    """Whether array's memory is backed by a memory-mapped file"""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def footprint(obj, seen=None):
+    """Return (bytes, mapped bytes) held by obj and everything it references, counting shared objects once"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0, 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        size = obj.nbytes + (sum(footprint(value, seen)[0] for value in obj.ravel()) if obj.dtype == object else 0)
+        return size, obj.nbytes if is_mapped(obj) else 0
+    if isinstance(obj, pd.Index):
+        return int(obj.memory_usage(deep=True)), obj.nbytes if is_mapped(obj.to_numpy()) else 0
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        if isinstance(obj, pd.DataFrame):
+            parts = [obj.index, obj.columns] + [obj[column].to_numpy() for column in obj.columns]
+        else:
+            parts = [obj.index, obj.to_numpy()]
+        sizes = [footprint(part, seen) for part in parts]
+        return sum(size for size, _ in sizes), sum(mapped for _, mapped in sizes)
+
+    size, mapped = sys.getsizeof(obj), 0
+    if isinstance(obj, dict):
+        children = [item for pair in obj.items() for item in pair]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        children = obj
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        children = vars(obj).values()
+    else:
+        children = []
+    for child in children:
+        child_size, child_mapped = footprint(child, seen)
+        size, mapped = size + child_size, mapped + child_mapped
+    return size, mapped
+
+
+def component_of(key):
+    """Return the component an artifact array or metadata key belongs to, or None for settings"""
+    prefix = key.split('.', 1)[0]
+    for component, prefixes in COMPONENTS.items():
+        if prefix in prefixes:
+            return component
+    return None
+
+
+def growth(key, shape, n_users):
+    """Return the power of the number of users an array's size grows with"""
+    if key.startswith(USER_SCALED_PREFIXES):
+        return 1
+    return sum(length == n_users for length in shape)
+
+
+def resolve_version_dir(model_path):
+    """Return the artifact version directory model_path loads from"""
+    if os.path.isfile(os.path.join(model_path, MANIFEST_FILENAME)):
+        return model_path
+    return os.path.join(model_path, ArtifactStore(model_path).current_version())
+
+
+def describe(model_path, user_counts=(10000, 100000, 1000000)):
+    """Load a model and return its per-component and per-array footprint with growth projections"""
+    model = load_model(model_path)
+    arrays, metadata = model.to_artifact()
+    n_users = len(model.user_item_matrix.index)
+
+    version_dir = resolve_version_dir(model_path)
+    with open(os.path.join(version_dir, MANIFEST_FILENAME)) as f:
+        manifest_arrays = json.load(f)['arrays']
+
+    array_rows = []
+    for key, array in arrays.items():
+        array = np.asarray(array)
+        spec = manifest_arrays.get(key)
+        array_rows.append({
+            'array': key,
+            'component': component_of(key),
+            'dtype': str(array.dtype),
+            'shape': list(array.shape),
+            'bytes': int(array.nbytes),
+            'disk_bytes': os.path.getsize(os.path.join(version_dir, spec['file'])) if spec else None,
+            'growth': growth(key, array.shape, n_users)
+        })
+
+    # Metadata is stored as JSON in the manifest; attribute each entry's share of it to its component
+    metadata_bytes = {}
+    for key, value in metadata.items():
+        component = component_of(key) or 'settings'
+        metadata_bytes[component] = metadata_bytes.get(component, 0) + len(json.dumps({key: value}, default=str))
+
+    components = []
+    for component in COMPONENTS:
+        value = getattr(model, component, None)
+        if value is None:
+            continue
+        memory, mapped = footprint(value)
+        rows = [row for row in array_rows if row['component'] == component]
+        largest = max(rows, key=lambda row: row['bytes']) if rows else None
+        array_bytes = sum(row['bytes'] for row in rows)
+        # Memory grows like the stored arrays it was built from, in proportion to their bytes
+        growth_shares = {
+            str(power): sum(row['bytes'] for row in rows if row['growth'] == power) / array_bytes
+            for power in sorted({row['growth'] for row in rows})
+        } if array_bytes else {'0': 1.0}
+        components.append({
+            'component': component,
+            'dtype': largest['dtype'] if largest else type(value).__name__,
+            'shape': largest['shape'] if largest else [len(value)] if hasattr(value, '__len__') else [],
+            'memory_bytes': memory,
+            'mapped_bytes': mapped,
+            'disk_bytes': sum(row['disk_bytes'] for row in rows) + metadata_bytes.get(component, 0),
+            'growth': GROWTH_LABELS.get(max(int(power) for power in growth_shares), 'O(users^n)'),
+            'growth_shares': growth_shares
+        })
+
+    projections = []
+    for user_count in user_counts:
+        scale = user_count / n_users if n_users else 0
+        projected = {
+            component['component']: sum(
+                component['memory_bytes'] * share * scale ** int(power) for power, share in component['growth_shares'].items()
+            )
+            for component in components
+        }
+        projections.append({
+            'users': user_count,
+            'memory_bytes': sum(projected.values()),
+            'disk_bytes': sum(row['disk_bytes'] * scale ** row['growth'] for row in array_rows),
+            'largest_component': max(projected, key=projected.get)
+        })
+
+    return {
+        'model_path': model_path,
+        'version': model.version,
+        'users': n_users,
+        'destinations': len(model.destinations),
+        'memory_bytes': sum(component['memory_bytes'] for component in components),
+        'mapped_bytes': sum(component['mapped_bytes'] for component in components),
+        'disk_bytes': sum(os.path.getsize(os.path.join(version_dir, name)) for name in os.listdir(version_dir)),
+        'components': components,
+        'arrays': array_rows,
+        'projections': projections
+    }
+
+
+def megabytes(value):
+    return f"{value / 2**20:.2f}" if value is not None else '-'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('model_path', nargs='?', default=os.path.join(current_dir, MODEL_DIRNAME))
+    parser.add_argument('--users', default='10000,100000,1000000', help="comma-separated user counts to project to")
+    parser.add_argument('--arrays', action='store_true', help="also list every stored array")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON instead of tables")
+    args = parser.parse_args(argv)
+
+    report = describe(args.model_path, [int(count) for count in args.users.split(',')])
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Model version {report['version']}: {report['users']} users x {report['destinations']} destinations")
+    print(f"Memory {megabytes(report['memory_bytes'])} MB ({megabytes(report['mapped_bytes'])} MB memory-mapped), "
+          f"disk {megabytes(report['disk_bytes'])} MB\n")
+    print(f"{'component':<24}{'dtype':<12}{'shape':<16}{'memory MB':>11}{'mapped MB':>11}{'disk MB':>10}  growth")
+    for row in sorted(report['components'], key=lambda row: -row['memory_bytes']):
+        print(f"{row['component']:<24}{row['dtype']:<12}{'x'.join(map(str, row['shape'])):<16}{megabytes(row['memory_bytes']):>11}"
+              f"{megabytes(row['mapped_bytes']):>11}{megabytes(row['disk_bytes']):>10}  {row['growth']}")
+
+    if args.arrays:
+        print(f"\n{'array':<48}{'dtype':<10}{'shape':<16}{'MB':>9}{'disk MB':>10}  growth")
+        for row in report['arrays']:
+            print(f"{row['array']:<48}{row['dtype']:<10}{'x'.join(map(str, row['shape'])):<16}{megabytes(row['bytes']):>9}"
+                  f"{megabytes(row['disk_bytes']):>10}  {GROWTH_LABELS.get(row['growth'], 'O(users^n)')}")
+
+    print(f"\n{'users':>10}{'memory MB':>14}{'disk MB':>14}  largest component")
+    for row in report['projections']:
+        print(f"{row['users']:>10}{megabytes(row['memory_bytes']):>14}{megabytes(row['disk_bytes']):>14}  {row['largest_component']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Offline evaluation of every recommendation strategy on a held-out split of the bookings
+
+Usage: python evaluate.py [--data customer_booking.csv] [--k 10] [--test-size 0.2]
+                          [--neighbors N] [--factors 16] [--output evaluation_report.json]
+
+Bookings are split at random into train and test sets. The model is fitted on the
+train set, and each strategy is asked for K destinations per test user; the relevant
+destinations are the ones that user booked in the test set. New-user recommendations
+are scored per test booking, built from that booking's preferences and context, with
+its destination as the single relevant item. The report holds precision@K, recall@K,
+NDCG@K, catalog coverage and per-request latency per strategy, plus training time and
+peak memory, as JSON so reports of two model versions can be diffed. A latent factor
+model is fitted on the same split and scored as "factors" (collaborative filtering
+alone) and "factors_hybrid".
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+from model import (
+    DATA_PATH, DEFAULT_SEASON, DEFAULT_TRIP_TYPE, N_FACTORS, PREFERENCE_FLAGS, fit_model, load_booking_data,
+    prepare_booking_data
+)
+
+# Strategies for users with booking history: (model, user_id, season, trip_type, k) -> destinations
+EXISTING_USER_STRATEGIES = {
+    'collaborative': lambda model, user_id, season, trip_type, k: model.collaborative_filtering_recommendations(user_id, k),
+    'popularity': lambda model, user_id, season, trip_type, k: model.popularity_based_recommendations(k),
+    'seasonal': lambda model, user_id, season, trip_type, k: model.seasonal_recommendations(season, k),
+    'trip_type': lambda model, user_id, season, trip_type, k: model.trip_type_recommendations(trip_type, k),
+    'hybrid': lambda model, user_id, season, trip_type, k: [
+        rec['destination'] for rec in model.get_recommendations_for_user(user_id, top_k=k)
+    ]
+}
+
+
+def precision_at_k(recommendations, relevant, k):
+    """Fraction of the top k recommendations that are relevant"""
+    return len(set(recommendations[:k]) & relevant) / k
+
+
+def recall_at_k(recommendations, relevant, k):
+    """Fraction of the relevant destinations found in the top k recommendations"""
+    return len(set(recommendations[:k]) & relevant) / len(relevant) if relevant else 0.0
+
+
+def ndcg_at_k(recommendations, relevant, k):
+    """Normalized discounted cumulative gain of the top k recommendations, with binary relevance"""
+    dcg = sum(1 / np.log2(i + 2) for i, dest in enumerate(recommendations[:k]) if dest in relevant)
+    idcg = sum(1 / np.log2(i + 2) for i in range(min(k, len(relevant))))
+    return dcg / idcg if idcg else 0.0
+
+
+def score(results, k, n_destinations):
+    """Summarize [(recommendations, relevant, seconds), ...] of one strategy"""
+    latencies = np.array([seconds for _, _, seconds in results]) * 1000
+    recommended = set()
+    for recommendations, _, _ in results:
+        recommended.update(recommendations[:k])
+
+    return {
+        'requests': len(results),
+        f'precision@{k}': float(np.mean([precision_at_k(recs, relevant, k) for recs, relevant, _ in results])),
+        f'recall@{k}': float(np.mean([recall_at_k(recs, relevant, k) for recs, relevant, _ in results])),
+        f'ndcg@{k}': float(np.mean([ndcg_at_k(recs, relevant, k) for recs, relevant, _ in results])),
+        'coverage': len(recommended) / n_destinations,
+        'latency_ms': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p99': float(np.percentile(latencies, 99))
+        }
+    }
+
+
+def timed(recommend, *args):
+    """Call recommend(*args), returning (result, seconds)"""
+    start = time.perf_counter()
+    result = recommend(*args)
+    return result, time.perf_counter() - start
+
+
+def evaluate_existing_users(model, test, k, strategies=EXISTING_USER_STRATEGIES):
+    """Score each strategy on the test users that the model was trained on"""
+    relevant = test.groupby('user_id')['destination'].agg(set)
+    relevant = relevant[relevant.index.isin(model.user_item_matrix.index)]
+
+    report = {}
+    for name, recommend in strategies.items():
+        model.recommendation_cache.clear()
+        results = []
+        for user_id, destinations in relevant.items():
+            season, trip_type = model.user_contexts.get(user_id, (DEFAULT_SEASON, DEFAULT_TRIP_TYPE))
+            recommendations, seconds = timed(recommend, model, user_id, season, trip_type, k)
+            results.append((recommendations, destinations, seconds))
+        report[name] = score(results, k, len(model.destinations))
+    return report
+
+
+def evaluate_new_users(model, test, k):
+    """Score new-user recommendations on each test booking's own preferences and context"""
+    results = []
+    for booking in test.itertuples(index=False):
+        user_preferences = {flag: getattr(booking, flag) for flag in PREFERENCE_FLAGS}
+        user_preferences['num_passengers'] = booking.num_passengers
+        user_preferences['length_of_stay'] = booking.length_of_stay
+        records, seconds = timed(
+            lambda: model.get_recommendations_for_new_user(
+                user_preferences, season=booking.season, trip_type=booking.trip_purpose, origin=booking.origin, top_k=k
+            )
+        )
+        results.append(([record['destination'] for record in records], {booking.destination}, seconds))
+    return score(results, k, len(model.destinations))
+
+
+def measure_training(train, **options):
+    """Fit a model with fit_model options, returning it with the training time in seconds and the peak traced memory in bytes
+
+    Memory is traced on a second fit so that tracing doesn't inflate the training time.
+    """
+    start = time.perf_counter()
+    model = fit_model(train, **options)
+    training_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        fit_model(train, **options)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return model, training_time, peak_memory
+
+
+def collaborative_bytes(model):
+    """Bytes held by the structure collaborative filtering searches: similarities, neighbors or factors"""
+    if model.latent_factors is not None:
+        return model.latent_factors.user_factors.nbytes + model.latent_factors.destination_factors.nbytes
+    if model.user_neighbors is not None:
+        return model.user_neighbors.indptr.nbytes + model.user_neighbors.indices.nbytes + model.user_neighbors.similarities.nbytes
+    return model.user_similarity.to_numpy().nbytes
+
+
+def evaluate(data, k=10, test_size=0.2, similarity_neighbors=None, max_new_user_bookings=2000, random_state=42,
+             n_factors=N_FACTORS):
+    """Split prepared bookings, fit a model on the train set and return the evaluation report
+
+    With n_factors, a factor model is also fitted and scored; None skips it.
+    """
+    train, test = train_test_split(data, test_size=test_size, random_state=random_state)
+    model, training_time, peak_memory = measure_training(train, similarity_neighbors=similarity_neighbors)
+
+    strategies = evaluate_existing_users(model, test, k)
+    new_user_test = test.sample(min(max_new_user_bookings, len(test)), random_state=random_state)
+    strategies['new_user'] = evaluate_new_users(model, new_user_test, k)
+
+    factor_model = None
+    if n_factors:
+        factor_model, factor_training_time, factor_peak_memory = measure_training(train, n_factors=n_factors)
+        factor_strategies = evaluate_existing_users(factor_model, test, k, {
+            'factors': EXISTING_USER_STRATEGIES['collaborative'],
+            'factors_hybrid': EXISTING_USER_STRATEGIES['hybrid']
+        })
+        strategies.update(factor_strategies)
+
+    return {
+        'k': k,
+        'data': {
+            'train_bookings': len(train),
+            'test_bookings': len(test),
+            'users': len(model.user_item_matrix.index),
+            'destinations': len(model.destinations),
+            'test_size': test_size,
+            'random_state': random_state
+        },
+        'model': {
+            'similarity_neighbors': similarity_neighbors,
+            'training_time_s': training_time,
+            'peak_memory_mb': peak_memory / 2**20,
+            'collaborative_mb': collaborative_bytes(model) / 2**20
+        },
+        'factor_model': {
+            'n_factors': factor_model.latent_factors.n_factors,
+            'training_time_s': factor_training_time,
+            'peak_memory_mb': factor_peak_memory / 2**20,
+            'collaborative_mb': collaborative_bytes(factor_model) / 2**20
+        } if factor_model is not None else None,
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__},
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'strategies': strategies
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=DATA_PATH, help="booking CSV to split and evaluate on")
+    parser.add_argument('--k', type=int, default=10, help="number of recommendations to score")
+    parser.add_argument('--test-size', type=float, default=0.2, help="fraction of bookings held out")
+    parser.add_argument('--neighbors', type=int, default=None, help="train with the top N similar users per user")
+    parser.add_argument('--factors', type=int, default=N_FACTORS, help="also score a factor model with N factors; 0 skips it")
+    parser.add_argument('--new-user-bookings', type=int, default=2000, help="test bookings to score new-user recommendations on")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    data = prepare_booking_data(load_booking_data(args.data))
+    report = evaluate(
+        data, k=args.k, test_size=args.test_size, similarity_neighbors=args.neighbors,
+        max_new_user_bookings=args.new_user_bookings, n_factors=args.factors
+    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Evaluation report written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+    k = report['k']
+    print(f"\n{'strategy':<14} {f'precision@{k}':>13} {f'recall@{k}':>10} {f'ndcg@{k}':>8} {'coverage':>9} {'p50 ms':>8} {'p99 ms':>8}", file=sys.stderr)
+    for name, metrics in report['strategies'].items():
+        print(
+            f"{name:<14} {metrics[f'precision@{k}']:>13.4f} {metrics[f'recall@{k}']:>10.4f} {metrics[f'ndcg@{k}']:>8.4f} "
+            f"{metrics['coverage']:>9.3f} {metrics['latency_ms']['p50']:>8.3f} {metrics['latency_ms']['p99']:>8.3f}",
+            file=sys.stderr
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# gunicorn.conf.py - production settings for recommendation_service, read automatically by
+# `gunicorn recommendation_service:app` when started from this directory
+import gc
+import multiprocessing
+import os
+
+# RECOMMEND_PORT rather than PORT, which .env files of the other services set for themselves
+bind = f"0.0.0.0:{os.environ.get('RECOMMEND_PORT', 5001)}"
+
+# Each worker is a process with its own GIL; threads overlap request I/O within a worker
+workers = int(os.environ.get('RECOMMEND_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('RECOMMEND_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('RECOMMEND_TIMEOUT', 30))
+keepalive = 5
+
+# Load the model once in the master; forked workers share its pages copy-on-write,
+# and the memory-mapped arrays through the page cache
+preload_app = True
+
+# Access logs come from the app as sampled JSON lines
+accesslog = None
+errorlog = '-'
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so that garbage
+    # collection in the workers doesn't write to (and copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from recommendation_service import start_background_tasks
+    start_background_tasks()
@@ -6,11 +6,12 @@ import numpy as np
 import os
 import sys
 import time
-import pickle
-from sklearn.model_selection import train_test_split
+import json
+import argparse
+import hashlib
 from sklearn.metrics.pairwise import cosine_similarity
-import matplotlib.pyplot as plt
-import seaborn as sns
+from cache import LRUCache
+from artifacts import ArtifactStore, read_artifact, MANIFEST_FILENAME
 
 # Set up a timer class for measuring performance
 class Timer:
@@ -21,8 +22,6 @@ class Timer:
     def __exit__(self, *args):
         self.interval = time.time() - self.start
 
-print(f"System version: {sys.version}")
-
 # Set the default parameters
 TOP_K = 10  # top k destinations to recommend
 
@@ -32,145 +31,1115 @@ COL_ITEM = "destination"
 COL_RATING = "rating"
 COL_TIMESTAMP = "timestamp"
 
-# Load the customer_booking.csv file
-import os
-current_dir = os.path.dirname(__file__)
-
-try:
-    # data = pd.read_csv("customer_booking.csv", encoding='latin1')
-    data = pd.read_csv(os.path.join(current_dir, 'customer_booking.csv'), encoding='latin1')
-
-    print("Original data sample:")
-    print(data.head())
-except Exception as e:
-    print(f"Error loading data: {e}")
-    sys.exit(1)
-
-# Data preparation
-# 1. Extract origin and destination from route
-data['origin'] = data['route'].str[:3]
-data['destination'] = data['route'].str[3:]
-
-print("\nData with origin and destination extracted:")
-print(data[['route', 'origin', 'destination']].head())
-
-# 2. Create a synthetic user_id based on booking patterns
-data['user_id'] = (
-    data['booking_origin'].astype(str) + '_' +
-    data['trip_type'].astype(str) + '_' +
-    data['flight_day'].astype(str)
-).apply(hash) % 10000  # Modulo to keep IDs manageable
-
-# 3. Calculate implicit ratings based on user behavior
-data['rating'] = (
-    # Base rating from booking completion
-    np.where(data['booking_complete'] == 1, 5.0, 0.0) +
-    # Add value for premium services
-    np.where(data['wants_extra_baggage'] == 1, 1.0, 0.0) +
-    np.where(data['wants_preferred_seat'] == 1, 1.0, 0.0) +
-    np.where(data['wants_in_flight_meals'] == 1, 1.0, 0.0) +
-    # Base rating from number of passengers (normalized)
-    data['num_passengers'] / 2
-)
-
-# 4. Add contextual features
-# Season based on purchase_lead (assuming current date)
-data['season'] = pd.cut(
-    data['purchase_lead'] % 365,
-    bins=[0, 90, 180, 270, 365],
-    labels=['Winter', 'Spring', 'Summer', 'Fall']
-)
-
-# Trip purpose inference
-data['trip_purpose'] = pd.cut(
-    data['length_of_stay'],
-    bins=[-1, 3, 14, float('inf')],
-    labels=['Business', 'Regular Vacation', 'Extended Vacation']
-)
-
-# Use purchase_lead as timestamp (for recency)
-data['timestamp'] = data['purchase_lead']
-
-print("\nProcessed data with user profiles and ratings:")
-print(data[['user_id', 'destination', 'rating', 'season', 'trip_purpose']].head())
-
-# Calculate destination popularity metrics
-destination_popularity = data.groupby('destination').agg(
-    booking_count=('user_id', 'count'),
-    avg_rating=('rating', 'mean'),
-    completed_bookings=('booking_complete', 'sum'),
-    unique_users=('user_id', 'nunique')
-).reset_index()
-
-destination_popularity['popularity_score'] = (
-    destination_popularity['booking_count'] * 0.3 +
-    destination_popularity['avg_rating'] * 0.4 +
-    destination_popularity['completed_bookings'] * 0.2 +
-    destination_popularity['unique_users'] * 0.1
-)
-
-destination_popularity = destination_popularity.sort_values('popularity_score', ascending=False)
-
-print("\nDestination popularity metrics:")
-print(destination_popularity.head(10))
-
-# Join popularity metrics back to the main dataset
-data = data.merge(
-    destination_popularity[['destination', 'popularity_score']],
-    on='destination',
-    how='left'
-)
-
-# Adjust ratings based on popularity (optional - can be weighted)
-data['adjusted_rating'] = data['rating'] * 0.8 + data['popularity_score'] * 0.2
-
-print("\nData with popularity-adjusted ratings:")
-print(data[['user_id', 'destination', 'rating', 'popularity_score', 'adjusted_rating']].head())
-
-# Create a user-item matrix for collaborative filtering
-# First, remove duplicates to handle potential errors
-user_item_df = data[['user_id', 'destination', 'adjusted_rating']].drop_duplicates()
-
-# Create a pivot table: users as rows, destinations as columns, ratings as values
-user_item_matrix = user_item_df.pivot_table(
-    index='user_id',
-    columns='destination',
-    values='adjusted_rating',
-    fill_value=0
-)
-
-print("\nUser-Item Matrix (sample):")
-print(user_item_matrix.head())
-
-# Split the data into training and test sets
-train_data, test_data = train_test_split(data, test_size=0.25, random_state=42)
-print(f"\nTraining set size: {len(train_data)}")
-print(f"Test set size: {len(test_data)}")
-
-# Create a destination mapping dictionary
-destination_mapping = {
-    'id': {i: dest for i, dest in enumerate(destination_popularity['destination'])},
-    'destination': {dest: i for i, dest in enumerate(destination_popularity['destination'])}
+# Bumped whenever the layout of the saved artifacts changes, so that a service
+# never tries to serve a model saved by an incompatible version of this file
+ARTIFACT_VERSION = 5
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(current_dir, 'customer_booking.csv')
+# Compact dtypes for the booking CSV: small integers and low-cardinality strings as categoricals
+BOOKING_DTYPES = {
+    'num_passengers': 'int8',
+    'sales_channel': 'category',
+    'trip_type': 'category',
+    'purchase_lead': 'int16',
+    'length_of_stay': 'int16',
+    'flight_hour': 'int8',
+    'flight_day': 'category',
+    'route': 'category',
+    'booking_origin': 'category',
+    'wants_extra_baggage': 'int8',
+    'wants_preferred_seat': 'int8',
+    'wants_in_flight_meals': 'int8',
+    'flight_duration': 'float32',
+    'booking_complete': 'int8'
 }
+# Bookings sharing these columns are treated as one synthetic user
+USER_KEY_COLUMNS = ['booking_origin', 'trip_type', 'flight_day']
+USER_ID_HASH_KEY = b'flyease-user-id'  # changing it changes every user id
+N_USER_IDS = 10000  # modulo to keep IDs manageable
+# Recorded in every model and checked on load, so that ids derived differently are never mixed
+USER_ID_SCHEME = f"blake2b-64:{USER_ID_HASH_KEY.decode()}:{'+'.join(USER_KEY_COLUMNS)}:mod{N_USER_IDS}"
+CHUNK_SIZE = 100000  # bookings read at a time when training from a CSV
+MODEL_DIRNAME = "recommendation_model"
+
+# Contexts whose destination rankings are precomputed at training time
+RANKING_CONTEXTS = ['season', 'trip_purpose', 'origin']
+
+# Seasons and trip purposes prepare_booking_data labels bookings with
+SEASONS = ['Winter', 'Spring', 'Summer', 'Fall']
+TRIP_PURPOSES = ['Business', 'Regular Vacation', 'Extended Vacation']
+
+# Context used for users without booking history, or without a known season or trip purpose
+DEFAULT_SEASON = 'Summer'
+DEFAULT_TRIP_TYPE = 'Regular Vacation'
+
+# Extras a new user's preferences must match exactly to count as a similar booking
+PREFERENCE_FLAGS = ['wants_extra_baggage', 'wants_preferred_seat', 'wants_in_flight_meals']
+PASSENGER_WINDOW = 1  # +/- passengers for a booking to count as similar
+STAY_WINDOW = 3  # +/- days of stay for a booking to count as similar
+# Preferences assumed for a new user who gives none
+DEFAULT_USER_PREFERENCES = {
+    'wants_extra_baggage': 0,
+    'wants_preferred_seat': 0,
+    'wants_in_flight_meals': 0,
+    'num_passengers': 1,
+    'length_of_stay': 7
+}
+
+# Lists of the approximate user index searched per user when training with similarity_lists
+ANN_PROBE = 8
+# Latent factors per user and destination when training a factor model
+N_FACTORS = 16
+
+
+def to_native(value):
+    """Convert a NumPy scalar to the equivalent Python value, for JSON manifests"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def load_booking_data(path=DATA_PATH):
+    """Load the raw customer booking CSV"""
+    return pd.read_csv(path, encoding='latin1', dtype=BOOKING_DTYPES)
+
+
+def iter_booking_chunks(path=DATA_PATH, chunksize=CHUNK_SIZE):
+    """Yield prepared bookings from the CSV chunksize rows at a time, so memory use doesn't grow with the file"""
+    for chunk in pd.read_csv(path, encoding='latin1', dtype=BOOKING_DTYPES, chunksize=chunksize):
+        yield prepare_booking_data(chunk)
+
+
+def derive_user_ids(data):
+    """Return the synthetic user id of each booking, the same in every process and on every machine
+
+    The id is a keyed BLAKE2b hash of booking_origin, trip_type and flight_day modulo
+    N_USER_IDS. Only distinct combinations are hashed, so the per-row work is a few
+    array operations however long the input is.
+    """
+    codes, labels = zip(*(pd.factorize(data[column], use_na_sentinel=False) for column in USER_KEY_COLUMNS))
+    combinations, inverse = np.unique(
+        np.ravel_multi_index(codes, [len(column_labels) for column_labels in labels]), return_inverse=True
+    )
+
+    user_ids = np.empty(len(combinations), dtype=np.int64)
+    for i, key in enumerate(zip(*np.unravel_index(combinations, [len(column_labels) for column_labels in labels]))):
+        key = '_'.join(str(column_labels[code]) for column_labels, code in zip(labels, key))
+        digest = hashlib.blake2b(key.encode(), digest_size=8, key=USER_ID_HASH_KEY).digest()
+        user_ids[i] = int.from_bytes(digest, 'little') % N_USER_IDS
+    return user_ids[inverse.reshape(-1)]
+
+
+def prepare_booking_data(data):
+    """Add the derived columns (route split, user id, rating, context) to raw bookings"""
+    data = data.copy()
+
+    # 1. Extract origin and destination from route, slicing each distinct route once
+    routes = data['route'].astype('category')
+    data['origin'] = routes.cat.categories.str[:3].to_numpy()[routes.cat.codes]
+    data['destination'] = routes.cat.categories.str[3:].to_numpy()[routes.cat.codes]
+
+    # 2. Create a synthetic user_id based on booking patterns
+    data['user_id'] = derive_user_ids(data)
+
+    # 3. Calculate implicit ratings based on user behavior
+    data['rating'] = (
+        # Base rating from booking completion
+        np.where(data['booking_complete'] == 1, 5.0, 0.0) +
+        # Add value for premium services
+        np.where(data['wants_extra_baggage'] == 1, 1.0, 0.0) +
+        np.where(data['wants_preferred_seat'] == 1, 1.0, 0.0) +
+        np.where(data['wants_in_flight_meals'] == 1, 1.0, 0.0) +
+        # Base rating from number of passengers (normalized)
+        data['num_passengers'] / 2
+    )
+
+    # 4. Add contextual features
+    # Season based on purchase_lead (assuming current date)
+    data['season'] = pd.cut(
+        data['purchase_lead'] % 365,
+        bins=[0, 90, 180, 270, 365],
+        labels=SEASONS
+    )
+
+    # Trip purpose inference
+    data['trip_purpose'] = pd.cut(
+        data['length_of_stay'],
+        bins=[-1, 3, 14, float('inf')],
+        labels=TRIP_PURPOSES
+    )
+
+    # Use purchase_lead as timestamp (for recency)
+    data['timestamp'] = data['purchase_lead']
+
+    return data
+
+
+def calculate_destination_popularity(data):
+    """Calculate destination popularity metrics, most popular first"""
+    destination_popularity = data.groupby('destination').agg(
+        booking_count=('user_id', 'count'),
+        avg_rating=('rating', 'mean'),
+        completed_bookings=('booking_complete', 'sum'),
+        unique_users=('user_id', 'nunique')
+    ).reset_index()
+    # pandas hands sums of the compact int8 column back as int8 whenever they fit
+    destination_popularity['completed_bookings'] = destination_popularity['completed_bookings'].astype(np.int64)
+
+    return score_destination_popularity(destination_popularity)
+
+
+def score_destination_popularity(destination_popularity):
+    """Add popularity_score to per-destination metrics and sort them, most popular first"""
+    destination_popularity['popularity_score'] = (
+        destination_popularity['booking_count'] * 0.3 +
+        destination_popularity['avg_rating'] * 0.4 +
+        destination_popularity['completed_bookings'] * 0.2 +
+        destination_popularity['unique_users'] * 0.1
+    )
+
+    return destination_popularity.sort_values('popularity_score', ascending=False)
+
+
+def build_user_item_matrix(data, destination_popularity):
+    """Create the popularity-adjusted user-item matrix used for collaborative filtering"""
+    # Join popularity metrics back to the main dataset
+    data = data.merge(
+        destination_popularity[['destination', 'popularity_score']],
+        on='destination',
+        how='left'
+    )
+
+    # Adjust ratings based on popularity (optional - can be weighted)
+    data['adjusted_rating'] = data['rating'] * 0.8 + data['popularity_score'] * 0.2
+
+    # First, remove duplicates to handle potential errors
+    user_item_df = data[['user_id', 'destination', 'adjusted_rating']].drop_duplicates()
+
+    # Create a pivot table: users as rows, destinations as columns, ratings as values
+    return user_item_df.pivot_table(
+        index='user_id',
+        columns='destination',
+        values='adjusted_rating',
+        fill_value=0
+    )
+
+
+def rank_destinations(destinations, booking_counts, rating_sums):
+    """Rank destinations by booking_count * 0.6 + avg_rating * 0.4 from aggregated counts
+
+    destinations must be sorted, as groupby('destination') would return them, so that
+    ties are broken exactly like the original per-request groupby and sort_values.
+    """
+    booked = np.flatnonzero(booking_counts > 0)
+    counts = booking_counts[booked]
+    scores = counts * 0.6 + (rating_sums[booked] / counts) * 0.4
+    # sort_values(ascending=False) argsorts the reversed scores and reverses the result,
+    # which is repeated here without building a Series
+    order = booked[::-1][scores[::-1].argsort(kind='quicksort')][::-1]
+    return np.asarray(destinations)[order].tolist()
+
+
+def calculate_context_rankings(data, destinations):
+    """Materialize the destination ranking for every season, trip purpose and origin"""
+    context_rankings = {}
+    for context in RANKING_CONTEXTS:
+        aggregates = data.groupby([context, 'destination'], observed=True)['rating'].agg(['count', 'sum'])
+        booking_counts = aggregates['count'].unstack(fill_value=0).reindex(columns=destinations, fill_value=0)
+        rating_sums = aggregates['sum'].unstack(fill_value=0).reindex(columns=destinations, fill_value=0)
+
+        context_rankings[context] = {
+            value: rank_destinations(destinations, booking_counts.loc[value].to_numpy(), rating_sums.loc[value].to_numpy())
+            for value in booking_counts.index
+        }
+    return context_rankings
+
+
+class PreferenceIndex:
+    """Booking counts and rating sums per destination, segmented by extras, passengers and stay
+
+    Segments are grouped by (extras flags, num_passengers) and sorted by length_of_stay
+    within each group, so the passenger and stay windows of a query resolve to a few
+    contiguous slices. A query therefore costs O(segments inside the window), which is
+    bounded by the feature domains and does not grow with the number of bookings.
+    """
+
+    def __init__(self, data, destinations):
+        self._set_segments(self.segment(data), destinations)
+
+    @staticmethod
+    def segment(data):
+        """Aggregate bookings into (flags, num_passengers, length_of_stay, destination) segments"""
+        # groupby sorts by its keys, so each group's segments come out ordered by length_of_stay
+        return data.groupby(
+            PREFERENCE_FLAGS + ['num_passengers', 'length_of_stay', 'destination'], observed=True
+        )['rating'].agg(['count', 'sum']).reset_index()
+
+    def _set_segments(self, segments, destinations):
+        self.destinations = destinations
+        self.lengths_of_stay = segments['length_of_stay'].to_numpy()
+        self.destination_ids = np.searchsorted(destinations, segments['destination'].to_numpy())
+        self.booking_counts = segments['count'].to_numpy()
+        self.rating_sums = segments['sum'].to_numpy()
+
+        # flags -> [(num_passengers, start, stop), ...] row ranges of each passenger group
+        self.groups = {}
+        keys = segments[PREFERENCE_FLAGS + ['num_passengers']].itertuples(index=False, name=None)
+        for row, key in enumerate(keys):
+            passenger_groups = self.groups.setdefault(key[:-1], [])
+            if passenger_groups and passenger_groups[-1][0] == key[-1]:
+                passenger_groups[-1] = (key[-1], passenger_groups[-1][1], row + 1)
+            else:
+                passenger_groups.append((key[-1], row, row + 1))
+
+    def to_artifact(self):
+        """Return (arrays, metadata) to store the index in an artifact"""
+        arrays = {
+            'lengths_of_stay': self.lengths_of_stay,
+            'destination_ids': self.destination_ids,
+            'booking_counts': self.booking_counts,
+            'rating_sums': self.rating_sums
+        }
+        groups = [
+            [[to_native(flag) for flag in flags], [[to_native(p), int(start), int(stop)] for p, start, stop in passenger_groups]]
+            for flags, passenger_groups in self.groups.items()
+        ]
+        return arrays, {'groups': groups}
+
+    @classmethod
+    def from_artifact(cls, arrays, metadata, destinations):
+        """Rebuild an index from to_artifact output without touching any bookings"""
+        index = cls.__new__(cls)
+        index.destinations = destinations
+        index.lengths_of_stay = arrays['lengths_of_stay']
+        index.destination_ids = arrays['destination_ids']
+        index.booking_counts = arrays['booking_counts']
+        index.rating_sums = arrays['rating_sums']
+        index.groups = {
+            tuple(flags): [tuple(group) for group in passenger_groups]
+            for flags, passenger_groups in metadata['groups']
+        }
+        return index
+
+    def segments(self):
+        """Return the segment table the index was built from"""
+        keys = np.empty((len(self.booking_counts), len(PREFERENCE_FLAGS) + 1), dtype=np.int64)
+        for flags, passenger_groups in self.groups.items():
+            for num_passengers, start, stop in passenger_groups:
+                keys[start:stop] = list(flags) + [num_passengers]
+
+        segments = pd.DataFrame(keys, columns=PREFERENCE_FLAGS + ['num_passengers'])
+        segments['length_of_stay'] = self.lengths_of_stay
+        segments['destination'] = self.destinations[self.destination_ids]
+        segments['count'] = self.booking_counts
+        segments['sum'] = self.rating_sums
+        return segments
+
+    @staticmethod
+    def merge_segments(segments, other):
+        """Add two segment tables, as if segment had been called on both sets of bookings at once"""
+        return pd.concat([segments, other], ignore_index=True).groupby(
+            PREFERENCE_FLAGS + ['num_passengers', 'length_of_stay', 'destination']
+        )[['count', 'sum']].sum().reset_index()
+
+    @classmethod
+    def from_segments(cls, segments, destinations):
+        """Build an index from a segment table instead of bookings"""
+        index = cls.__new__(cls)
+        index._set_segments(segments, destinations)
+        return index
+
+    def updated(self, data, destinations):
+        """Return a new index that also counts the bookings in data
+
+        Only segments are merged, so the cost depends on the number of segments and the
+        size of data, not on the number of bookings already indexed.
+        """
+        return self.from_segments(self.merge_segments(self.segments(), self.segment(data)), destinations)
+
+    def aggregate(self, user_preferences):
+        """Return per-destination booking counts and rating sums of bookings similar to user_preferences"""
+        flags = tuple(user_preferences.get(flag, 0) for flag in PREFERENCE_FLAGS)
+
+        slices = []
+        for num_passengers, start, stop in self.groups.get(flags, []):
+            if 'num_passengers' in user_preferences and not (
+                user_preferences['num_passengers'] - PASSENGER_WINDOW <= num_passengers <= user_preferences['num_passengers'] + PASSENGER_WINDOW
+            ):
+                continue
+
+            if 'length_of_stay' in user_preferences:
+                stays = self.lengths_of_stay[start:stop]
+                stop = start + np.searchsorted(stays, user_preferences['length_of_stay'] + STAY_WINDOW, side='right')
+                start = start + np.searchsorted(stays, user_preferences['length_of_stay'] - STAY_WINDOW, side='left')
+            slices.append(np.arange(start, stop))
+
+        rows = np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+        booking_counts = np.bincount(self.destination_ids[rows], weights=self.booking_counts[rows], minlength=len(self.destinations))
+        rating_sums = np.bincount(self.destination_ids[rows], weights=self.rating_sums[rows], minlength=len(self.destinations))
+        return booking_counts, rating_sums
+
+    def batch_aggregate(self, preferences):
+        """Return booking count and rating sum matrices with one row per user_preferences in preferences
+
+        Row i equals aggregate(preferences[i]). Profiles are grouped by extras flags, the
+        stay window of every profile in a group is resolved with one searchsorted call per
+        passenger group, and all slices are counted with a single bincount. num_passengers
+        and length_of_stay must be numbers.
+        """
+        by_flags = {}
+        for i, user_preferences in enumerate(preferences):
+            by_flags.setdefault(tuple(user_preferences.get(flag, 0) for flag in PREFERENCE_FLAGS), []).append(i)
+        # NaN marks a window the profile doesn't set, which every segment is inside
+        passengers, stays = (
+            np.array([user_preferences.get(key, np.nan) for user_preferences in preferences], dtype=float)
+            for key in ('num_passengers', 'length_of_stay')
+        )
+
+        profiles, starts, stops = [], [], []
+        for flags, members in by_flags.items():
+            members = np.array(members)
+            for num_passengers, start, stop in self.groups.get(flags, []):
+                inside = members[np.isnan(passengers[members]) | (
+                    (passengers[members] - PASSENGER_WINDOW <= num_passengers) & (num_passengers <= passengers[members] + PASSENGER_WINDOW)
+                )]
+                member_stays = stays[inside]
+                unset = np.isnan(member_stays)
+                group_stays = self.lengths_of_stay[start:stop]
+                profiles.append(inside)
+                starts.append(start + np.where(unset, 0, np.searchsorted(group_stays, member_stays - STAY_WINDOW, side='left')))
+                stops.append(start + np.where(unset, stop - start, np.searchsorted(group_stays, member_stays + STAY_WINDOW, side='right')))
+
+        # Expand every (profile, start, stop) slice into its rows, keeping aggregate's row order per profile
+        profiles, starts, stops = (np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64) for arrays in (profiles, starts, stops))
+        order = np.argsort(profiles, kind='stable')
+        profiles, starts, lengths = profiles[order], starts[order], np.maximum(stops[order] - starts[order], 0)
+        offsets = np.cumsum(lengths) - lengths
+        rows = np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+
+        n_destinations = len(self.destinations)
+        bins = np.repeat(profiles, lengths) * n_destinations + self.destination_ids[rows]
+        shape = (len(preferences), n_destinations)
+        booking_counts = np.bincount(bins, weights=self.booking_counts[rows], minlength=shape[0] * shape[1]).reshape(shape)
+        rating_sums = np.bincount(bins, weights=self.rating_sums[rows], minlength=shape[0] * shape[1]).reshape(shape)
+        return booking_counts, rating_sums
+
+    def recommendations(self, user_preferences, n_recommendations=10):
+        """Rank destinations among bookings similar to user_preferences"""
+        booking_counts, rating_sums = self.aggregate(user_preferences)
+        return rank_destinations(self.destinations, booking_counts, rating_sums)[:n_recommendations]
+
+    def batch_recommendations(self, preferences, n_recommendations=10):
+        """Return recommendations for each user_preferences in preferences, aggregated in one batch_aggregate call"""
+        booking_counts, rating_sums = self.batch_aggregate(preferences)
+        return [
+            rank_destinations(self.destinations, counts, sums)[:n_recommendations]
+            for counts, sums in zip(booking_counts, rating_sums)
+        ]
+
+
+def top_neighbors(similarities, n_neighbors, candidates=None):
+    """Return (positions, similarities) of the n_neighbors most similar columns of each row, most similar first
+
+    candidates[i, j] is the user position of similarities[i, j], the column itself by
+    default. Rows with fewer columns are padded with position -1 and similarity -inf.
+    """
+    k = min(n_neighbors, similarities.shape[1])
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k] if k > 0 else np.empty((len(similarities), 0), dtype=np.int64)
+    top_similarities = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_similarities, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_similarities = np.take_along_axis(top_similarities, order, axis=1)
+    if candidates is not None:
+        top = np.take_along_axis(candidates, top, axis=1)
+
+    if k < n_neighbors:
+        padding = ((0, 0), (0, n_neighbors - k))
+        top = np.pad(top, padding, constant_values=-1)
+        top_similarities = np.pad(top_similarities, padding, constant_values=-np.inf)
+    return top, top_similarities
+
+
+def normalize_rows(vectors):
+    """Scale each row to unit length, leaving all-zero rows at zero as cosine_similarity does"""
+    vectors = np.asarray(vectors, dtype=float)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class UserIndex:
+    """Inverted-file (IVF) index over normalized user rating vectors, for approximate cosine neighbors
+
+    Users are clustered into n_lists lists by spherical k-means. A query is only compared
+    with the users of the n_probe lists whose centroids are most similar to it, so it
+    costs about n_probe / n_lists of an exact search. Recall grows with n_probe, and
+    n_probe = n_lists is exact.
+    """
+
+    def __init__(self, ratings, n_lists, n_probe=ANN_PROBE, n_iter=10, sample_size=256, random_state=0):
+        vectors = normalize_rows(ratings)
+        self.n_probe = n_probe
+        rng = np.random.default_rng(random_state)
+        n_lists = max(1, min(n_lists, len(vectors)))
+
+        # Fit the centroids on sample_size users per list, then assign every user
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), n_lists * sample_size), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = (sample @ self.centroids.T).argmax(axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            # Lists left empty are reseeded with random users
+            empty = ~np.bincount(assignment, minlength=n_lists).astype(bool)
+            sums[empty] = sample[rng.choice(len(sample), empty.sum())]
+            self.centroids = normalize_rows(sums)
+
+        assignment = np.concatenate([
+            (vectors[start:start + 4096] @ self.centroids.T).argmax(axis=1) for start in range(0, len(vectors), 4096)
+        ]) if len(vectors) else np.empty(0, dtype=np.int64)
+        # Users are stored list by list, so that searching a list reads a contiguous slice
+        self.positions = np.argsort(assignment, kind='stable')
+        self.vectors = vectors[self.positions]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+
+    def search(self, queries, n_neighbors, n_probe=None, exclude=None):
+        """Return (positions, similarities) of the approximate n_neighbors most similar users of each query
+
+        Same layout as top_neighbors. exclude[i] is a user position left out of the results
+        of query i, such as the query's own position.
+        """
+        queries = normalize_rows(queries)
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        probes = top_neighbors(queries @ self.centroids.T, n_probe)[0]
+
+        top = np.full((len(queries), n_neighbors), -1, dtype=np.int64)
+        top_similarities = np.full(top.shape, -np.inf)
+        # Visit each probed list once, with all the queries probing it
+        order = np.argsort(probes, axis=None, kind='stable')
+        probed, starts = np.unique(probes.ravel()[order], return_index=True)
+        for probed, start, stop in zip(probed.tolist(), starts.tolist(), [*starts[1:].tolist(), len(order)]):
+            rows = order[start:stop] // n_probe
+            members = self.positions[self.indptr[probed]:self.indptr[probed + 1]]
+            if not len(members):
+                continue
+
+            similarities = queries[rows] @ self.vectors[self.indptr[probed]:self.indptr[probed + 1]].T
+            if exclude is not None:
+                similarities[exclude[rows, None] == members] = -np.inf
+            top[rows], top_similarities[rows] = top_neighbors(
+                np.hstack([top_similarities[rows], similarities]),
+                n_neighbors,
+                np.hstack([top[rows], np.broadcast_to(members, similarities.shape)])
+            )
+        return top, top_similarities
+
+
+class UserNeighbors:
+    """The n_neighbors most similar users of every user, stored CSR-style
+
+    Similarities are computed block_size users at a time, and only the top entries of
+    each block row are kept. Peak memory is O(block_size * users) and the stored
+    structure is O(users * n_neighbors), instead of the O(users^2) dense matrix.
+    Non-positive similarities are dropped since collaborative filtering ignores them.
+
+    With n_lists, neighbors are searched in a UserIndex of that many lists instead of
+    among all users, which trades some recall for roughly n_lists / ANN_PROBE less work.
+    """
+
+    def __init__(self, user_item_matrix, n_neighbors, block_size=1024, n_lists=None):
+        ratings = user_item_matrix.to_numpy()
+        n_users = len(ratings)
+        n_neighbors = min(n_neighbors, n_users - 1)
+        index = UserIndex(ratings, n_lists) if n_lists and n_neighbors > 0 else None
+
+        blocks = []
+        for start in range(0, n_users if n_neighbors > 0 else 0, block_size):
+            if index is not None:
+                # a user is not its own neighbor
+                blocks.append(index.search(ratings[start:start + block_size], n_neighbors, exclude=np.arange(start, min(start + block_size, n_users))))
+                continue
+            block = cosine_similarity(ratings[start:start + block_size], ratings)
+            rows = np.arange(len(block))
+            block[rows, start + rows] = -np.inf  # a user is not its own neighbor
+            blocks.append(top_neighbors(block, n_neighbors))
+
+        self._set_neighbors(user_item_matrix.index.to_numpy(), n_neighbors, blocks)
+
+    def _set_neighbors(self, user_ids, n_neighbors, blocks):
+        """Store (positions, similarities) row blocks from top_neighbors as CSR arrays"""
+        self.user_ids = user_ids
+        self.n_neighbors = n_neighbors
+        self.indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        indices, similarities = [], []
+
+        row = 0
+        for top, top_similarities in blocks:
+            keep = top_similarities > 0
+            indices.append(top[keep].astype(np.int32))
+            similarities.append(top_similarities[keep])
+            self.indptr[row + 1:row + len(top) + 1] = keep.sum(axis=1)
+            row += len(top)
+
+        self.indptr = np.cumsum(self.indptr)
+        self.indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int32)
+        self.similarities = np.concatenate(similarities) if similarities else np.empty(0)
+        self.positions = {user_id: i for i, user_id in enumerate(self.user_ids)}
+
+    def updated(self, user_item_matrix, touched_positions, positions, n_neighbors):
+        """Return the neighbors after the ratings of the users at touched_positions changed
+
+        positions maps every stored user to its row in the new user_item_matrix. Touched
+        users get their neighbors recomputed; every other user keeps its stored
+        neighbors, re-scored against the touched users. Similarities between two
+        untouched users are not recomputed, so this costs O(touched users * users)
+        instead of O(users^2).
+        """
+        ratings = user_item_matrix.to_numpy()
+        n_users = len(ratings)
+        n_neighbors = min(n_neighbors, n_users - 1)
+
+        touched_similarities = cosine_similarity(ratings[touched_positions], ratings)
+        touched_similarities[np.arange(len(touched_positions)), touched_positions] = -np.inf
+
+        # Stored neighbors, one padded row per user, dropping the touched users' stale entries
+        rows = np.repeat(np.arange(len(self.user_ids)), np.diff(self.indptr))
+        slots = np.arange(len(self.indices)) - self.indptr[rows]
+        candidates = np.full((n_users, max(self.n_neighbors, 0)), -1, dtype=np.int64)
+        candidate_similarities = np.full(candidates.shape, -np.inf)
+        candidates[positions[rows], slots] = positions[self.indices]
+        candidate_similarities[positions[rows], slots] = self.similarities
+
+        touched = np.zeros(n_users, dtype=bool)
+        touched[touched_positions] = True
+        candidate_similarities[(candidates >= 0) & touched[candidates]] = -np.inf
+
+        candidates = np.hstack([candidates, np.broadcast_to(touched_positions, (n_users, len(touched_positions)))])
+        candidate_similarities = np.hstack([candidate_similarities, touched_similarities.T])
+        top, top_similarities = top_neighbors(candidate_similarities, n_neighbors, candidates)
+
+        top[touched_positions], top_similarities[touched_positions] = top_neighbors(touched_similarities, n_neighbors)
+
+        neighbors = self.__class__.__new__(self.__class__)
+        neighbors._set_neighbors(user_item_matrix.index.to_numpy(), n_neighbors, [(top, top_similarities)])
+        return neighbors
+
+    def to_artifact(self):
+        """Return (arrays, metadata) to store the neighbors in an artifact"""
+        arrays = {'indptr': self.indptr, 'indices': self.indices, 'similarities': self.similarities}
+        return arrays, {'n_neighbors': self.n_neighbors}
+
+    @classmethod
+    def from_artifact(cls, arrays, metadata, user_ids):
+        """Rebuild neighbors from to_artifact output without recomputing similarities"""
+        neighbors = cls.__new__(cls)
+        neighbors.user_ids = user_ids
+        neighbors.n_neighbors = metadata['n_neighbors']
+        neighbors.indptr = arrays['indptr']
+        neighbors.indices = arrays['indices']
+        neighbors.similarities = arrays['similarities']
+        neighbors.positions = {user_id: i for i, user_id in enumerate(user_ids)}
+        return neighbors
+
+    def neighbor_positions(self, position, n=None):
+        """Return (row positions, similarities) of the neighbors of the user at row position"""
+        start, stop = self.indptr[position], self.indptr[position + 1]
+        if n is not None:
+            stop = min(stop, start + n)
+        return self.indices[start:stop], self.similarities[start:stop]
+
+    def neighbors(self, user_id, n=None):
+        """Return [(similar_user_id, similarity), ...] for user_id, most similar first"""
+        positions, similarities = self.neighbor_positions(self.positions[user_id], n)
+        return list(zip(self.user_ids[positions], similarities))
+
+
+class LatentFactors:
+    """Truncated-SVD factors of the user-item matrix, used instead of user-user similarities
+
+    The ratings R are approximated by R V V^T, where V holds the n_factors top right
+    singular vectors of R. Destinations keep V as their factors and users R V, so scoring
+    a user is one dot product with the destination factors, and storage is
+    O((users + destinations) * n_factors) instead of O(users^2). V comes from the
+    eigenvectors of the destinations x destinations matrix R^T R, so fitting never holds
+    more than the ratings themselves.
+    """
+
+    def __init__(self, user_item_matrix, n_factors):
+        ratings = user_item_matrix.to_numpy()
+        self.n_factors = max(0, min(n_factors, ratings.shape[1]))
+        # eigh returns eigenvalues in ascending order
+        _, eigenvectors = np.linalg.eigh(ratings.T @ ratings)
+        self.destination_factors = np.ascontiguousarray(eigenvectors[:, ::-1][:, :self.n_factors])
+        self.user_factors = ratings @ self.destination_factors
+
+    def updated(self, user_item_matrix, destinations):
+        """Return factors for a changed user-item matrix, whose trained destinations were `destinations`
+
+        Every user is projected again onto the trained destination factors, which stay
+        fixed until the next full retrain; new destinations get zero factors until then.
+        """
+        factors = self.__class__.__new__(self.__class__)
+        factors.n_factors = self.n_factors
+        factors.destination_factors = expand_labels(np.asarray(self.destination_factors), destinations, user_item_matrix.columns)
+        factors.user_factors = user_item_matrix.to_numpy() @ factors.destination_factors
+        return factors
+
+    def to_artifact(self):
+        """Return (arrays, metadata) to store the factors in an artifact"""
+        arrays = {'user_factors': self.user_factors, 'destination_factors': self.destination_factors}
+        return arrays, {'n_factors': self.n_factors}
+
+    @classmethod
+    def from_artifact(cls, arrays, metadata):
+        """Rebuild factors from to_artifact output"""
+        factors = cls.__new__(cls)
+        factors.n_factors = metadata['n_factors']
+        factors.user_factors = arrays['user_factors']
+        factors.destination_factors = arrays['destination_factors']
+        return factors
+
+    def scores(self, positions):
+        """Return the predicted rating of every destination for the users at row positions"""
+        return self.user_factors[positions] @ self.destination_factors.T
+
+
+def calculate_user_contexts(data):
+    """Return {user_id: (most common season, most common trip purpose)} over each user's bookings
+
+    Ties go to the first value in sorted order, as with Series.mode()[0].
+    """
+    modes = {}
+    for column in ['season', 'trip_purpose']:
+        counts = data.groupby(['user_id', column], observed=True).size()
+        modes[column] = {user_id: value for user_id, value in counts.groupby(level='user_id').idxmax()}
+
+    return {
+        user_id: (modes['season'].get(user_id, DEFAULT_SEASON), modes['trip_purpose'].get(user_id, DEFAULT_TRIP_TYPE))
+        for user_id in data['user_id'].unique()
+    }
+
+
+def merge_labels(labels, values):
+    """Extend labels with the unseen entries of values, in the order groupby would sort them"""
+    seen = set(labels)
+    unseen = [value for value in pd.unique(values.dropna()) if value not in seen]
+    if not unseen:
+        return labels
+    seen.update(unseen)
+    if isinstance(values.dtype, pd.CategoricalDtype) and seen.issubset(values.cat.categories):
+        return [value for value in values.cat.categories if value in seen]
+    return sorted(labels + unseen)
+
+
+def expand_labels(array, labels, new_labels, axis=0):
+    """Return array, indexed by labels along axis, indexed by the superset new_labels instead, with zeros for new labels"""
+    if len(new_labels) == len(labels):
+        return array
+    shape = list(array.shape)
+    shape[axis] = len(new_labels)
+    expanded = np.zeros(shape, dtype=array.dtype)
+    index = [slice(None)] * array.ndim
+    index[axis] = pd.Index(new_labels).get_indexer(labels)
+    expanded[tuple(index)] = array
+    return expanded
+
+
+class BookingStatistics:
+    """Running aggregates of the training bookings, kept so a model can be updated incrementally
+
+    These are the sufficient statistics of everything FlightRecommendationModel derives
+    from bookings: per-destination totals, the distinct ratings of every (user,
+    destination) pair that the user-item matrix averages, booking counts and rating
+    sums per context value, and per-user season and trip purpose counts. Folding in a
+    batch aggregates only that batch, so the cost grows with the batch, not the history.
+    """
+
+    def __init__(self, data=None):
+        self.destinations = []
+        self.user_ids = []
+        self.booking_counts = np.zeros(0, dtype=np.int64)
+        self.rating_sums = np.zeros(0)
+        self.completed_bookings = np.zeros(0, dtype=np.int64)
+        self.unique_users = np.zeros(0, dtype=np.int64)
+        # Distinct (user, destination, rating) triples, sorted by user
+        self.pair_users = np.zeros(0, dtype=np.int64)
+        self.pair_destinations = np.zeros(0, dtype=np.int64)
+        self.pair_ratings = np.zeros(0)
+        # context -> values, and (values x destinations) booking counts and rating sums
+        self.context_values = {context: [] for context in RANKING_CONTEXTS}
+        self.context_counts = {context: np.zeros((0, 0), dtype=np.int64) for context in RANKING_CONTEXTS}
+        self.context_sums = {context: np.zeros((0, 0)) for context in RANKING_CONTEXTS}
+        # column -> labels, and (users x labels) booking counts
+        self.user_context_labels = {column: [] for column in ['season', 'trip_purpose']}
+        self.user_context_counts = {column: np.zeros((0, 0), dtype=np.int64) for column in ['season', 'trip_purpose']}
+
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        """Fold a batch of prepared bookings into the statistics
+
+        Returns the mean distinct rating of every (user, destination) pair of the users
+        in data, as a Series indexed by (user_id, destination position).
+        """
+        self._expand_destinations(merge_labels(self.destinations, data['destination']))
+        self._expand_users(merge_labels(self.user_ids, data['user_id']))
+
+        # Per-destination totals
+        destination_ids = pd.Index(self.destinations).get_indexer(data['destination'])
+        n_destinations = len(self.destinations)
+        self.booking_counts = self.booking_counts + np.bincount(destination_ids, minlength=n_destinations)
+        self.rating_sums = self.rating_sums + np.bincount(destination_ids, weights=data['rating'], minlength=n_destinations)
+        self.completed_bookings = self.completed_bookings + np.bincount(
+            destination_ids, weights=data['booking_complete'], minlength=n_destinations
+        ).astype(np.int64)
+
+        # Distinct ratings of the touched users, old and new
+        touched_users = np.unique(data['user_id'].to_numpy())
+        starts = np.searchsorted(self.pair_users, touched_users, side='left')
+        stops = np.searchsorted(self.pair_users, touched_users, side='right')
+        old_rows = np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)] or [np.zeros(0, dtype=np.int64)])
+        old_pairs = pd.DataFrame({
+            'user_id': self.pair_users[old_rows],
+            'destination': self.pair_destinations[old_rows],
+            'rating': self.pair_ratings[old_rows]
+        })
+        pairs = pd.concat([
+            old_pairs,
+            pd.DataFrame({'user_id': data['user_id'].to_numpy(), 'destination': destination_ids, 'rating': data['rating'].to_numpy()})
+        ], ignore_index=True).drop_duplicates()
+
+        # Each (user, destination) pair counts once towards unique_users
+        old_destinations = old_pairs.drop_duplicates(['user_id', 'destination'])['destination']
+        new_destinations = pairs.drop_duplicates(['user_id', 'destination'])['destination']
+        self.unique_users = (
+            self.unique_users
+            + np.bincount(new_destinations, minlength=n_destinations)
+            - np.bincount(old_destinations, minlength=n_destinations)
+        )
+
+        keep = np.ones(len(self.pair_users), dtype=bool)
+        keep[old_rows] = False
+        users = np.concatenate([self.pair_users[keep], pairs['user_id'].to_numpy()])
+        order = np.argsort(users, kind='stable')
+        self.pair_users = users[order]
+        self.pair_destinations = np.concatenate([self.pair_destinations[keep], pairs['destination'].to_numpy()])[order]
+        self.pair_ratings = np.concatenate([self.pair_ratings[keep], pairs['rating'].to_numpy()])[order]
+
+        # Booking counts and rating sums per context value
+        for context in RANKING_CONTEXTS:
+            values = merge_labels(self.context_values[context], data[context])
+            self.context_counts[context] = expand_labels(self.context_counts[context], self.context_values[context], values).copy()
+            self.context_sums[context] = expand_labels(self.context_sums[context], self.context_values[context], values).copy()
+            self.context_values[context] = values
+
+            aggregates = data.groupby([context, 'destination'], observed=True)['rating'].agg(['count', 'sum'])
+            rows = pd.Index(values).get_indexer(aggregates.index.get_level_values(0))
+            columns = pd.Index(self.destinations).get_indexer(aggregates.index.get_level_values(1))
+            np.add.at(self.context_counts[context], (rows, columns), aggregates['count'].to_numpy())
+            np.add.at(self.context_sums[context], (rows, columns), aggregates['sum'].to_numpy())
+
+        # Season and trip purpose counts per user
+        for column in self.user_context_labels:
+            labels = merge_labels(self.user_context_labels[column], data[column])
+            self.user_context_counts[column] = expand_labels(
+                self.user_context_counts[column], self.user_context_labels[column], labels, axis=1
+            ).copy()
+            self.user_context_labels[column] = labels
+
+            counts = data.groupby(['user_id', column], observed=True).size()
+            rows = pd.Index(self.user_ids).get_indexer(counts.index.get_level_values(0))
+            columns = pd.Index(labels).get_indexer(counts.index.get_level_values(1))
+            np.add.at(self.user_context_counts[column], (rows, columns), counts.to_numpy())
+
+        return pairs.groupby(['user_id', 'destination'])['rating'].mean()
+
+    def to_artifact(self):
+        """Return (arrays, metadata) to store the statistics in an artifact"""
+        arrays = {
+            'user_ids': np.array(self.user_ids, dtype=np.int64),
+            'booking_counts': self.booking_counts,
+            'rating_sums': self.rating_sums,
+            'completed_bookings': self.completed_bookings,
+            'unique_users': self.unique_users,
+            'pair_users': self.pair_users,
+            'pair_destinations': self.pair_destinations,
+            'pair_ratings': self.pair_ratings
+        }
+        for context in RANKING_CONTEXTS:
+            arrays[f'{context}.counts'] = self.context_counts[context]
+            arrays[f'{context}.sums'] = self.context_sums[context]
+        for column in self.user_context_counts:
+            arrays[f'{column}.user_counts'] = self.user_context_counts[column]
+
+        metadata = {
+            'destinations': list(self.destinations),
+            'context_values': {context: [to_native(value) for value in values] for context, values in self.context_values.items()},
+            'user_context_labels': self.user_context_labels
+        }
+        return arrays, metadata
+
+    @classmethod
+    def from_artifact(cls, arrays, metadata):
+        """Rebuild statistics from to_artifact output"""
+        stats = cls()
+        stats.destinations = metadata['destinations']
+        stats.user_ids = arrays['user_ids'].tolist()
+        for name in ['booking_counts', 'rating_sums', 'completed_bookings', 'unique_users', 'pair_users', 'pair_destinations', 'pair_ratings']:
+            setattr(stats, name, arrays[name])
+        stats.context_values = metadata['context_values']
+        stats.context_counts = {context: arrays[f'{context}.counts'] for context in RANKING_CONTEXTS}
+        stats.context_sums = {context: arrays[f'{context}.sums'] for context in RANKING_CONTEXTS}
+        stats.user_context_labels = metadata['user_context_labels']
+        stats.user_context_counts = {column: arrays[f'{column}.user_counts'] for column in stats.user_context_labels}
+        return stats
+
+    def _expand_destinations(self, destinations):
+        """Make room for newly seen destinations in every per-destination statistic"""
+        if len(destinations) == len(self.destinations):
+            return
+        positions = pd.Index(destinations).get_indexer(self.destinations)
+        self.pair_destinations = positions[self.pair_destinations] if len(self.destinations) else self.pair_destinations
+        for name in ['booking_counts', 'rating_sums', 'completed_bookings', 'unique_users']:
+            setattr(self, name, expand_labels(getattr(self, name), self.destinations, destinations))
+        for context in RANKING_CONTEXTS:
+            self.context_counts[context] = expand_labels(self.context_counts[context], self.destinations, destinations, axis=1)
+            self.context_sums[context] = expand_labels(self.context_sums[context], self.destinations, destinations, axis=1)
+        self.destinations = destinations
+
+    def _expand_users(self, user_ids):
+        """Make room for newly seen users in every per-user statistic"""
+        for column in self.user_context_counts:
+            self.user_context_counts[column] = expand_labels(self.user_context_counts[column], self.user_ids, user_ids)
+        self.user_ids = user_ids
+
+    def destination_popularity(self):
+        """Return destination popularity as calculate_destination_popularity would over every booking seen"""
+        booked = self.booking_counts > 0
+        destination_popularity = pd.DataFrame({
+            'destination': np.array(self.destinations, dtype=object),
+            'booking_count': self.booking_counts,
+            'avg_rating': self.rating_sums / np.where(booked, self.booking_counts, 1),
+            'completed_bookings': self.completed_bookings,
+            'unique_users': self.unique_users
+        })
+        return score_destination_popularity(destination_popularity[booked])
+
+    def context_ranking(self, context, value, destinations):
+        """Rank destinations for one context value, as calculate_context_rankings would"""
+        row = self.context_values[context].index(value)
+        return rank_destinations(destinations, self.context_counts[context][row], self.context_sums[context][row])
+
+    def user_contexts(self, user_ids):
+        """Return {user_id: (most common season, most common trip purpose)}, as calculate_user_contexts would"""
+        rows = pd.Index(self.user_ids).get_indexer(user_ids)
+        modes = []
+        for column, default in [('season', DEFAULT_SEASON), ('trip_purpose', DEFAULT_TRIP_TYPE)]:
+            counts = self.user_context_counts[column][rows]
+            labels = np.array(self.user_context_labels[column] + [default], dtype=object)
+            # argmax picks the first of tied labels, like idxmax; users without any label get the default
+            most_common = counts.argmax(axis=1) if counts.shape[1] else np.zeros(len(rows), dtype=np.int64)
+            modes.append(labels[np.where(counts.any(axis=1), most_common, len(labels) - 1)])
+        return {user_id: (season, trip_type) for user_id, season, trip_type in zip(user_ids, *modes)}
+
+
+def build_destination_info(destination_popularity):
+    """Popularity metrics keyed by destination code, for describing recommendations"""
+    return {
+        record.pop('destination'): record
+        for record in destination_popularity[['destination', 'popularity_score', 'booking_count', 'avg_rating']].to_dict(orient='records')
+    }
+
+
+def build_destination_mapping(destination_popularity):
+    """Create a destination mapping dictionary"""
+    return {
+        'id': {i: dest for i, dest in enumerate(destination_popularity['destination'])},
+        'destination': {dest: i for i, dest in enumerate(destination_popularity['destination'])}
+    }
+
+
+def rank_scores(model, ranked_destinations, n):
+    """Score the first n ranked destinations n - rank, as a vector over destination_mapping ids"""
+    scores = np.zeros(len(model.destination_mapping['id']))
+    ids = [model.destination_mapping['destination'][dest] for dest in ranked_destinations[:n]]
+    scores[ids] = np.arange(n, n - len(ids), -1)
+    return scores
+
+
+def collaborative_source(model, request, n):
+    """Score destinations liked by similar users, reusing request['cf_recs'] when they were computed in a batch"""
+    cf_recs = request.get('cf_recs')
+    if cf_recs is None:
+        cf_recs = model.collaborative_filtering_recommendations(request['user_id'], n)
+    return rank_scores(model, cf_recs, n)
+
+
+def popularity_source(model, request, n):
+    """Score destinations by global popularity"""
+    # destination_mapping ids are already in popularity order
+    scores = np.zeros(len(model.destination_mapping['id']))
+    k = min(n, len(scores))
+    scores[:k] = np.arange(n, n - k, -1)
+    return scores
+
+
+def seasonal_source(model, request, n):
+    """Score destinations popular in request['season']"""
+    return rank_scores(model, model.seasonal_recommendations(request['season'], n), n)
+
+
+def trip_type_source(model, request, n):
+    """Score destinations popular for request['trip_type']"""
+    return rank_scores(model, model.trip_type_recommendations(request['trip_type'], n), n)
+
+
+def origin_source(model, request, n):
+    """Score destinations popular from request['origin'], if any"""
+    origin = request.get('origin')
+    return rank_scores(model, model.origin_recommendations(origin, n) if origin else [], n)
+
+
+def preference_source(model, request, n):
+    """Score destinations popular among bookings similar to request['user_preferences'], reusing request['preference_recs'] when they were computed in a batch"""
+    preference_recs = request.get('preference_recs')
+    if preference_recs is None:
+        preference_recs = model.preference_index.recommendations(request['user_preferences'], n)
+    return rank_scores(model, preference_recs, n)
+
+
+# Sources blended by FlightRecommendationModel.blend_sources. A source is called as
+# source(model, request, n) and returns a score vector over destination_mapping ids,
+# higher is better; the built-in ones score their top n destinations n - rank.
+RECOMMENDATION_SOURCES = {
+    'collaborative': collaborative_source,
+    'popularity': popularity_source,
+    'seasonal': seasonal_source,
+    'trip_type': trip_type_source,
+    'origin': origin_source,
+    'preferences': preference_source
+}
+# Sources doing enough work per request to be worth running on a thread pool
+CONCURRENT_SOURCES = {'collaborative', 'preferences'}
+
+# Default source weights; ties go to the destination ranked first by the earliest source listed
+HYBRID_WEIGHTS = {'collaborative': 0.4, 'popularity': 0.2, 'seasonal': 0.2, 'trip_type': 0.2}
+NEW_USER_WEIGHTS = {'popularity': 0.2, 'seasonal': 0.2, 'trip_type': 0.2, 'origin': 0.2, 'preferences': 0.2}
+
+
+def register_source(name, source, concurrent=False):
+    """Make source(model, request, n) available to blend_sources under name"""
+    RECOMMENDATION_SOURCES[name] = source
+    if concurrent:
+        CONCURRENT_SOURCES.add(name)
+    else:
+        CONCURRENT_SOURCES.discard(name)
+
+
+def resolve_weights(default_weights, weights=None):
+    """Override default_weights with per-request weights, checking that every source exists"""
+    weights = {**default_weights, **(weights or {})}
+    unknown = sorted(set(weights) - set(RECOMMENDATION_SOURCES))
+    if unknown:
+        raise ValueError(f"Unknown recommendation sources: {', '.join(unknown)}")
+    return weights
 
-print("\nDestination mapping sample:")
-print({k: destination_mapping['id'][k] for k in list(destination_mapping['id'])[:5]})
 
 # Create a class for the recommendation model
 class FlightRecommendationModel:
-    def __init__(self, user_item_matrix, destination_popularity, destination_mapping):
+    def __init__(self, user_item_matrix, destination_popularity, destination_mapping, data, similarity_neighbors=None,
+                 recommendation_cache_size=10000, similarity_lists=None, n_factors=None):
         self.user_item_matrix = user_item_matrix
         self.destination_popularity = destination_popularity
         self.destination_mapping = destination_mapping
+        self.destination_info = build_destination_info(destination_popularity)
+        self.destinations = np.sort(data['destination'].unique())
+        self.context_rankings = calculate_context_rankings(data, self.destinations)
+        self.preference_index = PreferenceIndex(data, self.destinations)
+        self.user_contexts = calculate_user_contexts(data)
+        # Final hybrid recommendations per (user_id, season, trip_type, top_k, weights)
+        self.recommendation_cache = LRUCache(recommendation_cache_size)
+        # Keep only the top similarity_neighbors per user instead of the dense users x users matrix
+        self.similarity_neighbors = similarity_neighbors
+        # Approximate those neighbors with a UserIndex of this many lists instead of comparing every pair of users
+        self.similarity_lists = similarity_lists
+        # Replace user-user similarities with this many latent factors per user and destination
+        self.n_factors = n_factors
         self.user_similarity = None
+        self.user_neighbors = None
+        self.latent_factors = None
+        self.artifact_version = ARTIFACT_VERSION
+        self.user_id_scheme = USER_ID_SCHEME
+        self.version = None
+        # Set by fit_model; needed by partial_fit
+        self.booking_statistics = None
 
         # Calculate user similarity matrix
         with Timer() as similarity_time:
             self.calculate_user_similarity()
         print(f"User similarity calculation completed in {similarity_time.interval:.2f} seconds")
 
+    @classmethod
+    def from_statistics(cls, booking_statistics, preference_segments, similarity_neighbors=None,
+                        recommendation_cache_size=10000, similarity_lists=None, n_factors=None):
+        """Build a model from aggregated bookings, as fit_model would from the bookings themselves
+
+        Lets training stream the bookings through BookingStatistics and
+        PreferenceIndex.segment chunk by chunk instead of holding them all in memory.
+        """
+        stats = booking_statistics
+        model = cls.__new__(cls)
+        model.destination_popularity = stats.destination_popularity()
+        model.destination_mapping = build_destination_mapping(model.destination_popularity)
+        model.destination_info = build_destination_info(model.destination_popularity)
+        model.destinations = np.array(stats.destinations, dtype=object)
+
+        # The user-item matrix averages the distinct ratings of each (user, destination)
+        # pair, adjusted by the destination's popularity as in build_user_item_matrix
+        user_ids = pd.Index(stats.user_ids, name='user_id')
+        popularity = model.destination_popularity.set_index('destination')['popularity_score'].reindex(model.destinations).to_numpy()
+        pair_ratings = pd.DataFrame({
+            'user_id': stats.pair_users, 'destination': stats.pair_destinations, 'rating': stats.pair_ratings
+        }).groupby(['user_id', 'destination'])['rating'].mean()
+        columns = pair_ratings.index.get_level_values('destination').to_numpy()
+        ratings = np.zeros((len(user_ids), len(model.destinations)))
+        ratings[user_ids.get_indexer(pair_ratings.index.get_level_values('user_id')), columns] = (
+            pair_ratings.to_numpy() * 0.8 + popularity[columns] * 0.2
+        )
+        model.user_item_matrix = pd.DataFrame(ratings, index=user_ids, columns=pd.Index(model.destinations, name='destination'))
+
+        model.context_rankings = {
+            context: {value: stats.context_ranking(context, value, model.destinations) for value in stats.context_values[context]}
+            for context in RANKING_CONTEXTS
+        }
+        model.preference_index = PreferenceIndex.from_segments(preference_segments, model.destinations)
+        model.user_contexts = stats.user_contexts(stats.user_ids)
+        model.recommendation_cache = LRUCache(recommendation_cache_size)
+        model.similarity_neighbors = similarity_neighbors
+        model.similarity_lists = similarity_lists
+        model.n_factors = n_factors
+        model.user_similarity = None
+        model.user_neighbors = None
+        model.latent_factors = None
+        model.artifact_version = ARTIFACT_VERSION
+        model.user_id_scheme = USER_ID_SCHEME
+        model.version = None
+        model.booking_statistics = stats
+
+        with Timer() as similarity_time:
+            model.calculate_user_similarity()
+        print(f"User similarity calculation completed in {similarity_time.interval:.2f} seconds")
+        return model
+
     def calculate_user_similarity(self):
         """Calculate similarity between users"""
+        if self.n_factors:
+            self.latent_factors = LatentFactors(self.user_item_matrix, self.n_factors)
+            return
+
+        if self.similarity_neighbors:
+            self.user_neighbors = UserNeighbors(self.user_item_matrix, self.similarity_neighbors, n_lists=self.similarity_lists)
+            return
+
         # Calculate cosine similarity between users
         user_similarity = cosine_similarity(self.user_item_matrix)
         self.user_similarity = pd.DataFrame(
@@ -179,45 +1148,330 @@ class FlightRecommendationModel:
             columns=self.user_item_matrix.index
         )
 
-    def collaborative_filtering_recommendations(self, user_id, n_recommendations=10):
+    def partial_fit(self, data):
+        """Fold a batch of new prepared bookings into a model trained by fit_model, without retraining
+
+        Destination popularity, the user-item matrix entries of the batch's users and
+        destinations, the context rankings and user contexts the batch touches and the
+        preference index all end up as a full retrain on old plus new bookings would
+        leave them. Similarities are recomputed for every user whose ratings changed:
+        the users in the batch and the users who rated a destination whose popularity
+        the batch shifted. Other users' ratings are unchanged, so the similarities
+        between two of them already match a full retrain. Neighbor lists of unchanged
+        users are re-scored against the changed users only, so a slot freed by a changed
+        user isn't refilled from users outside the stored list. A factor model projects
+        every user onto its trained destination factors again.
+        """
+        if self.booking_statistics is None:
+            raise ValueError("This model has no booking statistics to update. Retrain it with `python model.py`.")
+
+        old_user_ids = self.user_item_matrix.index
+        old_destinations = self.user_item_matrix.columns
+        old_popularity = self.destination_popularity.set_index('destination')['popularity_score']
+
+        pair_ratings = self.booking_statistics.update(data)
+        stats = self.booking_statistics
+
+        self.destinations = np.array(stats.destinations, dtype=object)
+        self.destination_popularity = stats.destination_popularity()
+        self.destination_mapping = build_destination_mapping(self.destination_popularity)
+        self.destination_info = build_destination_info(self.destination_popularity)
+
+        # User-item matrix: every rating is shifted by a change in its destination's popularity,
+        # and the touched (user, destination) pairs are averaged again
+        user_ids = pd.Index(stats.user_ids, name='user_id')
+        destinations = pd.Index(self.destinations, name='destination')
+        ratings = expand_labels(self.user_item_matrix.to_numpy(), old_user_ids, user_ids)
+        ratings = expand_labels(ratings, old_destinations, destinations, axis=1)
+        ratings = np.array(ratings, dtype=float)  # writable, even if the model was memory-mapped
+
+        popularity = self.destination_popularity.set_index('destination')['popularity_score'].reindex(destinations).to_numpy()
+        touched_destinations = destinations.get_indexer(pd.unique(data['destination']))
+        shift = 0.2 * (popularity[touched_destinations] - old_popularity.reindex(destinations[touched_destinations], fill_value=0).to_numpy())
+        shifted_users = (ratings[:, touched_destinations[shift != 0]] > 0).any(axis=1)
+        ratings[:, touched_destinations] += np.where(ratings[:, touched_destinations] > 0, shift, 0.0)
+
+        rows = user_ids.get_indexer(pair_ratings.index.get_level_values('user_id'))
+        columns = pair_ratings.index.get_level_values('destination').to_numpy()
+        ratings[rows, columns] = pair_ratings.to_numpy() * 0.8 + popularity[columns] * 0.2
+        self.user_item_matrix = pd.DataFrame(ratings, index=user_ids, columns=destinations, copy=False)
+
+        # Context rankings and user contexts, for the values and users in the batch
+        for context in RANKING_CONTEXTS:
+            for value in pd.unique(data[context].dropna()):
+                self.context_rankings[context][value] = stats.context_ranking(context, value, self.destinations)
+
+        touched_users = pd.unique(data['user_id'])
+        self.user_contexts.update(stats.user_contexts(touched_users))
+        self.preference_index = self.preference_index.updated(data, self.destinations)
+
+        # Similarities of the users whose ratings changed
+        changed = shifted_users
+        changed[user_ids.get_indexer(touched_users)] = True
+        touched_positions = np.flatnonzero(changed)
+        positions = user_ids.get_indexer(old_user_ids)
+        if self.latent_factors is not None:
+            self.latent_factors = self.latent_factors.updated(self.user_item_matrix, old_destinations)
+        elif self.user_neighbors is not None:
+            self.user_neighbors = self.user_neighbors.updated(self.user_item_matrix, touched_positions, positions, self.similarity_neighbors)
+        else:
+            similarity = self.user_similarity.to_numpy()
+            if len(user_ids) != len(old_user_ids) or not similarity.flags.writeable:
+                similarity = np.zeros((len(user_ids), len(user_ids)))
+                similarity[np.ix_(positions, positions)] = self.user_similarity.to_numpy()
+            touched_similarity = cosine_similarity(ratings[touched_positions], ratings)
+            similarity[touched_positions] = touched_similarity
+            similarity[:, touched_positions] = touched_similarity.T
+            self.user_similarity = pd.DataFrame(similarity, index=user_ids, columns=user_ids, copy=False)
+
+        self.recommendation_cache.clear()
+        return self
+
+    def to_artifact(self):
+        """Return (arrays, metadata) describing the model for an ArtifactStore
+
+        Everything large goes into arrays, which load memory-mapped. The metadata
+        holds labels and small lookup tables and must be JSON-serializable.
+        """
+        arrays = {
+            'user_item_matrix': self.user_item_matrix.to_numpy(),
+            'user_ids': self.user_item_matrix.index.to_numpy(),
+            'destination_popularity.index': self.destination_popularity.index.to_numpy()
+        }
+        metadata = {
+            'artifact_version': self.artifact_version,
+            'user_id_scheme': self.user_id_scheme,
+            'user_item_columns': self.user_item_matrix.columns.tolist(),
+            'destination_popularity_columns': self.destination_popularity.columns.tolist(),
+            'destinations': self.destinations.tolist(),
+            'context_rankings': self.context_rankings,
+            'similarity_neighbors': self.similarity_neighbors,
+            'similarity_lists': self.similarity_lists,
+            'n_factors': self.n_factors,
+            'recommendation_cache_size': self.recommendation_cache.maxsize
+        }
+
+        for column in self.destination_popularity.columns:
+            values = self.destination_popularity[column]
+            if values.dtype == object:
+                metadata[f'destination_popularity.{column}'] = values.tolist()
+            else:
+                arrays[f'destination_popularity.{column}'] = values.to_numpy()
+
+        season_labels = sorted({season for season, _ in self.user_contexts.values()})
+        trip_type_labels = sorted({trip_type for _, trip_type in self.user_contexts.values()})
+        arrays['user_contexts.user_ids'] = np.array(list(self.user_contexts), dtype=np.int64)
+        arrays['user_contexts.seasons'] = np.array([season_labels.index(season) for season, _ in self.user_contexts.values()], dtype=np.int8)
+        arrays['user_contexts.trip_types'] = np.array([trip_type_labels.index(trip_type) for _, trip_type in self.user_contexts.values()], dtype=np.int8)
+        metadata['user_contexts.season_labels'] = season_labels
+        metadata['user_contexts.trip_type_labels'] = trip_type_labels
+
+        index_arrays, metadata['preference_index'] = self.preference_index.to_artifact()
+        arrays.update({f'preference_index.{key}': value for key, value in index_arrays.items()})
+
+        if self.booking_statistics is not None:
+            stats_arrays, metadata['booking_statistics'] = self.booking_statistics.to_artifact()
+            arrays.update({f'booking_statistics.{key}': value for key, value in stats_arrays.items()})
+
+        if self.latent_factors is not None:
+            factor_arrays, metadata['latent_factors'] = self.latent_factors.to_artifact()
+            arrays.update({f'latent_factors.{key}': value for key, value in factor_arrays.items()})
+        elif self.user_neighbors is not None:
+            neighbor_arrays, metadata['user_neighbors'] = self.user_neighbors.to_artifact()
+            arrays.update({f'user_neighbors.{key}': value for key, value in neighbor_arrays.items()})
+        else:
+            arrays['user_similarity'] = self.user_similarity.to_numpy()
+
+        return arrays, metadata
+
+    @classmethod
+    def from_artifact(cls, arrays, metadata, version=None):
+        """Rebuild a model from to_artifact output, keeping the arrays as they are (e.g. memory-mapped)"""
+        if metadata.get('artifact_version') != ARTIFACT_VERSION:
+            raise ValueError(
+                f"Artifact version {metadata.get('artifact_version')} is not supported, "
+                f"expected {ARTIFACT_VERSION}. Retrain with `python model.py`."
+            )
+        if metadata.get('user_id_scheme') != USER_ID_SCHEME:
+            raise ValueError(
+                f"Artifact user ids were derived with scheme {metadata.get('user_id_scheme')}, "
+                f"expected {USER_ID_SCHEME}. Retrain with `python model.py`."
+            )
+
+        model = cls.__new__(cls)
+        user_ids = pd.Index(arrays['user_ids'], name='user_id')
+        model.user_item_matrix = pd.DataFrame(
+            arrays['user_item_matrix'],
+            index=user_ids,
+            columns=pd.Index(metadata['user_item_columns'], name='destination'),
+            copy=False
+        )
+
+        model.destination_popularity = pd.DataFrame(
+            {
+                column: metadata[f'destination_popularity.{column}'] if f'destination_popularity.{column}' in metadata
+                else arrays[f'destination_popularity.{column}']
+                for column in metadata['destination_popularity_columns']
+            },
+            index=arrays['destination_popularity.index']
+        )
+        model.destination_mapping = build_destination_mapping(model.destination_popularity)
+        model.destination_info = build_destination_info(model.destination_popularity)
+        model.destinations = np.array(metadata['destinations'], dtype=object)
+        model.context_rankings = metadata['context_rankings']
+        model.preference_index = PreferenceIndex.from_artifact(
+            {key.split('.', 1)[1]: value for key, value in arrays.items() if key.startswith('preference_index.')},
+            metadata['preference_index'],
+            model.destinations
+        )
+
+        season_labels = metadata['user_contexts.season_labels']
+        trip_type_labels = metadata['user_contexts.trip_type_labels']
+        model.user_contexts = {
+            user_id: (season_labels[season], trip_type_labels[trip_type])
+            for user_id, season, trip_type in zip(
+                arrays['user_contexts.user_ids'].tolist(),
+                arrays['user_contexts.seasons'].tolist(),
+                arrays['user_contexts.trip_types'].tolist()
+            )
+        }
+        model.recommendation_cache = LRUCache(metadata['recommendation_cache_size'])
+        # Models built without fit_model carry no statistics and can only be retrained
+        model.booking_statistics = BookingStatistics.from_artifact(
+            {key.split('.', 1)[1]: value for key, value in arrays.items() if key.startswith('booking_statistics.')},
+            metadata['booking_statistics']
+        ) if 'booking_statistics' in metadata else None
+
+        model.similarity_neighbors = metadata['similarity_neighbors']
+        model.similarity_lists = metadata.get('similarity_lists')
+        model.n_factors = metadata.get('n_factors')
+        model.latent_factors = None
+        if 'latent_factors' in metadata:
+            model.user_similarity = None
+            model.user_neighbors = None
+            model.latent_factors = LatentFactors.from_artifact(
+                {key.split('.', 1)[1]: value for key, value in arrays.items() if key.startswith('latent_factors.')},
+                metadata['latent_factors']
+            )
+        elif 'user_neighbors' in metadata:
+            model.user_similarity = None
+            model.user_neighbors = UserNeighbors.from_artifact(
+                {key.split('.', 1)[1]: value for key, value in arrays.items() if key.startswith('user_neighbors.')},
+                metadata['user_neighbors'],
+                user_ids.to_numpy()
+            )
+        else:
+            model.user_similarity = pd.DataFrame(arrays['user_similarity'], index=user_ids, columns=user_ids, copy=False)
+            model.user_neighbors = None
+
+        model.artifact_version = metadata['artifact_version']
+        model.user_id_scheme = metadata['user_id_scheme']
+        model.version = version
+        return model
+
+    def collaborative_filtering_recommendations(self, user_id, n_recommendations=10, n_neighbors=10):
         """Generate recommendations for a user using collaborative filtering"""
         # If user is not in the matrix, return popular destinations
-        if user_id not in self.user_similarity.index:
+        if user_id not in self.user_item_matrix.index:
             return self.popularity_based_recommendations(n_recommendations)
 
-        # Get similar users
-        similar_users = self.user_similarity[user_id].sort_values(ascending=False)[1:11]  # Top 10 similar users
-
-        # Get destinations that similar users liked but the target user hasn't rated
-        user_destinations = set(self.user_item_matrix.columns[self.user_item_matrix.loc[user_id] > 0])
-
-        recommendations = {}
-        for similar_user, similarity in similar_users.items():
-            # Skip if similarity is too low
-            if similarity <= 0:
-                continue
+        ratings = self.user_item_matrix.to_numpy()
+        position = self.user_item_matrix.index.get_loc(user_id)
+        if self.latent_factors is not None:
+            return self.factor_recommendations([position], n_recommendations)[0]
 
-            # Get destinations that similar user liked
-            similar_user_destinations = set(self.user_item_matrix.columns[self.user_item_matrix.loc[similar_user] > 3])
+        # Get similar users
+        if self.user_neighbors is not None:
+            neighbors, similarities = self.user_neighbors.neighbor_positions(position, n_neighbors)
+        else:
+            similarities = self.user_similarity.to_numpy()[position].copy()
+            similarities[position] = -np.inf  # a user is not its own neighbor
+            n_neighbors = min(n_neighbors, len(similarities) - 1)
+            neighbors = np.argpartition(-similarities, n_neighbors - 1)[:n_neighbors] if n_neighbors > 0 else np.empty(0, dtype=np.int64)
+            similarities = similarities[neighbors]
 
-            # Find destinations that similar user liked but target user hasn't rated
-            new_destinations = similar_user_destinations - user_destinations
+        # Skip neighbors whose similarity is too low
+        positive = similarities > 0
+        neighbors, similarities = neighbors[positive], similarities[positive]
 
-            for destination in new_destinations:
-                if destination in recommendations:
-                    recommendations[destination] += similarity * self.user_item_matrix.loc[similar_user, destination]
-                else:
-                    recommendations[destination] = similarity * self.user_item_matrix.loc[similar_user, destination]
+        # Destinations that similar users liked but the target user hasn't rated
+        neighbor_ratings = ratings[neighbors]
+        liked = (neighbor_ratings > 3) & ~(ratings[position] > 0)
+        candidates = liked.any(axis=0)
 
         # If no recommendations found, use popularity-based
-        if not recommendations:
+        if not candidates.any():
             return self.popularity_based_recommendations(n_recommendations)
 
-        # Sort recommendations by score
-        recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
-
-        # Return top n recommendations
-        return [dest for dest, score in recommendations[:n_recommendations]]
+        # Score each candidate by the similarity-weighted ratings of the users who liked it
+        scores = similarities @ np.where(liked, neighbor_ratings, 0.0)
+
+        # Return top n recommendations, highest score first
+        candidate_ids = np.flatnonzero(candidates)
+        order = np.argsort(-scores[candidate_ids], kind='stable')[:n_recommendations]
+        return self.user_item_matrix.columns[candidate_ids[order]].tolist()
+
+    def factor_recommendations(self, positions, n_recommendations=10):
+        """Recommend the unrated destinations with the highest positive predicted rating to the users at positions"""
+        scores = self.latent_factors.scores(positions)
+        candidates = (scores > 0) & ~(self.user_item_matrix.to_numpy()[positions] > 0)
+        order = np.argsort(np.where(candidates, -scores, np.inf), axis=1, kind='stable')[:, :n_recommendations]
+
+        recommendations = []
+        for user_order, user_candidates in zip(order, candidates):
+            # Users without candidates fall back to popularity, as with similar users
+            if not user_candidates.any():
+                recommendations.append(self.popularity_based_recommendations(n_recommendations))
+            else:
+                recommendations.append(self.user_item_matrix.columns[user_order[:user_candidates.sum()]].tolist())
+        return recommendations
+
+    def batch_collaborative_filtering_recommendations(self, user_ids, n_recommendations=10, n_neighbors=10):
+        """Collaborative filtering for many users at once, matching collaborative_filtering_recommendations per user"""
+        ratings = self.user_item_matrix.to_numpy()
+        known = [user_id in self.user_item_matrix.index for user_id in user_ids]
+        positions = self.user_item_matrix.index.get_indexer([user_id for user_id, is_known in zip(user_ids, known) if is_known])
+        if self.latent_factors is not None:
+            known_recs = iter(self.factor_recommendations(positions, n_recommendations))
+            return [next(known_recs) if is_known else self.popularity_based_recommendations(n_recommendations) for is_known in known]
+
+        # Similar users of every known user, as (users x n_neighbors) arrays
+        if self.user_neighbors is not None:
+            neighbors = np.zeros((len(positions), n_neighbors), dtype=np.int64)
+            similarities = np.zeros((len(positions), n_neighbors))
+            for row, position in enumerate(positions):
+                user_neighbors, user_similarities = self.user_neighbors.neighbor_positions(position, n_neighbors)
+                neighbors[row, :len(user_neighbors)] = user_neighbors
+                similarities[row, :len(user_similarities)] = user_similarities
+        else:
+            similarities = self.user_similarity.to_numpy()[positions]
+            similarities[np.arange(len(positions)), positions] = -np.inf  # a user is not its own neighbor
+            n_neighbors = min(n_neighbors, ratings.shape[0] - 1)
+            neighbors = np.argpartition(-similarities, n_neighbors - 1, axis=1)[:, :n_neighbors] if n_neighbors > 0 else np.empty((len(positions), 0), dtype=np.int64)
+            similarities = np.take_along_axis(similarities, neighbors, axis=1)
+
+        # Skip neighbors whose similarity is too low
+        similarities = np.where(similarities > 0, similarities, 0.0)
+
+        # Destinations that similar users liked but the target user hasn't rated
+        neighbor_ratings = ratings[neighbors]
+        liked = (neighbor_ratings > 3) & ~(ratings[positions] > 0)[:, None, :] & (similarities > 0)[:, :, None]
+        candidates = liked.any(axis=1)
+
+        scores = np.einsum('un,und->ud', similarities, np.where(liked, neighbor_ratings, 0.0))
+        order = np.argsort(np.where(candidates, -scores, np.inf), axis=1, kind='stable')[:, :n_recommendations]
+
+        known_recs = iter(zip(order, candidates))
+        recommendations = []
+        for is_known in known:
+            user_order, user_candidates = next(known_recs) if is_known else (None, None)
+            # Unknown users and users without candidates fall back to popularity, as for a single user
+            if user_order is None or not user_candidates.any():
+                recommendations.append(self.popularity_based_recommendations(n_recommendations))
+            else:
+                user_order = user_order[:user_candidates.sum()]
+                recommendations.append(self.user_item_matrix.columns[user_order].tolist())
+        return recommendations
 
     def popularity_based_recommendations(self, n_recommendations=10):
         """Generate recommendations based on destination popularity"""
@@ -225,259 +1479,294 @@ class FlightRecommendationModel:
 
     def seasonal_recommendations(self, season, n_recommendations=10):
         """Generate recommendations based on season"""
-        seasonal_data = data[data['season'] == season]
-
-        seasonal_popularity = seasonal_data.groupby('destination').agg(
-            booking_count=('user_id', 'count'),
-            avg_rating=('rating', 'mean')
-        ).reset_index()
-
-        seasonal_popularity['seasonal_score'] = (
-            seasonal_popularity['booking_count'] * 0.6 +
-            seasonal_popularity['avg_rating'] * 0.4
-        )
-
-        seasonal_popularity = seasonal_popularity.sort_values('seasonal_score', ascending=False)
-
-        return seasonal_popularity.head(n_recommendations)['destination'].tolist()
+        return self.context_rankings['season'].get(season, [])[:n_recommendations]
 
     def trip_type_recommendations(self, trip_type, n_recommendations=10):
         """Generate recommendations based on trip type"""
-        trip_data = data[data['trip_purpose'] == trip_type]
-
-        trip_popularity = trip_data.groupby('destination').agg(
-            booking_count=('user_id', 'count'),
-            avg_rating=('rating', 'mean')
-        ).reset_index()
-
-        trip_popularity['trip_score'] = (
-            trip_popularity['booking_count'] * 0.6 +
-            trip_popularity['avg_rating'] * 0.4
-        )
-
-        trip_popularity = trip_popularity.sort_values('trip_score', ascending=False)
-
-        return trip_popularity.head(n_recommendations)['destination'].tolist()
-
-    def hybrid_recommendations(self, user_id, season, trip_type, n_recommendations=10):
-        """Generate hybrid recommendations combining collaborative filtering, popularity, and contextual factors"""
-        # Get recommendations from each model
-        cf_recs = self.collaborative_filtering_recommendations(user_id, n_recommendations*2)
-        pop_recs = self.popularity_based_recommendations(n_recommendations*2)
-        season_recs = self.seasonal_recommendations(season, n_recommendations*2)
-        trip_recs = self.trip_type_recommendations(trip_type, n_recommendations*2)
-
-        # Combine recommendations with weights
-        all_recs = {}
-
-        # Collaborative filtering recommendations (highest weight)
-        for i, dest in enumerate(cf_recs):
-            all_recs[dest] = all_recs.get(dest, 0) + (n_recommendations*2 - i) * 0.4
-
-        # Popularity recommendations
-        for i, dest in enumerate(pop_recs):
-            all_recs[dest] = all_recs.get(dest, 0) + (n_recommendations*2 - i) * 0.2
-
-        # Seasonal recommendations
-        for i, dest in enumerate(season_recs):
-            all_recs[dest] = all_recs.get(dest, 0) + (n_recommendations*2 - i) * 0.2
-
-        # Trip type recommendations
-        for i, dest in enumerate(trip_recs):
-            all_recs[dest] = all_recs.get(dest, 0) + (n_recommendations*2 - i) * 0.2
-
-        # Sort by score and return top n
-        sorted_recs = sorted(all_recs.items(), key=lambda x: x[1], reverse=True)
-
-        return [dest for dest, score in sorted_recs[:n_recommendations]]
-
-    def get_recommendations_for_user(self, user_id, season=None, trip_type=None, top_k=10):
+        return self.context_rankings['trip_purpose'].get(trip_type, [])[:n_recommendations]
+
+    def origin_recommendations(self, origin, n_recommendations=10):
+        """Generate recommendations based on departure airport"""
+        return self.context_rankings['origin'].get(origin, [])[:n_recommendations]
+
+    def blend_sources(self, request, weights, top_k=10, executor=None):
+        """Rank destinations by the weighted sum of the sources' score vectors, returning (destinations, scores)
+
+        Each source in weights scores its top top_k*2 destinations for the request; sources
+        with a zero weight are skipped. With an executor, the CONCURRENT_SOURCES run on it
+        while the cheap ones run on the calling thread.
+        """
+        n = top_k*2
+        weights = {name: weight for name, weight in weights.items() if weight}
+        futures = {
+            name: executor.submit(RECOMMENDATION_SOURCES[name], self, request, n)
+            for name in weights if executor is not None and name in CONCURRENT_SOURCES
+        }
+        scores = np.stack([
+            futures[name].result() if name in futures else RECOMMENDATION_SOURCES[name](self, request, n)
+            for name in weights
+        ]) if weights else np.zeros((0, len(self.destination_mapping['id'])))
+        totals = (np.fromiter(weights.values(), dtype=float, count=len(weights))[:, None] * scores).sum(axis=0)
+
+        # Only destinations some source scored are candidates. Ties go to the destination
+        # that the earliest source in weights scored first, as the per-source loops did
+        ranked = scores != 0
+        candidates = np.flatnonzero(ranked.any(axis=0))
+        first_source = ranked.argmax(axis=0)[candidates]
+        order = np.lexsort((-scores[first_source, candidates], first_source, -totals[candidates]))[:top_k]
+
+        ids = candidates[order]
+        return [self.destination_mapping['id'][i] for i in ids.tolist()], totals[ids].tolist()
+
+    def hybrid_recommendations(self, user_id, season, trip_type, n_recommendations=10, cf_recs=None, weights=None,
+                               executor=None):
+        """Generate hybrid recommendations combining collaborative filtering, popularity, and contextual factors
+
+        weights overrides HYBRID_WEIGHTS per source, e.g. {'collaborative': 0.6, 'origin': 0.1}.
+        """
+        # Reuse cf_recs when they were computed in a batch
+        request = {'user_id': user_id, 'season': season, 'trip_type': trip_type, 'cf_recs': cf_recs}
+        recs, _ = self.blend_sources(request, resolve_weights(HYBRID_WEIGHTS, weights), n_recommendations, executor)
+        return recs
+
+    def get_recommendations_for_user(self, user_id, season=None, trip_type=None, top_k=10, weights=None, executor=None):
         """Get personalized destination recommendations for a specific user"""
-        # Get user's contextual information if not provided
-        if user_id in data['user_id'].values and (season is None or trip_type is None):
-            user_data = data[data['user_id'] == user_id]
-            season = user_data['season'].mode()[0] if season is None else season
-            trip_type = user_data['trip_purpose'].mode()[0] if trip_type is None else trip_type
+        season, trip_type = self._user_context(user_id, season, trip_type)
+
+        # Get hybrid recommendations, reusing earlier results for the same request
+        key = (user_id, season, trip_type, top_k, tuple(sorted(weights.items())) if weights else None)
+        recs = self.recommendation_cache.get(key)
+        if recs is None:
+            recs = self.hybrid_recommendations(user_id, season, trip_type, top_k, weights=weights, executor=executor)
+            self.recommendation_cache.put(key, recs)
+
+        return self._destination_details(recs)
+
+    def get_recommendations_for_users(self, user_ids, top_k=10, batch_size=512, weights=None):
+        """Get recommendations for many existing users, yielding (user_id, records) pairs
+
+        Collaborative filtering runs as array operations over batch_size users at a time,
+        so the results match get_recommendations_for_user without its per-user overhead.
+        Batch results bypass the recommendation cache so a full run doesn't evict it.
+        """
+        user_ids = list(user_ids)
+        collaborative = resolve_weights(HYBRID_WEIGHTS, weights).get('collaborative')
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            # Collaborative filtering is skipped entirely when its weight is zero
+            cf_recs = self.batch_collaborative_filtering_recommendations(batch, top_k*2) if collaborative else [None] * len(batch)
+
+            for user_id, user_cf_recs in zip(batch, cf_recs):
+                season, trip_type = self._user_context(user_id)
+                recs = self.hybrid_recommendations(user_id, season, trip_type, top_k, cf_recs=user_cf_recs, weights=weights)
+                yield user_id, self._destination_details(recs)
+
+    def _user_context(self, user_id, season=None, trip_type=None):
+        """Fill in a missing season or trip type from the user's booking history"""
+        if user_id in self.user_contexts and (season is None or trip_type is None):
+            user_season, user_trip_type = self.user_contexts[user_id]
+            season = user_season if season is None else season
+            trip_type = user_trip_type if trip_type is None else trip_type
         else:
             # Default values if user not found or values not provided
-            season = 'Summer' if season is None else season
-            trip_type = 'Regular Vacation' if trip_type is None else trip_type
-
-        # Get hybrid recommendations
-        recs = self.hybrid_recommendations(user_id, season, trip_type, top_k)
+            season = DEFAULT_SEASON if season is None else season
+            trip_type = DEFAULT_TRIP_TYPE if trip_type is None else trip_type
+        return season, trip_type
 
-        # Get additional information about recommendations
+    def _destination_details(self, recs, scores=None):
+        """Describe each recommended destination with its popularity metrics"""
         rec_info = []
-        for dest in recs:
-            dest_data = destination_popularity[destination_popularity['destination'] == dest]
-            if not dest_data.empty:
-                rec_info.append({
-                    'destination': dest,
-                    'popularity_score': dest_data['popularity_score'].values[0],
-                    'booking_count': dest_data['booking_count'].values[0],
-                    'avg_rating': dest_data['avg_rating'].values[0]
-                })
-
-        rec_df = pd.DataFrame(rec_info)
-
-        return rec_df
-
-    def get_recommendations_for_new_user(self, user_preferences=None, season='Summer', trip_type='Regular Vacation', origin=None, top_k=10):
-        """Generate recommendations for a new user based on preferences and contextual factors"""
+        for i, dest in enumerate(recs):
+            dest_info = self.destination_info.get(dest)
+            if dest_info is not None:
+                info = {'destination': dest}
+                if scores is not None:
+                    info['score'] = scores[i]
+                info.update(dest_info)
+                rec_info.append(info)
+        return rec_info
+
+    def get_recommendations_for_new_user(self, user_preferences=None, season='Summer', trip_type='Regular Vacation', origin=None, top_k=10,
+                                         weights=None, executor=None, preference_recs=None):
+        """Generate recommendations for a new user based on preferences and contextual factors
+
+        weights overrides NEW_USER_WEIGHTS per source, e.g. {'preferences': 0.5}.
+        """
         # Default preferences if none provided
         if user_preferences is None:
-            user_preferences = {
-                "wants_extra_baggage": 0,
-                "wants_preferred_seat": 0,
-                "wants_in_flight_meals": 0,
-                "num_passengers": 1,
-                "length_of_stay": 7
-            }
-
-        # 1. Get popular destinations for the current season
-        season_recs = self.seasonal_recommendations(season, top_k*2)
+            user_preferences = dict(DEFAULT_USER_PREFERENCES)
 
-        # 2. Get popular destinations for the trip type
-        trip_recs = self.trip_type_recommendations(trip_type, top_k*2)
+        # Combine global popularity with the season, trip type, origin and similar bookings,
+        # reusing preference_recs when they were computed in a batch
+        request = {'user_preferences': user_preferences, 'season': season, 'trip_type': trip_type, 'origin': origin,
+                   'preference_recs': preference_recs}
+        recs, scores = self.blend_sources(request, resolve_weights(NEW_USER_WEIGHTS, weights), top_k, executor)
 
-        # 3. If origin is provided, get popular routes from that origin
-        if origin:
-            origin_data = data[data['origin'] == origin]
-            origin_popularity = origin_data.groupby('destination').agg(
-                booking_count=('user_id', 'count'),
-                avg_rating=('rating', 'mean')
-            ).reset_index()
-
-            origin_popularity['origin_score'] = (
-                origin_popularity['booking_count'] * 0.6 +
-                origin_popularity['avg_rating'] * 0.4
+        # Get additional information about recommendations
+        return self._destination_details(recs, scores=scores)
+
+    def get_recommendations_for_new_users(self, profiles, top_k=10, batch_size=512):
+        """Get recommendations for many new-user profiles, yielding one list of records per profile
+
+        A profile is a dict of get_recommendations_for_new_user keyword arguments
+        (user_preferences, season, trip_type, origin, weights). Identical profiles, which are
+        common in campaign audiences, are only computed once. The similar-booking search runs
+        as array operations over batch_size distinct profiles at a time, so the results match
+        get_recommendations_for_new_user without its per-profile overhead.
+        """
+        def batchable(profile):
+            # Other profiles are left to get_recommendations_for_new_user, which raises the same errors as before
+            user_preferences = profile.get('user_preferences')
+            return resolve_weights(NEW_USER_WEIGHTS, profile.get('weights')).get('preferences') and (
+                user_preferences is None or isinstance(user_preferences, dict) and all(
+                    isinstance(user_preferences.get(key, 0), (int, float)) for key in ('num_passengers', 'length_of_stay')
+                )
             )
 
-            origin_popularity = origin_popularity.sort_values('origin_score', ascending=False)
-            origin_recs = origin_popularity.head(top_k*2)['destination'].tolist()
-        else:
-            origin_recs = []
-
-        # 4. Get destinations popular with users with similar preferences
-        # Calculate a preference similarity score
-        preference_filter = (
-            (data['wants_extra_baggage'] == user_preferences.get('wants_extra_baggage', 0)) &
-            (data['wants_preferred_seat'] == user_preferences.get('wants_preferred_seat', 0)) &
-            (data['wants_in_flight_meals'] == user_preferences.get('wants_in_flight_meals', 0))
+        profiles = list(profiles)
+        keys = [json.dumps(profile, sort_keys=True, default=str) for profile in profiles]
+        computed = {}
+        for start in range(0, len(profiles), batch_size):
+            batch = {
+                key: profile for key, profile in zip(keys[start:start + batch_size], profiles[start:start + batch_size])
+                if key not in computed
+            }
+            searched = [key for key, profile in batch.items() if batchable(profile)]
+            preference_recs = dict(zip(searched, self.preference_index.batch_recommendations([
+                DEFAULT_USER_PREFERENCES if batch[key].get('user_preferences') is None else batch[key]['user_preferences']
+                for key in searched
+            ], top_k*2)))
+
+            for key, profile in batch.items():
+                computed[key] = self.get_recommendations_for_new_user(top_k=top_k, preference_recs=preference_recs.get(key), **profile)
+            for key in keys[start:start + batch_size]:
+                yield computed[key]
+
+
+def train_model(data_path=DATA_PATH, similarity_neighbors=None, chunksize=CHUNK_SIZE, similarity_lists=None, n_factors=None):
+    """Run the offline training pipeline and return a fitted model
+
+    Bookings are read and aggregated chunksize rows at a time, so peak memory depends
+    on the number of users, destinations and distinct booking segments rather than on
+    the length of the booking history.
+    """
+    with Timer() as train_time:
+        stats = BookingStatistics()
+        preference_segments = None
+        n_bookings = 0
+        for chunk in iter_booking_chunks(data_path, chunksize):
+            stats.update(chunk)
+            segments = PreferenceIndex.segment(chunk)
+            preference_segments = segments if preference_segments is None else PreferenceIndex.merge_segments(preference_segments, segments)
+            n_bookings += len(chunk)
+        print(f"Loaded {n_bookings} bookings from {data_path}")
+        print(f"User-item matrix: {len(stats.user_ids)} users x {len(stats.destinations)} destinations")
+
+        model = FlightRecommendationModel.from_statistics(
+            stats, preference_segments, similarity_neighbors=similarity_neighbors, similarity_lists=similarity_lists,
+            n_factors=n_factors
         )
+    model.version = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+    print(f"Training completed in {train_time.interval:.2f} seconds")
 
-        # Add passenger count similarity if provided
-        if 'num_passengers' in user_preferences:
-            preference_filter = preference_filter & (
-                (data['num_passengers'] >= user_preferences['num_passengers'] - 1) &
-                (data['num_passengers'] <= user_preferences['num_passengers'] + 1)
-            )
+    return model
 
-        # Add length of stay similarity if provided
-        if 'length_of_stay' in user_preferences:
-            preference_filter = preference_filter & (
-                (data['length_of_stay'] >= user_preferences['length_of_stay'] - 3) &
-                (data['length_of_stay'] <= user_preferences['length_of_stay'] + 3)
-            )
 
-        preference_data = data[preference_filter]
-        preference_popularity = preference_data.groupby('destination').agg(
-            booking_count=('user_id', 'count'),
-            avg_rating=('rating', 'mean')
-        ).reset_index()
+def fit_model(data, similarity_neighbors=None, similarity_lists=None, n_factors=None):
+    """Fit a model to prepared bookings held in memory, keeping the statistics partial_fit needs"""
+    destination_popularity = calculate_destination_popularity(data)
+    user_item_matrix = build_user_item_matrix(data, destination_popularity)
+    destination_mapping = build_destination_mapping(destination_popularity)
+    print(f"User-item matrix: {user_item_matrix.shape[0]} users x {user_item_matrix.shape[1]} destinations")
 
-        preference_popularity['preference_score'] = (
-            preference_popularity['booking_count'] * 0.6 +
-            preference_popularity['avg_rating'] * 0.4
+    with Timer() as train_time:
+        model = FlightRecommendationModel(
+            user_item_matrix, destination_popularity, destination_mapping, data,
+            similarity_neighbors=similarity_neighbors, similarity_lists=similarity_lists, n_factors=n_factors
         )
+        model.booking_statistics = BookingStatistics(data)
+    model.version = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+    print(f"Training completed in {train_time.interval:.2f} seconds")
+
+    return model
+
+
+def update_model(model_path, data_path, chunksize=CHUNK_SIZE):
+    """Load a published model and fold the bookings in data_path into it, chunksize rows at a time"""
+    model = load_model(model_path)
+
+    with Timer() as update_time:
+        n_bookings = 0
+        for chunk in iter_booking_chunks(data_path, chunksize):
+            model.partial_fit(chunk)
+            n_bookings += len(chunk)
+    print(f"Loaded {n_bookings} new bookings from {data_path}")
+    model.version = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+    print(f"Update completed in {update_time.interval:.2f} seconds")
+
+    return model
+
+
+def save_artifacts(model, output_dir=current_dir):
+    """Publish the model as a new artifact version under output_dir, returning the version directory"""
+    arrays, metadata = model.to_artifact()
+    version = model.version or time.strftime('%Y%m%d%H%M%S', time.gmtime())
+    return ArtifactStore(os.path.join(output_dir, MODEL_DIRNAME)).write(version, arrays, metadata)
+
+
+def load_model(model_path, mmap_mode='r'):
+    """Load a model without touching the training data
+
+    model_path may be an artifact store (serving its CURRENT version) or a single artifact
+    version directory. Artifact arrays are memory-mapped read-only unless mmap_mode is None.
+    """
+    # Pickled models can't be converted: the oldest hold user ids from Python's salted
+    # hash() and none of the rankings or indexes, so they have to be retrained
+    if not os.path.isdir(model_path):
+        raise ValueError(f"{model_path} is not a model artifact directory. Retrain with `python model.py`.")
+    if os.path.isfile(os.path.join(model_path, MANIFEST_FILENAME)):
+        manifest, arrays = read_artifact(model_path, mmap_mode=mmap_mode)
+    else:
+        manifest, arrays = ArtifactStore(model_path).read(mmap_mode=mmap_mode)
+    return FlightRecommendationModel.from_artifact(arrays, manifest['metadata'], version=manifest['version'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the flight recommendation model")
+    parser.add_argument('--data', default=DATA_PATH, help="booking CSV to train on")
+    parser.add_argument('--output-dir', default=current_dir, help="directory to write the artifacts to")
+    parser.add_argument('--neighbors', type=int, default=None,
+                        help="keep only the top N similar users per user instead of the dense similarity matrix")
+    parser.add_argument('--ann-lists', type=int, default=None,
+                        help="with --neighbors, search them in an approximate index of N lists instead of among all users")
+    parser.add_argument('--factors', type=int, default=None,
+                        help="replace user-user similarities with N latent factors per user and destination (truncated SVD)")
+    parser.add_argument('--update', metavar='CSV',
+                        help="fold the bookings in CSV into the published model instead of retraining")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE,
+                        help="bookings to read from the CSV at a time; bounds peak memory")
+    args = parser.parse_args(argv)
+    if args.ann_lists and not args.neighbors:
+        parser.error("--ann-lists requires --neighbors")
+    if args.factors and args.neighbors:
+        parser.error("--factors replaces similar users and cannot be combined with --neighbors")
+
+    print(f"System version: {sys.version}")
+    try:
+        if args.update:
+            model = update_model(os.path.join(args.output_dir, MODEL_DIRNAME), args.update, chunksize=args.chunksize)
+        else:
+            model = train_model(args.data, similarity_neighbors=args.neighbors, chunksize=args.chunksize,
+                                similarity_lists=args.ann_lists, n_factors=args.factors)
+    except Exception as e:
+        print(f"Error {'updating' if args.update else 'training'} model: {e}")
+        sys.exit(1)
 
-        preference_popularity = preference_popularity.sort_values('preference_score', ascending=False)
-        preference_recs = preference_popularity.head(top_k*2)['destination'].tolist()
-
-        # 5. Combine all recommendation sources
-        all_recs = {}
-
-        # Global popularity recommendations
-        pop_recs = self.popularity_based_recommendations(top_k*2)
-        for i, dest in enumerate(pop_recs):
-            all_recs[dest] = all_recs.get(dest, 0) + (top_k*2 - i) * 0.2
-
-        # Seasonal recommendations
-        for i, dest in enumerate(season_recs):
-            all_recs[dest] = all_recs.get(dest, 0) + (top_k*2 - i) * 0.2
-
-        # Trip type recommendations
-        for i, dest in enumerate(trip_recs):
-            all_recs[dest] = all_recs.get(dest, 0) + (top_k*2 - i) * 0.2
-
-        # Origin-based recommendations
-        if origin_recs:
-            for i, dest in enumerate(origin_recs):
-                all_recs[dest] = all_recs.get(dest, 0) + (top_k*2 - i) * 0.2
-
-        # Preference-based recommendations
-        for i, dest in enumerate(preference_recs):
-            all_recs[dest] = all_recs.get(dest, 0) + (top_k*2 - i) * 0.2
+    version_dir = save_artifacts(model, args.output_dir)
+    print(f"\nModel version {model.version} saved to {version_dir}")
+    print("Files created during execution:")
+    print(f"1. {MODEL_DIRNAME}/ - The recommendation model, one directory per version")
 
-        # Sort by score and return top n
-        sorted_recs = sorted(all_recs.items(), key=lambda x: x[1], reverse=True)
 
-        # Get additional information about recommendations
-        rec_info = []
-        for dest, score in sorted_recs[:top_k]:
-            dest_data = destination_popularity[destination_popularity['destination'] == dest]
-            if not dest_data.empty:
-                rec_info.append({
-                    'destination': dest,
-                    'score': score,
-                    'popularity_score': dest_data['popularity_score'].values[0],
-                    'booking_count': dest_data['booking_count'].values[0],
-                    'avg_rating': dest_data['avg_rating'].values[0]
-                })
-
-        rec_df = pd.DataFrame(rec_info)
-
-        return rec_df
-
-# Train the model
-with Timer() as train_time:
-    model = FlightRecommendationModel(user_item_matrix, destination_popularity, destination_mapping)
-
-print(f"\nTraining completed in {train_time.interval:.2f} seconds")
-
-# Save the model
-model_path = "recommendation_customer_booking.pkl"
-with open(model_path, 'wb') as f:
-    pickle.dump(model, f)
-print(f"Model saved to {model_path}")
-
-# Save the destination mapping for later use
-mapping_path = "destination_mapping.pkl"
-with open(mapping_path, 'wb') as f:
-    pickle.dump(destination_mapping, f)
-print(f"Destination mapping saved to {mapping_path}")
-
-# Save the destination popularity for later use
-popularity_path = "destination_popularity.pkl"
-with open(popularity_path, 'wb') as f:
-    pickle.dump(destination_popularity, f)
-print(f"Destination popularity saved to {popularity_path}")
-
-# Visualize destination popularity
-# plt.figure(figsize=(10, 6))
-# top_destinations = destination_popularity.head(10)
-# sns.barplot(x='destination', y='popularity_score', data=top_destinations)
-# plt.title('Top 10 Most Popular Destinations')
-# plt.xlabel('Destination')
-# plt.ylabel('Popularity Score')
-# plt.xticks(rotation=45)
-# plt.tight_layout()
-# plt.savefig('destination_popularity.png')
-# print("\nDestination popularity chart saved as 'destination_popularity.png'")
-
-print("\nModel building and saving complete!")
-print(f"Files created during execution:")
-print(f"1. {model_path} - The recommendation model")
-print(f"2. {mapping_path} - Mapping between destination codes and IDs")
-print(f"3. {popularity_path} - Destination popularity metrics")
-print(f"4. destination_popularity.png - Visualization of top destinations")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,125 @@
-import pickle
-import pandas as pd
+import logging
 import os
-import sys
-from model import FlightRecommendationModel  # Import the class definition
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from artifacts import ArtifactStore, MANIFEST_FILENAME
+from model import MODEL_DIRNAME, current_dir, load_model
+
+logger = logging.getLogger('recommend.api')
 
 class RecommendationAPI:
-    def __init__(self, model_path="recommendation_customer_booking.pkl"):
-        """Initialize the recommendation API with a pre-trained model"""
+    def __init__(self, model_path=os.path.join(current_dir, MODEL_DIRNAME), source_threads=0):
+        """Initialize the recommendation API with a pre-trained model
+
+        With source_threads > 0, the expensive recommendation sources of a request run
+        concurrently on a thread pool of that size.
+        """
         self.model = None
         self.model_path = model_path
+        self.source_threads = source_threads
+        self._source_executor = None
+        self._executor_lock = threading.Lock()
+        self.model_signature = None
+        self._load_listeners = []
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_stop = threading.Event()
         self._load_model()
 
+    def add_load_listener(self, callback):
+        """Call callback(model) every time a model is loaded, e.g. to invalidate caches"""
+        self._load_listeners.append(callback)
+
     def _load_model(self):
         """Load the pre-trained model from disk"""
         if not os.path.exists(self.model_path):
-            raise FileNotFoundError(f"Model file {self.model_path} not found.")
+            raise FileNotFoundError(f"Model file {self.model_path} not found. Build it with `python model.py`.")
 
         try:
-            with open(self.model_path, 'rb') as f:
-                self.model = pickle.load(f)
-            print(f"Model loaded from {self.model_path}")
+            signature = self._model_signature()
+            model = load_model(self.model_path)
+            self._warm_up(model)
         except Exception as e:
             raise Exception(f"Error loading model: {e}")
 
-    def get_recommendations_for_new_user(self, user_preferences=None, season='Summer', trip_type='Regular Vacation', origin=None, top_k=10):
-        """Get recommendations for a new user"""
+        # Requests read self.model once, so rebinding it swaps models atomically:
+        # in-flight requests finish on the old model and new ones only see a fully loaded one
+        self.model = model
+        self.model_signature = signature
+        collaborative = 'latent factors' if model.latent_factors is not None else 'similar users'
+        logger.info(f"Model version {self.model.version} ({collaborative}) loaded from {self.model_path}")
+
+        for callback in self._load_listeners:
+            callback(self.model)
+
+    def _model_signature(self):
+        """Identify the artifact currently on disk: the CURRENT version of a store, else its modification time"""
+        if os.path.isdir(self.model_path) and not os.path.isfile(os.path.join(self.model_path, MANIFEST_FILENAME)):
+            return ArtifactStore(self.model_path).current_version()
+        if os.path.isdir(self.model_path):
+            return os.path.getmtime(os.path.join(self.model_path, MANIFEST_FILENAME))
+        return os.path.getmtime(self.model_path)
+
+    @staticmethod
+    def _warm_up(model):
+        """Serve one request of each kind so the first real requests don't pay for page faults"""
+        model.popularity_based_recommendations()
+        model.get_recommendations_for_new_user()
+        if len(model.user_item_matrix.index):
+            model.collaborative_filtering_recommendations(model.user_item_matrix.index[0])
+
+    def reload(self, force=False):
+        """Load the model again if a new artifact version was published, swapping it in once ready
+
+        Returns True if a new model was swapped in. A failed load is logged and the
+        current model keeps serving.
+        """
+        with self._reload_lock:
+            try:
+                if not force and self._model_signature() == self.model_signature:
+                    return False
+                self._load_model()
+                return True
+            except Exception as e:
+                logger.error(f"Error reloading model, keeping version {self.model.version}: {e}")
+                return False
+
+    def start_watcher(self, interval=30):
+        """Poll for a newly published model every `interval` seconds in a background thread"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+
+        def watch():
+            while not self._watcher_stop.wait(interval):
+                self.reload()
+
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    def stop_watcher(self):
+        """Stop the background watcher started by start_watcher"""
+        self._watcher_stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def source_executor(self):
+        """Return the thread pool for recommendation sources, or None if disabled
+
+        Created on first use rather than at load time, because threads don't survive the
+        fork of a preloaded gunicorn master.
+        """
+        if self.source_threads and self._source_executor is None:
+            with self._executor_lock:
+                if self._source_executor is None:
+                    self._source_executor = ThreadPoolExecutor(self.source_threads, thread_name_prefix='recommend-source')
+        return self._source_executor
+
+    def get_recommendations_for_new_user(self, user_preferences=None, season='Summer', trip_type='Regular Vacation', origin=None, top_k=10,
+                                         weights=None):
+        """Get recommendations for a new user, optionally overriding the weight of each recommendation source"""
         if self.model is None:
             raise Exception("Model not loaded. Call _load_model() first.")
 
@@ -34,24 +129,53 @@ class RecommendationAPI:
                 season=season,
                 trip_type=trip_type,
                 origin=origin,
-                top_k=top_k
+                top_k=top_k,
+                weights=weights,
+                executor=self.source_executor()
             )
             return recommendations
         except Exception as e:
-            print(f"Error getting recommendations for new user: {e}")
+            logger.exception(f"Error getting recommendations for new user: {e}")
             return None
 
-    def get_recommendations_for_existing_user(self, user_id, top_k=10):
-        """Get recommendations for an existing user"""
+    def get_recommendations_for_existing_user(self, user_id, top_k=10, weights=None):
+        """Get recommendations for an existing user, optionally overriding the weight of each recommendation source"""
         if self.model is None:
             raise Exception("Model not loaded. Call _load_model() first.")
 
         try:
             recommendations = self.model.get_recommendations_for_user(
                 user_id=user_id,
-                top_k=top_k
+                top_k=top_k,
+                weights=weights,
+                executor=self.source_executor()
             )
             return recommendations
         except Exception as e:
-            print(f"Error getting recommendations for existing user: {e}")
-            return None
\ No newline at end of file
+            logger.exception(f"Error getting recommendations for existing user: {e}")
+            return None
+
+    def get_recommendations_for_existing_users(self, user_ids=None, top_k=10, weights=None):
+        """Get recommendations for many existing users, or every user in the model if user_ids is None
+
+        Returns an iterator of (user_id, recommendations) pairs so results can be streamed.
+        """
+        model = self.model
+        if model is None:
+            raise Exception("Model not loaded. Call _load_model() first.")
+
+        # Keep the whole batch on one model even if a reload happens while it streams
+        if user_ids is None:
+            user_ids = model.user_item_matrix.index.tolist()
+        return model.get_recommendations_for_users(user_ids, top_k=top_k, weights=weights)
+
+    def get_recommendations_for_new_users(self, profiles, top_k=10):
+        """Get recommendations for many new-user profiles
+
+        Each profile may set user_preferences, season, trip_type, origin and weights. Returns an
+        iterator with one list of recommendations per profile, in order.
+        """
+        if self.model is None:
+            raise Exception("Model not loaded. Call _load_model() first.")
+
+        return self.model.get_recommendations_for_new_users(profiles, top_k=top_k)
@@ -1,40 +1,226 @@
 # recommendation_service.py
-from flask import Flask, request, jsonify
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from recommendation_api import RecommendationAPI
 from flask_cors import CORS
+from cache import LRUCache
+from model import MODEL_DIRNAME, PREFERENCE_FLAGS, current_dir, resolve_weights
+from structured_logging import ACCESS_LOGGER, configure_logging
+
+configure_logging()
+logger = logging.getLogger('recommend.service')
+access_logger = logging.getLogger(ACCESS_LOGGER)
 
 app = Flask(__name__)
 CORS(app, resources={r"/": {"origins": ""}})
-recommender = RecommendationAPI()
+# Loaded at import so that `gunicorn --preload` loads the model once before forking workers.
+# RECOMMEND_MODEL_PATH selects another artifact store, e.g. a factor model trained with `--factors`
+recommender = RecommendationAPI(
+    model_path=os.environ.get('RECOMMEND_MODEL_PATH') or os.path.join(current_dir, MODEL_DIRNAME),
+    source_threads=int(os.environ.get('RECOMMEND_SOURCE_THREADS', 0))
+)
+
+# Serialized /recommend/new_user responses keyed by a hash of the normalized request
+response_cache = LRUCache(
+    maxsize=int(os.environ.get('RECOMMEND_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('RECOMMEND_CACHE_TTL', 300)),
+    max_bytes=int(os.environ.get('RECOMMEND_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    sizeof=len
+)
+# Responses computed by a previous model must not outlive it
+recommender.add_load_listener(lambda model: response_cache.clear())
+
+# Seconds between checks for a newly published model; 0 disables the watcher
+RELOAD_INTERVAL = float(os.environ.get('RECOMMEND_RELOAD_INTERVAL', 0))
+
+def start_background_tasks():
+    """Start per-process threads; threads don't survive fork, so gunicorn calls this in each worker"""
+    if RELOAD_INTERVAL > 0:
+        recommender.start_watcher(RELOAD_INTERVAL)
+
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+
+@app.after_request
+def log_request(response):
+    """Write a sampled access log record for each request"""
+    access_logger.info("request", extra={
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - g.get('start_time', time.perf_counter())) * 1000, 3),
+        'cache': response.headers.get('X-Cache'),
+        'model_version': recommender.model.version
+    })
+    return response
+
+def normalize_weights(weights):
+    """Check per-request source weights, returning them as floats, or None to keep the defaults"""
+    if weights is None:
+        return None
+    if not isinstance(weights, dict) or not all(
+        isinstance(weight, (int, float)) and not isinstance(weight, bool) for weight in weights.values()
+    ):
+        raise ValueError("weights must be an object mapping recommendation sources to numbers")
+    resolve_weights({}, weights)
+    return {name: float(weight) for name, weight in weights.items()}
+
+def normalize_new_user_request(data):
+    """Fill in defaults and canonicalize values so equivalent requests share a cache entry"""
+    def normalize_value(value):
+        # 1, 1.0 and true all match the same bookings
+        if isinstance(value, (bool, int, float)):
+            return float(value)
+        return value
+
+    user_preferences = data.get('user_preferences', {})
+    if isinstance(user_preferences, dict):
+        # Missing extras default to 0, and keys the model doesn't read are dropped
+        user_preferences = {
+            **{flag: 0.0 for flag in PREFERENCE_FLAGS},
+            **{
+                key: normalize_value(value) for key, value in user_preferences.items()
+                if key in PREFERENCE_FLAGS or key in ('num_passengers', 'length_of_stay')
+            }
+        }
+
+    return {
+        'user_preferences': user_preferences,
+        'season': data.get('season', 'Summer'),
+        'trip_type': data.get('trip_type', 'Regular Vacation'),
+        'origin': data.get('origin', None) or None,
+        'top_k': data.get('top_k', 10),
+        'weights': normalize_weights(data.get('weights'))
+    }
 
 @app.route('/recommend/new_user', methods=['POST'])
 def recommend_new_user():
-    print("Received request:", request.json)
     try:
         data = request.json
         if not data:
             return jsonify({"error": "No JSON data received"}), 400
 
-        user_preferences = data.get('user_preferences', {})
-        season = data.get('season', 'Summer')
-        trip_type = data.get('trip_type', 'Regular Vacation')
-        origin = data.get('origin', None)
-        top_k = data.get('top_k', 10)
+        try:
+            normalized = normalize_new_user_request(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # The model version keeps a request that raced a reload from caching a stale response
+        key = hashlib.sha256(
+            json.dumps([recommender.model.version, normalized], sort_keys=True, default=str).encode()
+        ).hexdigest()
 
-        # print(f"Processing with: user_preferences={user_preferences}, season={season}, trip_type={trip_type}")
+        body = response_cache.get(key)
+        if body is not None:
+            return Response(body, mimetype=app.json.mimetype, headers={'X-Cache': 'HIT'})
 
-        recommendations = recommender.get_recommendations_for_new_user(
-            user_preferences=user_preferences,
-            season=season,
-            trip_type=trip_type,
-            origin=origin,
-            top_k=top_k
-        )
+        recommendations = recommender.get_recommendations_for_new_user(**normalized)
+
+        if recommendations is None:
+            return jsonify({"error": "Could not generate recommendations"}), 500
 
-        return jsonify(recommendations.to_dict(orient='records'))
+        body = f"{app.json.dumps(recommendations)}\n".encode()
+        response_cache.put(key, body)
+        return Response(body, mimetype=app.json.mimetype, headers={'X-Cache': 'MISS'})
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
+        logger.exception("Error processing new user request")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """Stream recommendations for many users as NDJSON, one JSON object per line
+
+    Body: {"user_ids": [...]} for existing users (omit or null for every user in the
+    model) and/or {"profiles": [{"user_preferences": ..., "season": ..., "trip_type": ...,
+    "origin": ..., "weights": ...}, ...]} for new users, plus an optional "top_k" and
+    "weights" for the existing users.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({"error": "No JSON data received"}), 400
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+
+    # Checked before streaming starts, since errors raised while streaming can't change the status
+    top_k = data.get('top_k', 10)
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1:
+        return jsonify({"error": "top_k must be a positive integer"}), 400
+    user_ids = data.get('user_ids')
+    if user_ids is not None and not isinstance(user_ids, list):
+        return jsonify({"error": "user_ids must be a list"}), 400
+    profiles = data.get('profiles')
+    if profiles is not None and not (isinstance(profiles, list) and all(isinstance(profile, dict) for profile in profiles)):
+        return jsonify({"error": "profiles must be a list of objects"}), 400
+    try:
+        weights = normalize_weights(data.get('weights'))
+        # Profiles get the same defaults and canonical values as /recommend/new_user requests
+        if profiles is not None:
+            profiles = [normalize_new_user_request(profile) for profile in profiles]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = []
+    if 'user_ids' in data or profiles is None:
+        results.append(
+            ({"user_id": user_id, "recommendations": recommendations}
+             for user_id, recommendations in recommender.get_recommendations_for_existing_users(user_ids, top_k=top_k, weights=weights))
+        )
+    if profiles is not None:
+        # top_k is set for the whole batch
+        profiles = [{key: value for key, value in profile.items() if key != 'top_k'} for profile in profiles]
+        results.append(
+            ({"index": i, "recommendations": recommendations}
+             for i, recommendations in enumerate(recommender.get_recommendations_for_new_users(profiles, top_k=top_k)))
+        )
+
+    def generate():
+        try:
+            for lines in results:
+                for line in lines:
+                    yield json.dumps(line) + '\n'
+        except Exception as e:
+            logger.exception("Error streaming batch recommendations")
+            yield json.dumps({"error": str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/recommend/cache/stats', methods=['GET'])
+def cache_stats():
+    """Report hit rate and memory used by the recommendation caches"""
+    return jsonify({
+        "model_version": recommender.model.version,
+        "new_user_responses": response_cache.stats(),
+        "existing_user_recommendations": recommender.model.recommendation_cache.stats()
+    })
+
+@app.route('/admin/reload', methods=['POST'])
+def reload_model():
+    """Load a newly published model and swap it in without dropping requests
+
+    Requires the X-Admin-Token header to match RECOMMEND_ADMIN_TOKEN; the endpoint is
+    disabled when that variable is unset. Pass {"force": true} to reload the same version.
+    """
+    admin_token = os.environ.get('RECOMMEND_ADMIN_TOKEN')
+    if not admin_token:
+        return jsonify({"error": "Reload endpoint is disabled"}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return jsonify({"error": "Invalid admin token"}), 403
+
+    data = request.get_json(silent=True) or {}
+    previous_version = recommender.model.version
+    reloaded = recommender.reload(force=bool(data.get('force', False)))
+    return jsonify({
+        "reloaded": reloaded,
+        "previous_version": previous_version,
+        "model_version": recommender.model.version
+    })
+
 if __name__ == '__main__':
-    app.run(debug=False, port=5001)
\ No newline at end of file
+    # Development server; in production run `gunicorn recommendation_service:app`, configured by gunicorn.conf.py
+    start_background_tasks()
+    app.run(debug=False, port=int(os.environ.get('RECOMMEND_PORT', 5001)))
\ No newline at end of file
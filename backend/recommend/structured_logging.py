@@ -0,0 +1,59 @@
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+ACCESS_LOGGER = 'recommend.access'
+
+# Attributes every LogRecord has; anything else was passed through `extra` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including fields passed through `extra`"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': record.getMessage()
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a `rate` fraction of records below WARNING; warnings and errors always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def configure_logging(level=None, sample_rate=None):
+    """Send the service's logs to stderr as JSON lines, keeping a sample_rate fraction of access logs
+
+    level and sample_rate default to the RECOMMEND_LOG_LEVEL and RECOMMEND_LOG_SAMPLE_RATE
+    environment variables. Only records on the access logger are sampled.
+    """
+    level = level or os.environ.get('RECOMMEND_LOG_LEVEL', 'INFO')
+    sample_rate = float(sample_rate if sample_rate is not None else os.environ.get('RECOMMEND_LOG_SAMPLE_RATE', 0.01))
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+    access_logger = logging.getLogger(ACCESS_LOGGER)
+    access_logger.filters = [SamplingFilter(sample_rate)]
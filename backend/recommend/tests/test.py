@@ -4,12 +4,29 @@ import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.metrics.pairwise import cosine_similarity
 import pickle
+import json
+import logging
 import sys
 import os
+import tempfile
+import time
+from unittest import mock
 
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from model import FlightRecommendationModel
+from model import (
+    FlightRecommendationModel, ARTIFACT_VERSION, MODEL_DIRNAME, save_artifacts, load_model,
+    fit_model, train_model, load_booking_data, prepare_booking_data, derive_user_ids, DATA_PATH,
+    RECOMMENDATION_SOURCES, register_source, UserIndex, top_neighbors, PREFERENCE_FLAGS
+)
+from concurrent.futures import ThreadPoolExecutor
+from cache import LRUCache
+from artifacts import ArtifactStore
+from recommendation_api import RecommendationAPI
+from structured_logging import JsonFormatter, SamplingFilter
+from evaluate import evaluate, precision_at_k, recall_at_k, ndcg_at_k
+from describe import describe
+import recommendation_service
 
 class TestFlightRecommendationModel(unittest.TestCase):
 
@@ -20,7 +37,13 @@ class TestFlightRecommendationModel(unittest.TestCase):
             'destination': ['A', 'B', 'C', 'A', 'B', 'A', 'C', 'D'],
             'rating': [5, 4, 3, 5, 4, 3, 2, 1],
             'season': ['Summer', 'Summer', 'Summer', 'Summer', 'Summer', 'Summer', 'Summer', 'Summer'],
-            'trip_purpose': ['Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation']
+            'trip_purpose': ['Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation', 'Regular Vacation'],
+            'origin': ['X', 'X', 'Y', 'X', 'Y', 'Y', 'X', 'Y'],
+            'wants_extra_baggage': [0, 1, 0, 0, 1, 0, 0, 1],
+            'wants_preferred_seat': [0, 0, 0, 1, 0, 0, 0, 0],
+            'wants_in_flight_meals': [0, 0, 1, 0, 0, 0, 0, 0],
+            'num_passengers': [1, 2, 1, 1, 3, 2, 1, 1],
+            'length_of_stay': [7, 5, 10, 7, 2, 6, 8, 30]
         })
 
         # Calculate destination popularity metrics
@@ -55,17 +78,58 @@ class TestFlightRecommendationModel(unittest.TestCase):
             'destination': {dest: i for i, dest in enumerate(destination_popularity['destination'])}
         }
 
-        self.model = FlightRecommendationModel(user_item_matrix, destination_popularity, destination_mapping)
+        self.data = data
+        self.user_item_matrix = user_item_matrix
+        self.destination_popularity = destination_popularity
+        self.destination_mapping = destination_mapping
+        self.model = FlightRecommendationModel(user_item_matrix, destination_popularity, destination_mapping, data)
+
+    def _groupby_ranking(self, bookings):
+        """Reference ranking computed the way the model used to on every request"""
+        popularity = bookings.groupby('destination').agg(
+            booking_count=('user_id', 'count'),
+            avg_rating=('rating', 'mean')
+        ).reset_index()
+        popularity['score'] = popularity['booking_count'] * 0.6 + popularity['avg_rating'] * 0.4
+        return popularity.sort_values('score', ascending=False)['destination'].tolist()
 
     def test_calculate_user_similarity(self):
         self.model.calculate_user_similarity()
         self.assertIsNotNone(self.model.user_similarity)
 
+    def test_user_neighbors_match_dense_similarity(self):
+        sparse_model = FlightRecommendationModel(
+            self.user_item_matrix, self.destination_popularity, self.destination_mapping, self.data,
+            similarity_neighbors=1
+        )
+        self.assertIsNone(sparse_model.user_similarity)
+
+        for user_id in self.user_item_matrix.index:
+            neighbors = sparse_model.user_neighbors.neighbors(user_id)
+            dense_row = self.model.user_similarity[user_id].drop(user_id)
+            self.assertEqual(len(neighbors), 1)
+            self.assertEqual(neighbors[0][0], dense_row.idxmax())
+            self.assertAlmostEqual(neighbors[0][1], dense_row.max())
+
+    def test_collaborative_filtering_with_user_neighbors(self):
+        sparse_model = FlightRecommendationModel(
+            self.user_item_matrix, self.destination_popularity, self.destination_mapping, self.data,
+            similarity_neighbors=10
+        )
+        for user_id in self.user_item_matrix.index:
+            self.assertEqual(
+                sparse_model.collaborative_filtering_recommendations(user_id),
+                self.model.collaborative_filtering_recommendations(user_id)
+            )
+
     def test_collaborative_filtering_recommendations(self):
         recommendations = self.model.collaborative_filtering_recommendations(1)
         self.assertIsInstance(recommendations, list)
         self.assertGreater(len(recommendations), 0)
 
+        # User 3 hasn't rated B, which both similar users rated above 3
+        self.assertEqual(self.model.collaborative_filtering_recommendations(3), ['B'])
+
     def test_popularity_based_recommendations(self):
         recommendations = self.model.popularity_based_recommendations()
         self.assertIsInstance(recommendations, list)
@@ -81,6 +145,51 @@ class TestFlightRecommendationModel(unittest.TestCase):
         self.assertIsInstance(recommendations, list)
         self.assertGreater(len(recommendations), 0)
 
+    def test_context_rankings_match_groupby(self):
+        for season in self.data['season'].unique():
+            self.assertEqual(
+                self.model.seasonal_recommendations(season),
+                self._groupby_ranking(self.data[self.data['season'] == season])
+            )
+        for trip_type in self.data['trip_purpose'].unique():
+            self.assertEqual(
+                self.model.trip_type_recommendations(trip_type),
+                self._groupby_ranking(self.data[self.data['trip_purpose'] == trip_type])
+            )
+        for origin in self.data['origin'].unique():
+            self.assertEqual(
+                self.model.origin_recommendations(origin),
+                self._groupby_ranking(self.data[self.data['origin'] == origin])
+            )
+        self.assertEqual(self.model.seasonal_recommendations('Monsoon'), [])
+
+    def test_preference_index_matches_filter(self):
+        data = self.data
+        preferences = [
+            {},
+            {'wants_extra_baggage': 1},
+            {'wants_extra_baggage': 0, 'wants_preferred_seat': 0, 'wants_in_flight_meals': 0, 'num_passengers': 1, 'length_of_stay': 7},
+            {'num_passengers': 2, 'length_of_stay': 4},
+            {'num_passengers': 1.5},
+            {'length_of_stay': 40},
+        ]
+        expected = []
+        for user_preferences in preferences:
+            preference_filter = (
+                (data['wants_extra_baggage'] == user_preferences.get('wants_extra_baggage', 0)) &
+                (data['wants_preferred_seat'] == user_preferences.get('wants_preferred_seat', 0)) &
+                (data['wants_in_flight_meals'] == user_preferences.get('wants_in_flight_meals', 0))
+            )
+            if 'num_passengers' in user_preferences:
+                preference_filter &= data['num_passengers'].between(user_preferences['num_passengers'] - 1, user_preferences['num_passengers'] + 1)
+            if 'length_of_stay' in user_preferences:
+                preference_filter &= data['length_of_stay'].between(user_preferences['length_of_stay'] - 3, user_preferences['length_of_stay'] + 3)
+
+            expected.append(self._groupby_ranking(data[preference_filter]))
+            self.assertEqual(self.model.preference_index.recommendations(user_preferences), expected[-1])
+
+        self.assertEqual(self.model.preference_index.batch_recommendations(preferences), expected)
+
     def test_hybrid_recommendations(self):
         recommendations = self.model.hybrid_recommendations(1, 'Summer', 'Regular Vacation')
         self.assertIsInstance(recommendations, list)
@@ -88,14 +197,138 @@ class TestFlightRecommendationModel(unittest.TestCase):
 
     def test_get_recommendations_for_user(self):
         recommendations = self.model.get_recommendations_for_user(1)
-        self.assertIsInstance(recommendations, pd.DataFrame)
+        self.assertIsInstance(recommendations, list)
         self.assertGreater(len(recommendations), 0)
+        self.assertEqual(
+            set(recommendations[0]),
+            {'destination', 'popularity_score', 'booking_count', 'avg_rating'}
+        )
+
+    def test_user_contexts(self):
+        self.assertEqual(self.model.user_contexts[1], ('Summer', 'Regular Vacation'))
+        self.assertNotIn(42, self.model.user_contexts)
+
+    def test_get_recommendations_for_user_is_cached(self):
+        first = self.model.get_recommendations_for_user(1)
+        second = self.model.get_recommendations_for_user(1)
+        self.model.get_recommendations_for_user(1, season='Winter')
+
+        self.assertEqual(first, second)
+        stats = self.model.recommendation_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 2, 2))
 
     def test_get_recommendations_for_new_user(self):
         recommendations = self.model.get_recommendations_for_new_user()
-        self.assertIsInstance(recommendations, pd.DataFrame)
+        self.assertIsInstance(recommendations, list)
         self.assertGreater(len(recommendations), 0)
 
+        top = recommendations[0]
+        details = self.destination_popularity.set_index('destination').loc[top['destination']]
+        self.assertEqual(top['booking_count'], details['booking_count'])
+        self.assertAlmostEqual(top['popularity_score'], details['popularity_score'])
+        self.assertIn('score', top)
+
+    def test_get_recommendations_for_users_matches_single_user(self):
+        user_ids = [1, 2, 3, 42]
+        batch = list(self.model.get_recommendations_for_users(user_ids, top_k=3, batch_size=2))
+
+        self.assertEqual([user_id for user_id, _ in batch], user_ids)
+        for user_id, recommendations in batch:
+            self.assertEqual(recommendations, self.model.get_recommendations_for_user(user_id, top_k=3))
+
+    def test_batch_collaborative_filtering_matches_single_user(self):
+        user_ids = [3, 1, 42, 2]
+        self.assertEqual(
+            self.model.batch_collaborative_filtering_recommendations(user_ids),
+            [self.model.collaborative_filtering_recommendations(user_id) for user_id in user_ids]
+        )
+
+    def test_get_recommendations_for_new_users(self):
+        profiles = [
+            {'season': 'Summer', 'origin': 'X'},
+            {'user_preferences': {'wants_extra_baggage': 1}, 'trip_type': 'Business'},
+            {'season': 'Summer', 'origin': 'X'},
+            {'user_preferences': {'num_passengers': 2, 'length_of_stay': 5}, 'weights': {'origin': 0.5}},
+            {'user_preferences': {'num_passengers': 1}, 'weights': {'preferences': 0}},
+            {'user_preferences': {}, 'season': 'Winter'},
+            {'season': 'Summer', 'origin': 'X'},
+        ]
+        # Batches of two, so that duplicates and the similar-booking search span batches
+        batch = list(self.model.get_recommendations_for_new_users(profiles, top_k=3, batch_size=2))
+
+        self.assertEqual(len(batch), len(profiles))
+        for profile, recommendations in zip(profiles, batch):
+            self.assertEqual(recommendations, self.model.get_recommendations_for_new_user(top_k=3, **profile))
+
+    def _rank_weighted(self, weighted_recs, n):
+        """Reference merge of ranked lists, summing (n - rank) * weight per destination as the model used to"""
+        all_recs = {}
+        for recs, weight in weighted_recs:
+            for i, dest in enumerate(recs):
+                all_recs[dest] = all_recs.get(dest, 0) + (n - i) * weight
+        return sorted(all_recs.items(), key=lambda x: x[1], reverse=True)
+
+    def test_blended_sources_match_rank_weight_loops(self):
+        for user_id in self.user_item_matrix.index:
+            expected = self._rank_weighted([
+                (self.model.collaborative_filtering_recommendations(user_id, 4), 0.4),
+                (self.model.popularity_based_recommendations(4), 0.2),
+                (self.model.seasonal_recommendations('Summer', 4), 0.2),
+                (self.model.trip_type_recommendations('Regular Vacation', 4), 0.2)
+            ], 4)[:2]
+            self.assertEqual(
+                self.model.hybrid_recommendations(user_id, 'Summer', 'Regular Vacation', 2),
+                [dest for dest, _ in expected]
+            )
+
+        preferences = {'wants_extra_baggage': 1}
+        expected = self._rank_weighted([
+            (self.model.popularity_based_recommendations(6), 0.2),
+            (self.model.seasonal_recommendations('Summer', 6), 0.2),
+            (self.model.trip_type_recommendations('Regular Vacation', 6), 0.2),
+            (self.model.origin_recommendations('X', 6), 0.2),
+            (self.model.preference_index.recommendations(preferences, 6), 0.2)
+        ], 6)[:3]
+        recommendations = self.model.get_recommendations_for_new_user(preferences, origin='X', top_k=3)
+        self.assertEqual([(rec['destination'], rec['score']) for rec in recommendations], expected)
+
+    def test_source_weights_per_request(self):
+        popularity_only = {'collaborative': 0, 'seasonal': 0, 'trip_type': 0, 'popularity': 1}
+        self.assertEqual(
+            self.model.hybrid_recommendations(1, 'Summer', 'Regular Vacation', 3, weights=popularity_only),
+            self.model.popularity_based_recommendations(3)
+        )
+        # Weights are part of the recommendation cache key
+        self.assertEqual(len(self.model.get_recommendations_for_user(3, top_k=3)), 3)
+        collaborative_only = {'collaborative': 1, 'popularity': 0, 'seasonal': 0, 'trip_type': 0}
+        recommendations = self.model.get_recommendations_for_user(3, top_k=3, weights=collaborative_only)
+        self.assertEqual([rec['destination'] for rec in recommendations], ['B'])
+        with self.assertRaises(ValueError):
+            self.model.get_recommendations_for_new_user(weights={'unknown': 1})
+
+        register_source('reverse_alphabetical', lambda model, request, n: np.array([
+            ord(model.destination_mapping['id'][i]) for i in range(len(model.destination_mapping['id']))
+        ], dtype=float))
+        try:
+            recommendations = self.model.get_recommendations_for_new_user(weights={
+                'popularity': 0, 'seasonal': 0, 'trip_type': 0, 'origin': 0, 'preferences': 0, 'reverse_alphabetical': 1
+            })
+            self.assertEqual([rec['destination'] for rec in recommendations], ['D', 'C', 'B', 'A'])
+        finally:
+            del RECOMMENDATION_SOURCES['reverse_alphabetical']
+
+    def test_concurrent_sources_match_sequential(self):
+        with ThreadPoolExecutor(2) as executor:
+            for user_id in self.user_item_matrix.index:
+                self.assertEqual(
+                    self.model.hybrid_recommendations(user_id, 'Summer', 'Regular Vacation', executor=executor),
+                    self.model.hybrid_recommendations(user_id, 'Summer', 'Regular Vacation')
+                )
+            self.assertEqual(
+                self.model.get_recommendations_for_new_user({'wants_extra_baggage': 1}, origin='Y', executor=executor),
+                self.model.get_recommendations_for_new_user({'wants_extra_baggage': 1}, origin='Y')
+            )
+
     def test_save_and_load_model(self):
         model_path = "test_recommendation_customer_booking.pkl"
         with open(model_path, 'wb') as f:
@@ -106,5 +339,590 @@ class TestFlightRecommendationModel(unittest.TestCase):
 
         self.assertIsInstance(loaded_model, FlightRecommendationModel)
 
+    def test_save_artifacts_and_load_model(self):
+        self.model.version = 'test'
+        with tempfile.TemporaryDirectory() as output_dir:
+            save_artifacts(self.model, output_dir)
+            loaded_model = load_model(os.path.join(output_dir, MODEL_DIRNAME))
+
+            self.assertEqual(loaded_model.version, 'test')
+            self.assertEqual(loaded_model.artifact_version, ARTIFACT_VERSION)
+            self.assertEqual(loaded_model.popularity_based_recommendations(), self.model.popularity_based_recommendations())
+            for user_id in [1, 2, 3, 42]:
+                self.assertEqual(loaded_model.get_recommendations_for_user(user_id), self.model.get_recommendations_for_user(user_id))
+            self.assertEqual(
+                loaded_model.get_recommendations_for_new_user({'wants_extra_baggage': 1}, origin='X'),
+                self.model.get_recommendations_for_new_user({'wants_extra_baggage': 1}, origin='X')
+            )
+            self.assertEqual(loaded_model.user_contexts, self.model.user_contexts)
+
+            # Large arrays are memory-mapped read-only rather than copied
+            self.assertFalse(loaded_model.user_item_matrix.to_numpy().flags.writeable)
+            self.assertFalse(loaded_model.user_similarity.to_numpy().flags.writeable)
+
+    def test_save_artifacts_with_user_neighbors(self):
+        sparse_model = FlightRecommendationModel(
+            self.user_item_matrix, self.destination_popularity, self.destination_mapping, self.data,
+            similarity_neighbors=1
+        )
+        with tempfile.TemporaryDirectory() as output_dir:
+            save_artifacts(sparse_model, output_dir)
+            loaded_model = load_model(os.path.join(output_dir, MODEL_DIRNAME))
+
+            self.assertIsNone(loaded_model.user_similarity)
+            for user_id in self.user_item_matrix.index:
+                self.assertEqual(loaded_model.user_neighbors.neighbors(user_id), sparse_model.user_neighbors.neighbors(user_id))
+
+    def test_user_neighbors_from_approximate_index(self):
+        # Probing every list of the index is an exact search
+        ann_model = FlightRecommendationModel(
+            self.user_item_matrix, self.destination_popularity, self.destination_mapping, self.data,
+            similarity_neighbors=1, similarity_lists=2
+        )
+        exact_model = FlightRecommendationModel(
+            self.user_item_matrix, self.destination_popularity, self.destination_mapping, self.data,
+            similarity_neighbors=1
+        )
+        for user_id in self.user_item_matrix.index:
+            self.assertEqual(ann_model.user_neighbors.neighbors(user_id), exact_model.user_neighbors.neighbors(user_id))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            save_artifacts(ann_model, output_dir)
+            self.assertEqual(load_model(os.path.join(output_dir, MODEL_DIRNAME)).similarity_lists, 2)
+
+    def test_factor_model(self):
+        factor_model = FlightRecommendationModel(
+            self.user_item_matrix, self.destination_popularity, self.destination_mapping, self.data,
+            n_factors=2
+        )
+        self.assertIsNone(factor_model.user_similarity)
+        self.assertEqual(factor_model.latent_factors.user_factors.shape, (3, 2))
+        self.assertEqual(factor_model.latent_factors.destination_factors.shape, (4, 2))
+
+        # As many factors as destinations reproduce the ratings exactly
+        full_model = FlightRecommendationModel(
+            self.user_item_matrix, self.destination_popularity, self.destination_mapping, self.data,
+            n_factors=10
+        )
+        np.testing.assert_allclose(full_model.latent_factors.scores(np.arange(3)), self.user_item_matrix.to_numpy(), atol=1e-9)
+
+        user_ids = [3, 1, 42, 2]
+        recommendations = [factor_model.collaborative_filtering_recommendations(user_id) for user_id in user_ids]
+        self.assertEqual(factor_model.batch_collaborative_filtering_recommendations(user_ids), recommendations)
+        for user_id, user_recommendations in zip(user_ids[:2], recommendations):
+            rated = set(self.user_item_matrix.columns[self.user_item_matrix.loc[user_id] > 0])
+            self.assertFalse(rated & set(user_recommendations))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            save_artifacts(factor_model, output_dir)
+            loaded_model = load_model(os.path.join(output_dir, MODEL_DIRNAME))
+
+            self.assertIsNone(loaded_model.user_similarity)
+            self.assertIsNone(loaded_model.user_neighbors)
+            for user_id in self.user_item_matrix.index:
+                self.assertEqual(loaded_model.get_recommendations_for_user(user_id), factor_model.get_recommendations_for_user(user_id))
+
+    def test_describe_artifact(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            save_artifacts(self.model, output_dir)
+            report = describe(os.path.join(output_dir, MODEL_DIRNAME), user_counts=[3, 6])
+
+            components = {row['component']: row for row in report['components']}
+            similarity = components['user_similarity']
+            self.assertEqual((similarity['dtype'], similarity['shape'], similarity['growth']), ('float64', [3, 3], 'O(users^2)'))
+            # The values and the user id index are memory-mapped from the artifact
+            self.assertEqual(similarity['mapped_bytes'], 3 * 3 * 8 + 3 * 8)
+            self.assertEqual(components['user_item_matrix']['growth'], 'O(users)')
+            self.assertEqual(components['preference_index']['growth'], 'O(1)')
+
+            store = ArtifactStore(os.path.join(output_dir, MODEL_DIRNAME))
+            version_dir = os.path.join(store.root, store.current_version())
+            self.assertEqual(report['disk_bytes'], sum(os.path.getsize(os.path.join(version_dir, name)) for name in os.listdir(version_dir)))
+            self.assertEqual(report['projections'][0]['memory_bytes'], report['memory_bytes'])
+            # Doubling the users quadruples the similarities, on top of the linear components
+            growth = report['projections'][1]['memory_bytes'] - report['projections'][0]['memory_bytes']
+            self.assertGreater(growth, 3 * similarity['memory_bytes'])
+            json.dumps(report)
+
+    def test_load_model_rejects_pickle(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            pickle_path = os.path.join(output_dir, 'model.pkl')
+            with open(pickle_path, 'wb') as f:
+                pickle.dump(self.model, f)
+
+            with self.assertRaises(ValueError):
+                load_model(pickle_path)
+
+    def test_reload_swaps_in_new_artifact_version(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            self.model.version = 'v1'
+            save_artifacts(self.model, output_dir)
+            api = RecommendationAPI(os.path.join(output_dir, MODEL_DIRNAME))
+            loaded_versions = []
+            api.add_load_listener(lambda model: loaded_versions.append(model.version))
+            old_model = api.model
+
+            # Nothing new has been published
+            self.assertFalse(api.reload())
+            self.assertIs(api.model, old_model)
+
+            self.model.version = 'v2'
+            save_artifacts(self.model, output_dir)
+            self.assertTrue(api.reload())
+
+            self.assertEqual(api.model.version, 'v2')
+            self.assertEqual(loaded_versions, ['v2'])
+            self.assertEqual(api.get_recommendations_for_existing_user(3), self.model.get_recommendations_for_user(3))
+
+    def test_failed_reload_keeps_current_model(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            save_artifacts(self.model, output_dir)
+            store = ArtifactStore(os.path.join(output_dir, MODEL_DIRNAME))
+            api = RecommendationAPI(store.root)
+            old_model = api.model
+
+            # Publish a version whose manifest cannot be read
+            os.makedirs(os.path.join(store.root, 'broken'))
+            with open(os.path.join(store.root, 'CURRENT'), 'w') as f:
+                f.write('broken')
+
+            self.assertFalse(api.reload())
+            self.assertIs(api.model, old_model)
+
+    def test_load_model_rejects_stale_artifact(self):
+        self.model.artifact_version = ARTIFACT_VERSION - 1
+        with tempfile.TemporaryDirectory() as output_dir:
+            model_path = save_artifacts(self.model, output_dir)
+            with self.assertRaises(ValueError):
+                load_model(model_path)
+
+    def test_load_model_rejects_other_user_id_scheme(self):
+        # Artifacts saved before the scheme was recorded
+        self.model.user_id_scheme = None
+        with tempfile.TemporaryDirectory() as output_dir:
+            model_path = save_artifacts(self.model, output_dir)
+            with self.assertRaises(ValueError):
+                load_model(model_path)
+
+class TestDeriveUserIds(unittest.TestCase):
+
+    def test_user_ids_are_stable(self):
+        bookings = pd.DataFrame({
+            'booking_origin': ['New Zealand', 'Australia', 'New Zealand'],
+            'trip_type': ['RoundTrip', 'OneWay', 'RoundTrip'],
+            'flight_day': ['Sat', 'Mon', 'Sat']
+        })
+        user_ids = derive_user_ids(bookings)
+
+        # Pinned so that ids never silently change between releases, processes or machines
+        self.assertEqual(user_ids[0], 9337)
+        self.assertEqual(user_ids[0], user_ids[2])
+        self.assertNotEqual(user_ids[0], user_ids[1])
+
+    def test_user_ids_do_not_depend_on_dtypes_or_chunks(self):
+        bookings = load_booking_data().head(2000)
+        user_ids = derive_user_ids(bookings)
+
+        np.testing.assert_array_equal(derive_user_ids(bookings.astype(str)), user_ids)
+        np.testing.assert_array_equal(
+            np.concatenate([derive_user_ids(bookings.iloc[:700]), derive_user_ids(bookings.iloc[700:])]),
+            user_ids
+        )
+
+class TestUserIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Sparse ratings around a few taste profiles, like users sharing destinations
+        profiles = rng.random((8, 40)) * (rng.random((8, 40)) < 0.2)
+        self.ratings = profiles[rng.integers(8, size=2000)] + rng.random((2000, 40)) * (rng.random((2000, 40)) < 0.05)
+        self.queries = np.arange(0, 2000, 7)
+
+        normalized = self.ratings / np.linalg.norm(self.ratings, axis=1, keepdims=True)
+        similarities = normalized[self.queries] @ normalized.T
+        similarities[np.arange(len(self.queries)), self.queries] = -np.inf
+        self.exact_positions, self.exact_similarities = top_neighbors(similarities, 10)
+
+    def test_probing_every_list_is_exact(self):
+        index = UserIndex(self.ratings, 16, n_probe=16)
+        positions, similarities = index.search(self.ratings[self.queries], 10, exclude=self.queries)
+
+        np.testing.assert_allclose(similarities, self.exact_similarities)
+        self.assertFalse((positions == self.queries[:, None]).any())
+
+    def test_recall_grows_with_probed_lists(self):
+        index = UserIndex(self.ratings, 16)
+        recalls = []
+        for n_probe in (1, 4, 16):
+            _, similarities = index.search(self.ratings[self.queries], 10, n_probe=n_probe, exclude=self.queries)
+            recalls.append(np.mean(similarities >= self.exact_similarities[:, -1:] - 1e-9))
+
+        self.assertEqual(recalls, sorted(recalls))
+        self.assertGreater(recalls[1], 0.9)
+        self.assertAlmostEqual(recalls[2], 1.0)
+
+class TestIncrementalUpdates(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Every 50th booking, so the later ones bring new users and destinations
+        cls.data = prepare_booking_data(load_booking_data()).iloc[::50]
+        cls.base, cls.batch = cls.data.iloc[:600], cls.data.iloc[600:]
+
+    def assert_matches_full_retrain(self, updated, retrained):
+        pd.testing.assert_frame_equal(updated.destination_popularity, retrained.destination_popularity)
+        pd.testing.assert_frame_equal(updated.user_item_matrix, retrained.user_item_matrix, check_exact=False)
+        self.assertEqual(updated.destination_mapping, retrained.destination_mapping)
+        self.assertEqual(updated.context_rankings, retrained.context_rankings)
+        self.assertEqual(updated.user_contexts, retrained.user_contexts)
+        for preferences in [{}, {'wants_extra_baggage': 1, 'num_passengers': 2}, {'length_of_stay': 20}]:
+            self.assertEqual(
+                updated.preference_index.recommendations(preferences),
+                retrained.preference_index.recommendations(preferences)
+            )
+
+    def test_partial_fit_matches_full_retrain(self):
+        updated = fit_model(self.base).partial_fit(self.batch)
+        retrained = fit_model(self.data)
+
+        self.assert_matches_full_retrain(updated, retrained)
+        # Including users outside the batch whose ratings the popularity shift changed
+        np.testing.assert_allclose(updated.user_similarity.to_numpy(), retrained.user_similarity.to_numpy(), atol=1e-12)
+
+    def test_partial_fit_updates_user_neighbors(self):
+        updated = fit_model(self.base, similarity_neighbors=5).partial_fit(self.batch)
+        retrained = fit_model(self.data, similarity_neighbors=5)
+
+        for user_id in self.batch['user_id'].unique():
+            self.assertEqual(
+                [neighbor for neighbor, _ in updated.user_neighbors.neighbors(user_id)],
+                [neighbor for neighbor, _ in retrained.user_neighbors.neighbors(user_id)]
+            )
+
+    def test_partial_fit_projects_users_onto_factors(self):
+        model = fit_model(self.base, n_factors=8)
+        destinations, destination_factors = model.user_item_matrix.columns, model.latent_factors.destination_factors
+        model.partial_fit(self.batch)
+
+        self.assert_matches_full_retrain(model, fit_model(self.data))
+        self.assertEqual(model.latent_factors.destination_factors.shape, (len(model.destinations), 8))
+        trained = model.user_item_matrix.columns.get_indexer(destinations)
+        np.testing.assert_array_equal(model.latent_factors.destination_factors[trained], destination_factors)
+        np.testing.assert_allclose(
+            model.latent_factors.user_factors,
+            model.user_item_matrix.to_numpy() @ model.latent_factors.destination_factors
+        )
+
+    def test_partial_fit_on_loaded_artifact(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            save_artifacts(fit_model(self.base), output_dir)
+            loaded_model = load_model(os.path.join(output_dir, MODEL_DIRNAME))
+            loaded_model.partial_fit(self.batch)
+
+            self.assert_matches_full_retrain(loaded_model, fit_model(self.data))
+
+            # The published artifact is left untouched
+            republished = load_model(os.path.join(output_dir, MODEL_DIRNAME))
+            self.assertEqual(len(republished.user_item_matrix), self.base['user_id'].nunique())
+
+    def test_train_model_in_chunks_matches_fit_model(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            data_path = os.path.join(data_dir, 'bookings.csv')
+            pd.read_csv(DATA_PATH, encoding='latin1', nrows=1000).to_csv(data_path, index=False)
+
+            streamed = train_model(data_path, chunksize=150)
+            fitted = fit_model(prepare_booking_data(load_booking_data(data_path)))
+
+        self.assert_matches_full_retrain(streamed, fitted)
+        for user_id in fitted.user_item_matrix.index:
+            self.assertEqual(streamed.get_recommendations_for_user(user_id), fitted.get_recommendations_for_user(user_id))
+
+    def test_partial_fit_requires_booking_statistics(self):
+        data = prepare_booking_data(load_booking_data()).iloc[:100]
+        model = fit_model(data)
+        model.booking_statistics = None
+
+        with self.assertRaises(ValueError):
+            model.partial_fit(data)
+
+class TestEvaluation(unittest.TestCase):
+
+    def test_ranking_metrics(self):
+        recommendations = ['A', 'B', 'C', 'D']
+        relevant = {'B', 'E'}
+
+        self.assertAlmostEqual(precision_at_k(recommendations, relevant, 4), 0.25)
+        self.assertAlmostEqual(recall_at_k(recommendations, relevant, 4), 0.5)
+        self.assertAlmostEqual(ndcg_at_k(recommendations, relevant, 4), (1 / np.log2(3)) / (1 + 1 / np.log2(3)))
+        self.assertEqual(ndcg_at_k(['B', 'E'], relevant, 2), 1.0)
+        self.assertEqual(recall_at_k(recommendations, set(), 4), 0.0)
+
+    def test_evaluate_reports_every_strategy(self):
+        data = prepare_booking_data(load_booking_data()).iloc[::25]
+        report = evaluate(data, k=5, max_new_user_bookings=50)
+
+        self.assertEqual(
+            set(report['strategies']),
+            {'collaborative', 'popularity', 'seasonal', 'trip_type', 'hybrid', 'new_user', 'factors', 'factors_hybrid'}
+        )
+        for metrics in report['strategies'].values():
+            self.assertGreater(metrics['requests'], 0)
+            for metric in ['precision@5', 'recall@5', 'ndcg@5', 'coverage']:
+                self.assertGreaterEqual(metrics[metric], 0.0)
+                self.assertLessEqual(metrics[metric], 1.0)
+        self.assertGreater(report['model']['training_time_s'], 0)
+        self.assertGreater(report['model']['peak_memory_mb'], 0)
+        self.assertLess(report['factor_model']['collaborative_mb'], report['model']['collaborative_mb'])
+        json.dumps(report)
+
+class TestArtifactStore(unittest.TestCase):
+
+    def test_write_publishes_current_and_prunes_old_versions(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = ArtifactStore(root)
+            self.assertIsNone(store.current_version())
+
+            for version in ['v1', 'v2', 'v3']:
+                store.write(version, {'values': np.arange(3)}, {'name': version}, keep=2)
+
+            self.assertEqual(store.current_version(), 'v3')
+            self.assertEqual(store.versions(), ['v2', 'v3'])
+
+            manifest, arrays = store.read()
+            self.assertEqual(manifest['metadata'], {'name': 'v3'})
+            self.assertEqual(arrays['values'].tolist(), [0, 1, 2])
+
+    def test_write_does_not_overwrite_existing_version(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = ArtifactStore(root)
+            store.write('v1', {'values': np.zeros(2)}, {})
+            store.write('v1', {'values': np.ones(2)}, {})
+
+            self.assertEqual(store.current_version(), 'v1-1')
+            self.assertEqual(store.read('v1')[1]['values'].tolist(), [0.0, 0.0])
+
+class TestStructuredLogging(unittest.TestCase):
+
+    def test_json_formatter_includes_extra_fields(self):
+        record = logging.makeLogRecord({'name': 'recommend.access', 'levelno': logging.INFO, 'levelname': 'INFO', 'msg': 'request', 'status': 200})
+        entry = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(entry['message'], 'request')
+        self.assertEqual(entry['logger'], 'recommend.access')
+        self.assertEqual(entry['status'], 200)
+
+    def test_sampling_filter_always_keeps_warnings(self):
+        sampling_filter = SamplingFilter(0.0)
+
+        self.assertFalse(sampling_filter.filter(logging.makeLogRecord({'levelno': logging.INFO})))
+        self.assertTrue(sampling_filter.filter(logging.makeLogRecord({'levelno': logging.ERROR})))
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['hits'], 3)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_expires_after_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=0.01)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_evicts_beyond_max_bytes(self):
+        cache = LRUCache(maxsize=10, max_bytes=10, sizeof=len)
+        cache.put('a', b'12345')
+        cache.put('b', b'12345')
+        cache.put('c', b'123')
+        cache.put('d', b'12345678901')  # larger than the whole cache, never stored
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), b'12345')
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(cache.stats()['bytes'], 8)
+
+    def test_pickles_empty(self):
+        cache = LRUCache(maxsize=5)
+        cache.put('a', 1)
+        restored = pickle.loads(pickle.dumps(cache))
+
+        self.assertEqual(len(restored), 0)
+        self.assertEqual(restored.maxsize, 5)
+
+class TestRecommendationService(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = fit_model(prepare_booking_data(load_booking_data()).iloc[::50])
+
+    def setUp(self):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        self.output_dir = output_dir.name
+        self.model.version = 'v1'
+        save_artifacts(self.model, self.output_dir)
+
+        # Serve the test model, wired like the service's own recommender
+        self.recommender = RecommendationAPI(os.path.join(self.output_dir, MODEL_DIRNAME))
+        self.recommender.add_load_listener(lambda model: recommendation_service.response_cache.clear())
+        patcher = mock.patch.object(recommendation_service, 'recommender', self.recommender)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        recommendation_service.response_cache.clear()
+        self.client = recommendation_service.app.test_client()
+
+    def batch(self, body):
+        response = self.client.post('/recommend/batch', json=body)
+        return response, [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def test_batch_rejects_user_ids_that_are_not_a_list(self):
+        for user_ids in ['1234', 1234, {'id': 1234}]:
+            response, _ = self.batch({'user_ids': user_ids})
+            self.assertEqual(response.status_code, 400)
+
+    def test_batch_rejects_body_that_is_not_an_object(self):
+        for body in [[1, 2], 'x']:
+            response, _ = self.batch(body)
+            self.assertEqual(response.status_code, 400)
+
+    def test_batch_rejects_top_k_that_is_not_a_positive_integer(self):
+        for top_k in ['abc', -5, 0, 2.5, True, None]:
+            response, _ = self.batch({'user_ids': [1], 'top_k': top_k})
+            self.assertEqual(response.status_code, 400)
+
+    def test_batch_null_user_ids_streams_every_user(self):
+        response, lines = self.batch({'user_ids': None, 'top_k': 3})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([line['user_id'] for line in lines], self.model.user_item_matrix.index.tolist())
+
+    def test_batch_profiles_are_normalized_like_new_user_requests(self):
+        profile = {'user_preferences': {'wants_extra_baggage': 1, 'num_passengers': 2}, 'trip_type': 'Business'}
+        body = {'profiles': [
+            profile,
+            {**profile, 'user_preferences': {'wants_extra_baggage': True, 'num_passengers': 2.0, 'ignored': 'x'}},
+            {**profile, 'season': 'Summer', 'origin': ''}
+        ], 'top_k': 5}
+
+        model = self.recommender.model
+        with mock.patch.object(model, 'get_recommendations_for_new_user', wraps=model.get_recommendations_for_new_user) as recommend:
+            response, lines = self.batch(body)
+
+        self.assertEqual(response.status_code, 200)
+        # Equivalent profiles normalize to one, which is computed once
+        recommend.assert_called_once_with(
+            top_k=5, user_preferences={**{flag: 0.0 for flag in PREFERENCE_FLAGS}, 'wants_extra_baggage': 1.0, 'num_passengers': 2.0},
+            season='Summer', trip_type='Business', origin=None, weights=None, preference_recs=mock.ANY
+        )
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0]['recommendations'], lines[2]['recommendations'])
+
+    def new_user(self, body):
+        response = self.client.post('/recommend/new_user', json=body)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_new_user_response_is_cached(self):
+        body = {'user_preferences': {'wants_extra_baggage': 1}, 'season': 'Winter', 'top_k': 5}
+        miss = self.new_user(body)
+        hit = self.new_user(body)
+
+        self.assertEqual(miss.headers['X-Cache'], 'MISS')
+        self.assertEqual(hit.headers['X-Cache'], 'HIT')
+        self.assertEqual(hit.get_json(), miss.get_json())
+
+    def test_cache_key_follows_normalized_parameters(self):
+        body = {'user_preferences': {'wants_extra_baggage': 1}, 'season': 'Winter', 'top_k': 5}
+        self.new_user(body)
+
+        # Equivalent requests share the entry
+        for equivalent in [
+            {**body, 'user_preferences': {'wants_extra_baggage': True, 'wants_preferred_seat': 0, 'ignored': 1}},
+            {**body, 'trip_type': 'Regular Vacation', 'origin': ''}
+        ]:
+            self.assertEqual(self.new_user(equivalent).headers['X-Cache'], 'HIT')
+
+        # Any parameter the recommendations depend on gets its own entry
+        for different in [
+            {**body, 'user_preferences': {'wants_extra_baggage': 0}},
+            {**body, 'season': 'Summer'},
+            {**body, 'trip_type': 'Business'},
+            {**body, 'origin': 'Australia'},
+            {**body, 'top_k': 3},
+            {**body, 'weights': {'popularity': 1.0}}
+        ]:
+            self.assertEqual(self.new_user(different).headers['X-Cache'], 'MISS')
+
+    def test_cache_stats(self):
+        body = {'user_preferences': {}, 'top_k': 5}
+        self.new_user(body)
+        self.new_user(body)
+        user_id = self.model.user_item_matrix.index[0]
+        self.recommender.model.recommendation_cache.clear()
+        self.recommender.get_recommendations_for_existing_user(user_id)
+        self.recommender.get_recommendations_for_existing_user(user_id)
+
+        stats = self.client.get('/recommend/cache/stats').get_json()
+
+        self.assertEqual(stats['model_version'], 'v1')
+        self.assertEqual(stats['new_user_responses']['size'], 1)
+        self.assertEqual((stats['new_user_responses']['hits'], stats['new_user_responses']['misses']), (1, 1))
+        self.assertGreater(stats['new_user_responses']['bytes'], 0)
+        self.assertEqual(stats['existing_user_recommendations']['hits'], 1)
+
+    def test_cache_key_includes_model_version(self):
+        body = {'user_preferences': {}, 'top_k': 5}
+        self.new_user(body)
+
+        # A new model version misses even when nothing cleared the cache, e.g. a request racing a reload
+        with mock.patch.object(self.recommender.model, 'version', 'v2'):
+            self.assertEqual(self.new_user(body).headers['X-Cache'], 'MISS')
+        self.assertEqual(self.new_user(body).headers['X-Cache'], 'HIT')
+
+    def reload(self, headers=None, token='secret'):
+        """POST /admin/reload with RECOMMEND_ADMIN_TOKEN set to token; an empty token disables the endpoint"""
+        with mock.patch.dict(os.environ, {'RECOMMEND_ADMIN_TOKEN': token}):
+            return self.client.post('/admin/reload', headers=headers or {}, json={})
+
+    def test_reload_requires_admin_token(self):
+        self.model.version = 'v2'
+        save_artifacts(self.model, self.output_dir)
+
+        self.assertEqual(self.reload(token='', headers={'X-Admin-Token': 'secret'}).status_code, 404)
+        self.assertEqual(self.reload().status_code, 403)
+        self.assertEqual(self.reload(headers={'X-Admin-Token': 'wrong'}).status_code, 403)
+        self.assertEqual(self.recommender.model.version, 'v1')
+
+        response = self.reload(headers={'X-Admin-Token': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'reloaded': True, 'previous_version': 'v1', 'model_version': 'v2'})
+        self.assertEqual(self.recommender.model.version, 'v2')
+
+    def test_reload_clears_cached_responses(self):
+        body = {'user_preferences': {}, 'top_k': 5}
+        self.new_user(body)
+        self.model.version = 'v2'
+        save_artifacts(self.model, self.output_dir)
+
+        self.assertTrue(self.reload(headers={'X-Admin-Token': 'secret'}).get_json()['reloaded'])
+        self.assertEqual(self.client.get('/recommend/cache/stats').get_json()['new_user_responses']['size'], 0)
+        self.assertEqual(self.new_user(body).headers['X-Cache'], 'MISS')
+
+    def test_batch_rejects_invalid_profile_weights(self):
+        response, _ = self.batch({'profiles': [{'weights': {'popularity': 'high'}}]})
+        self.assertEqual(response.status_code, 400)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file